@@ -1,4 +1,3 @@
-import inspect
 import os
 import sys
 
@@ -10,6 +9,7 @@ def _terminal_read_input(message: str):
 def _terminal_write_output(kind, *messages: object):
     # Get file/line where message was generated, when running ez-clang with --rpc-debug-python
     if Host.debugPython(__debug__):
+        import inspect
         frame = inspect.currentframe().f_back.f_back
         file = os.path.abspath(inspect.getsourcefile(frame))
         line = inspect.getlineno(frame)
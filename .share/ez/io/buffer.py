@@ -0,0 +1,78 @@
+import codecs
+import time
+
+from typing import Callable, List
+
+import ez.io
+
+# Collects device output and forwards it in batches. Bytes are decoded
+# incrementally, so that multi-byte characters may span messages. Complete
+# lines go out as soon as they arrive. Incomplete lines wait until the buffer
+# exceeds the size threshold, the oldest pending text exceeds the age threshold
+# or the owner flushes explicitly, e.g. when the device call returns.
+class OutputBuffer:
+    def __init__(self, encoding: str = 'utf-8', maxSize: int = 4096,
+                 maxDelay: float = 0.1, write: Callable[[str], None] = None):
+        self.decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        self.maxSize = maxSize
+        self.maxDelay = maxDelay
+        self.write = write or ez.io.output
+        self.pending: List[str] = []
+        self.pendingSize = 0
+        self.pendingSince = 0.0
+        self.flushes = 0
+
+    def feed(self, data: bytes):
+        text = self.decoder.decode(data)
+        if len(text) == 0:
+            return
+        if self.pendingSize == 0:
+            self.pendingSince = time.monotonic()
+        self.pending.append(text)
+        self.pendingSize += len(text)
+        if '\n' in text:
+            self.flushLines()
+        if self.pendingSize >= self.maxSize:
+            self.flush(final=False)
+        else:
+            self.expire()
+
+    # Seconds until pending text is due by age or None if there is none. Owners
+    # that wait for more output call expire() once it passed.
+    def due(self) -> float:
+        if self.pendingSize == 0:
+            return None
+        return max(0.0, self.pendingSince + self.maxDelay - time.monotonic())
+
+    def expire(self):
+        if self.due() == 0.0:
+            self.flush(final=False)
+
+    # Forward all complete lines and keep the rest
+    def flushLines(self):
+        text = "".join(self.pending)
+        end = text.rfind('\n')
+        self.emit(text[:end])
+        rest = text[end + 1:]
+        self.pending = [rest] if len(rest) > 0 else []
+        self.pendingSize = len(rest)
+        self.pendingSince = time.monotonic() # Age of the remainder
+
+    # Threshold flushes keep incomplete characters for the next feed
+    def flush(self, final: bool = True):
+        text = "".join(self.pending)
+        if final:
+            text += self.decoder.decode(b'', final=True)
+        self.pending = []
+        self.pendingSize = 0
+        if len(text) > 0:
+            self.emit(text)
+
+    def emit(self, text: str):
+        self.flushes += 1
+        self.write(text)
+
+    def reset(self):
+        self.decoder.reset()
+        self.pending = []
+        self.pendingSize = 0
@@ -1,33 +1,83 @@
 import inject
+import threading
+import time
 
 import ez.io
+import ez.io.buffer
 import ez.util
 import ez.repl
 import ez.repl.opcode
 import ez.repl.errorcode
 
 from abc import abstractmethod
-from codecs import ascii_decode
 from overrides import EnforceOverrides
-from typing import Any, List
+from contextlib import contextmanager
+from typing import Any, Iterator, List
+
+from .journal import Journal
+from .memory import MemoryCache
 
 _componentMap = {}
+_scope = threading.local()
 def register(map):
     global _componentMap
     _componentMap.update(map)
     def reassociate(binder):
          for entry in _componentMap:
-            binder.bind_to_constructor(entry, _componentMap[entry])
+            binder.bind_to_provider(entry, provider(entry, _componentMap[entry]))
     import inject
     inject.clear_and_configure(reassociate, bind_in_runtime=False)
 
+# inject hands out the components that scope() bound to the current thread.
+# Otherwise it's one instance per process, created on first use.
+def provider(component, constructor):
+    lock = threading.Lock()
+    instances = []
+    def instance():
+        bound = getattr(_scope, 'components', None)
+        if bound and component in bound:
+            return bound[component]
+        with lock:
+            if len(instances) == 0:
+                instances.append(constructor())
+        return instances[0]
+    return instance
+
+# Bind components to the current thread, e.g. to let recovery of a managed
+# session inject the transport of that session
+@contextmanager
+def scope(components: dict):
+    previous = getattr(_scope, 'components', None)
+    _scope.components = { **(previous or {}), **components }
+    try:
+        yield
+    finally:
+        _scope.components = previous
+
+# Fresh instance of a registered component, e.g. to talk to several ports at
+# once. inject.instance() always returns the same one.
+def create(component):
+    return _componentMap[component]()
+
+# Snapshot of the registered factories, e.g. to build component stacks for
+# several device types after loading their scripts one by one.
+def components() -> dict:
+    return dict(_componentMap)
+
 class HandshakeFailedException(Exception):
     pass
 
 class Transport(EnforceOverrides):
+    # Largest chunk of data that bulk transfers put in a single message. Small
+    # by default: devices have little buffer space for messages.
+    maxPayload = 256
     @abstractmethod
     def reset(self, info: Any):
         pass
+    # Wait until inbound data is available or the timeout expires. Transports
+    # that can't tell report data right away and reads will block.
+    def poll(self, timeout: float) -> bool:
+        return True
     @abstractmethod
     def handshake(self):
         pass
@@ -57,6 +107,24 @@ class Recovery(EnforceOverrides):
         import ez
         import os
         return "/" + os.path.join("usr", "lib", "ez-clang", ez.__version__, "firmware", deviceId, fileName)
+    # Reboot the device without user interaction. Returns False if there's no
+    # way to do that.
+    def softReset(self, info: Any) -> bool:
+        return False
+    # The device is in a session after the handshake: consume the Setup message
+    # and disconnect again, so it's back in its initial state.
+    def hangup(self, transport: Transport, endian: str):
+        self.hangupStream(transport.finalize(), endian)
+    def hangupStream(self, stream: Any, endian: str):
+        import ez.repl.endpoints
+        import ez.repl.opcode
+        import ez.repl.serialize
+        serializer = ez.repl.serialize.Stream32()
+        serializer.endian = endian
+        serializer.open(stream)
+        ez.repl.endpoints.SetupMessageDecoder(serializer.receive())
+        serializer.message(ez.repl.opcode.Disconnect).send()
+        ez.repl.endpoints.HangupMessageDecoder(serializer.receive())
     @abstractmethod
     def attemptAutoRecovery(self) -> bool:
         pass
@@ -87,6 +155,15 @@ class InboundMessage(EnforceOverrides):
     @abstractmethod
     def readBytesRemaining(self) -> bytes:
         pass
+    # Read raw bytes that span the given layout items. Without items, the bytes
+    # extend the last item, e.g. content after a size field.
+    @abstractmethod
+    def readRaw(self, size: int, items: List[int] = None) -> bytes:
+        pass
+    # Same as readRaw(), but fills the given buffer
+    @abstractmethod
+    def readinto(self, buffer, items: List[int] = None) -> int:
+        pass
     @abstractmethod
     def done(self) -> bool:
         pass
@@ -110,6 +187,10 @@ class OutboundMessage(EnforceOverrides):
     @abstractmethod
     def fixupUInt32(self, data: int, item: int):
         pass
+    # Write raw bytes that span the given layout items
+    @abstractmethod
+    def writeRaw(self, data: bytes, items: List[int]):
+        pass
     @abstractmethod
     def send(self):
         pass
@@ -127,9 +208,14 @@ class IOSerializer(EnforceOverrides):
     @abstractmethod
     def message(self, opcode: int) -> OutboundMessage:
         pass
+    # Streaming messages don't buffer their body, see readBytesIter()
     @abstractmethod
-    def receive(self) -> InboundMessage:
+    def receive(self, streaming: bool = False) -> InboundMessage:
         pass
+    # Whether inbound data is buffered on the host already, so that the
+    # transport has nothing to report
+    def buffered(self) -> bool:
+        return False
     @abstractmethod
     def close(self):
         pass
@@ -149,6 +235,9 @@ class DeviceErrorReportException(Exception):
 class DeviceProtocolException(Exception):
     pass
 
+class UnsupportedEndpointException(DeviceProtocolException):
+    pass
+
 class HostAPIException(Exception):
     pass
 
@@ -161,11 +250,27 @@ class OperationFailedException(Exception):
 class UnexpectedDisconnectException(Exception):
     pass
 
+class CallTimeoutException(Exception):
+    def __init__(self, symbol: str, timeout: float, timings: dict, recovered: bool):
+        self.timings = timings # Seconds spent on each escalation step
+        self.recovered = recovered
+        steps = ", ".join(f"{step} {duration:.2f}s" for step, duration in timings.items())
+        super().__init__(f"Call to {symbol} exceeded deadline of {timeout}s ({steps})" +
+                         ("" if recovered else ". Device is unresponsive."))
+
 class UnexpectedRebootException(Exception):
     def __init__(self, connectMessage: InboundMessage):
         super().__init__("Received unexpected connect request")
         self.connectMessage = connectMessage # We did read the header already, the message-body is remaining
 
+class SessionRestoreFailedException(Exception):
+    pass
+
+class CallAbortedByRebootException(Exception):
+    def __init__(self, symbol: str):
+        super().__init__(f"Device rebooted during call to {symbol}. " +
+                         "Session was restored, but the call didn't finish.")
+
 class EndpointResponseDecoder():
     def checkErrorCode(self, msg: InboundMessage):
         if msg.readErrorCode() != ez.repl.errorcode.Success:
@@ -186,11 +291,30 @@ class EndpointResponseDecoder():
         raise NotImplementedError("Implement in derived class for each endpoint")
 
 class Endpoint():
+    # Message body layouts from ez.repl.schema. They compile into codecs, so
+    # that simple endpoints only need to declare them.
+    request = None
+    response = None
     def __init__(self, symbol: str):
         self.symbol = symbol
         self.addr = 0
-    @abstractmethod
+        self.available = True # Until the device fails to resolve the symbol
+        self.idempotent = True # Safe to repeat after a reboot
     def encode(self, msg: OutboundMessage, input: dict) -> EndpointResponseDecoder:
+        self.request.encode(msg, input)
+        return ez.repl.endpoints.LayoutResponseDecoder(self.response)
+    # Whether the response should be read from the transport incrementally
+    # instead of being buffered as a whole
+    def streaming(self, input: dict) -> bool:
+        return False
+    # Keep the host-side memory cache coherent. invalidate() runs before the
+    # request is sent and update() after the device returned successfully.
+    def invalidate(self, memory: MemoryCache, input: dict):
+        pass
+    def update(self, memory: MemoryCache, input: dict, output: dict):
+        pass
+    # Record effects that a device reboot would undo
+    def record(self, journal: Journal, input: dict, output: dict):
         pass
     def assignDeviceAddress(self, addr: int):
         assert self.addr == 0, "Device address can be assigned only once"
@@ -219,16 +343,54 @@ class Endpoint():
 class Session:
     def __init__(self, deviceId: str = '<unknown device id>'):
         self.deviceId = deviceId
+        self.host = None # Formats expression results, device scripts set it
         self.disconnecting = False
+        self.transport = None
+        self.recovery = None
+        self.stream = None
+        self.memory = MemoryCache()
+        self.stdout = ez.io.buffer.OutputBuffer()
+        self.telemetry = ez.repl.telemetry.Telemetry()
+        # Default deadline for calls in seconds, None waits forever. Once it
+        # expires we ask the device to interrupt the call and wait a little
+        # longer before we escalate to a soft reset.
+        self.callTimeout = None
+        self.interruptTimeout = 1.0
+        self.lastEscalation = None
+        # Restore committed code and data if the device reboots unexpectedly
+        self.journal = Journal()
+        self.autoRestore = True
+        self.restoreBatchSize = 4096
+        self.restoring = False
+        self.setupInfo = None
         self.endpoints = {
             'lookup': ez.repl.endpoints.Lookup('__ez_clang_rpc_lookup'),
             'commit': ez.repl.endpoints.Commit('__ez_clang_rpc_commit'),
             'execute': ez.repl.endpoints.Execute('__ez_clang_rpc_execute'),
-            'memory.read.cstr': ez.repl.endpoints.MemReadCString('__ez_clang_rpc_mem_read_cstring')
+            'memory.read.cstr': ez.repl.endpoints.MemReadCString('__ez_clang_rpc_mem_read_cstring'),
+            'memory.read.cstr.chunk': ez.repl.endpoints.MemReadCStringChunk('__ez_clang_rpc_mem_read_cstring_chunk'),
+            'memory.read': ez.repl.endpoints.MemRead('__ez_clang_rpc_mem_read'),
         }
+        # Strings longer than that are cut off. A stray pointer shouldn't dump
+        # the entire device memory.
+        self.maxCStringLength = 64 * 1024
+        # Progressive output flushes partial lines beyond that length
+        self.maxLineLength = 4096
 
-    @inject.params(transport=Transport, recovery=Recovery)
-    def connect(self, info, transport: Transport, recovery: Recovery):
+    @inject.params(transport=Transport, recovery=Recovery, stream=IOSerializer)
+    def connect(self, info, transport: Transport, recovery: Recovery,
+                stream: IOSerializer):
+        # Bind components once per connection. RPCs access them directly and
+        # don't pay for injector lookups.
+        self.transport = transport
+        self.recovery = recovery
+        self.stream = stream
+        self.info = info
+        self.resetEndpoints()
+        self.memory.clear()
+        self.journal.clear()
+        self.stdout.reset()
+        self.telemetry.endian = stream.endian
         transport.reset(info)
         try:
             transport.handshake()
@@ -240,6 +402,36 @@ class Session:
                     # unreachable
         return transport.finalize()
 
+    # Counters for diagnostics, e.g. in long soak runs
+    def metrics(self) -> dict:
+        metrics = {
+            'memory.hits': self.memory.hits,
+            'memory.misses': self.memory.misses,
+            'stdout.flushes': self.stdout.flushes,
+            'telemetry.dropped': self.telemetry.dropped,
+            'telemetry.malformed': self.telemetry.malformed,
+        }
+        framed = self.stream and getattr(self.stream, 'framing', False)
+        if framed and self.stream.stream:
+            metrics['frames.received'] = self.stream.stream.frames
+            metrics['frames.corrupt'] = self.stream.stream.corruptFrames
+            metrics['frames.skippedBytes'] = self.stream.stream.skippedBytes
+        return metrics
+
+    # Decode the Setup message and relocate bootstrap endpoints
+    def setup(self, msg: InboundMessage) -> 'ez.repl.endpoints.SetupMessageDecoder':
+        setup = ez.repl.endpoints.SetupMessageDecoder(msg)
+        for symbol in setup.endpoints:
+            if not self.relocateEndpoint(symbol, setup.endpoints[symbol]):
+                ez.io.warning(f"No endpoint for bootstrap function {symbol} " +
+                              f"(0x{setup.endpoints[symbol]:08x})")
+
+        if self.endpoints['lookup'].addr == 0:
+            raise DeviceProtocolException("Missing bootstrap symbol " +
+                                          self.endpoints['lookup'].symbol)
+        self.setupInfo = setup
+        return setup
+
     def relocateEndpoint(self, symbol: str, address: int) -> bool:
         endpoint = [ep for ep in self.endpoints.values() if ep.symbol == symbol]
         if len(endpoint) == 0:
@@ -255,22 +447,50 @@ class Session:
         endpoint = self.endpoints[name]
         if endpoint.addr == 0:
             # Lookup actual device addresses lazily
-            addresses = self.call('lookup', { endpoint.symbol: 0 })
-            endpoint.addr = addresses[endpoint.symbol]
+            if endpoint.available:
+                addresses = self.call('lookup', { endpoint.symbol: 0 })
+                endpoint.addr = addresses[endpoint.symbol]
+                endpoint.available = endpoint.addr != 0
+            if not endpoint.available:
+                raise UnsupportedEndpointException(
+                    f"Device has no function for endpoint {name}: {endpoint.symbol}")
         return endpoint
 
-    @inject.params(stream=IOSerializer)
-    def call(self, endpoint: str, input: dict, stream: IOSerializer) -> dict:
+    def call(self, endpoint: str, input: dict, timeout: float = None) -> dict:
         # Encode and send request + store decode functor
+        stream = self.stream
         ep = self.resolveEndpoint(endpoint)
         request = stream.message(ez.repl.opcode.Call, ep.addr, ep.symbol)
         decode = ep.encode(request, input)
+        ep.invalidate(self.memory, input)
         request.send()
 
         # Await and decode response
         result = None
+        # Telemetry frames go straight from the transport into ring buffers
+        streaming = ep.streaming(input) or self.telemetry.active()
+        if timeout is None:
+            timeout = self.callTimeout
+        deadline = ez.util.Deadline(timeout) if timeout is not None else None
+        interrupted = None
         while True:
-            response = stream.receive()
+            # Output that stops mid-line goes out once it's due, even if the
+            # device doesn't send anything else for a while
+            due = self.stdout.due()
+            if due is not None and (not deadline or due < deadline.remaining()) and \
+               not stream.buffered() and not self.transport.poll(due):
+                self.stdout.expire()
+                continue
+            if deadline and not stream.buffered() and \
+               not self.transport.poll(deadline.remaining()):
+                if interrupted:
+                    self.escalate(ep, timeout, time.monotonic() - interrupted)
+                    # unreachable
+                interrupted = time.monotonic()
+                stream.message(ez.repl.opcode.Interrupt).send()
+                deadline = ez.util.Deadline(self.interruptTimeout)
+                continue
+            response = stream.receive(streaming)
             if not (response.tag != 0) == (response.opcode == ez.repl.opcode.Call):
                 raise DeviceABIException("Tag field must not be used outside Call messages")
             if response.opcode == ez.repl.opcode.Result:
@@ -278,32 +498,218 @@ class Session:
                 result = response.readBytesRemaining() # FIXME!
                 response.done()
             elif response.opcode == ez.repl.opcode.StdOut:
-                str, _ = ascii_decode(response.readBytesRemaining()) # FIXME!
+                self.stdout.feed(response.readBytesRemaining()) # FIXME!
+                response.done()
+            elif response.opcode == ez.repl.opcode.Telemetry:
+                self.telemetry.receive(response)
                 response.done()
-                ez.io.output(str)
             elif response.opcode == ez.repl.opcode.Return:
+                self.stdout.flush()
+                if interrupted:
+                    # Device aborted the call. Drop the response, it reports
+                    # the interruption or whatever finished first.
+                    decode.forceDone(response)
+                    self.memory.invalidateVolatile()
+                    self.lastEscalation = { 'interrupt': time.monotonic() - interrupted }
+                    raise CallTimeoutException(ep.symbol, timeout, self.lastEscalation, True)
                 output = decode(response)
+                ep.update(self.memory, input, output)
+                if not self.restoring:
+                    ep.record(self.journal, input, output)
                 if result:
-                    ez.io.output(self.formatExpressionResult(result))
+                    self.printExpressionResult(result)
                 return output
             else:
-                return ep.handleUnexpectedResponse(response)
+                self.stdout.flush()
+                try:
+                    return ep.handleUnexpectedResponse(response)
+                except UnexpectedRebootException as ex:
+                    if not self.autoRestore or self.restoring:
+                        raise
+                    self.restore(ex.connectMessage)
+                    if not ep.idempotent:
+                        raise CallAbortedByRebootException(ep.symbol)
+                    return self.call(endpoint, input, timeout)
+
+    # Bring a rebooted device back to the state before: re-run setup from its
+    # Connect message, check that symbols didn't move and replay the journal.
+    def restore(self, connectMessage: InboundMessage):
+        start = time.monotonic()
+        previous = self.setupInfo
+        self.resetEndpoints()
+        self.memory.invalidateAll()
+        self.restoring = True
+        try:
+            setup = self.setup(connectMessage)
+            if previous and (setup.codeBufferAddr, setup.codeBufferSize) != \
+                            (previous.codeBufferAddr, previous.codeBufferSize):
+                raise SessionRestoreFailedException(
+                    f"Code buffer changed after reboot: 0x{setup.codeBufferAddr:08x} " +
+                    f"({setup.codeBufferSize} bytes)")
+            if len(self.journal.symbols) > 0:
+                addresses = self.call('lookup', dict(self.journal.symbols))
+                moved = [s for s in addresses if addresses[s] != self.journal.symbols[s]]
+                if len(moved) > 0:
+                    raise SessionRestoreFailedException(
+                        "Symbols moved after reboot: " + ", ".join(moved))
+            requests = 0
+            for batch in self.journal.batches(self.restoreBatchSize):
+                self.call('commit', batch)
+                requests += 1
+        finally:
+            self.restoring = False
+        duration = time.monotonic() - start
+        ez.io.note(f"Restored session after device reboot: {self.journal.size()} bytes " +
+                   f"in {requests} commit requests ({duration * 1000:.0f}ms)")
+
+    # Device addresses of endpoints are looked up again on next use
+    def resetEndpoints(self):
+        for ep in self.endpoints.values():
+            ep.addr = 0
+            ep.available = True
+
+    # The device didn't respond to the interrupt request. Soft reset it and
+    # await the handshake and Setup message. Code and data are lost, unless
+    # we can restore them from the journal.
+    def escalate(self, ep: Endpoint, timeout: float, interruptTime: float):
+        self.stdout.flush()
+        timings = { 'interrupt': interruptTime }
+        self.lastEscalation = timings
+        start = time.monotonic()
+        if not self.recovery.softReset(self.info):
+            raise CallTimeoutException(ep.symbol, timeout, timings, False)
+        timings['soft reset'] = time.monotonic() - start
+        start = time.monotonic()
+        try:
+            # Serial soft resets only reopen the port. If the device didn't
+            # reboot, it doesn't send a handshake.
+            self.transport.handshake()
+        except HandshakeFailedException:
+            raise CallTimeoutException(ep.symbol, timeout, timings, False)
+        self.info = getattr(self.transport, 'info', self.info)
+        self.stream.open(self.transport.finalize())
+        setup = self.stream.receive()
+        timings['handshake'] = time.monotonic() - start
+        if self.autoRestore and not self.restoring:
+            start = time.monotonic()
+            self.restore(setup)
+            timings['restore'] = time.monotonic() - start
+        else:
+            self.resetEndpoints()
+            self.memory.clear()
+            self.journal.clear()
+            self.setup(setup)
+        raise CallTimeoutException(ep.symbol, timeout, timings, True)
+
+    # Without a host we don't know the type of the result
+    def formatRawResult(self, result: bytes) -> str:
+        return f"(unknown type) 0x{int.from_bytes(result, self.stream.endian):0{2 * len(result)}x}"
 
     # FIXME: This entire function is a hack!
-    @inject.params(stream=IOSerializer)
-    def formatExpressionResult(self, result: bytes, stream: IOSerializer):
+    def formatExpressionResult(self, result: bytes):
+        if self.host is None:
+            return self.formatRawResult(result)
         resultStr = self.host.formatResult(result)
         declType = self.host.getResultDeclTypeAsString()
         # For c-strings: read contents from device memory and dump it right away
         if declType == "char *" or declType == "const char *":
-            addr = int.from_bytes(result, stream.endian)
-            response = self.call('memory.read.cstr', { 'addr': addr })
-            resultStr += " " + response['str']
+            addr = int.from_bytes(result, self.stream.endian)
+            resultStr += " " + self.readCString(addr)
         return resultStr
 
-    @inject.params(stream=IOSerializer)
-    def disconnect(self, stream: IOSerializer) -> bool:
-        if stream.connected() and not self.disconnecting:
+    # Same as above, but c-strings are printed line by line as they arrive
+    def printExpressionResult(self, result: bytes):
+        if self.host is None:
+            ez.io.output(self.formatRawResult(result))
+            return
+        resultStr = self.host.formatResult(result)
+        declType = self.host.getResultDeclTypeAsString()
+        if declType != "char *" and declType != "const char *":
+            ez.io.output(resultStr)
+            return
+        addr = int.from_bytes(result, self.stream.endian)
+        line = resultStr + " "
+        for text in self.readCStringChunks(addr):
+            *lines, line = (line + text).split('\n')
+            if len(lines) > 0:
+                ez.io.output(*lines)
+            if len(line) > self.maxLineLength:
+                ez.io.output(line)
+                line = ""
+        ez.io.output(line)
+
+    def readCString(self, addr: int) -> str:
+        return "".join(self.readCStringChunks(addr))
+
+    # Strings in memory that the host committed or read before don't need a
+    # round-trip to the device. Others are read in chunks that fit the link,
+    # until the terminating zero or the length limit.
+    def readCStringChunks(self, addr: int) -> Iterator[str]:
+        str = self.memory.readCString(addr)
+        if str is not None:
+            yield str[:self.maxCStringLength]
+            return
+        try:
+            self.resolveEndpoint('memory.read.cstr.chunk')
+        except UnsupportedEndpointException:
+            # Older firmware: read the entire string at once
+            yield self.call('memory.read.cstr', { 'addr': addr })['str']
+            return
+        import codecs
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        length = 0
+        while length < self.maxCStringLength:
+            max = min(self.transport.maxPayload, self.maxCStringLength - length)
+            response = self.call('memory.read.cstr.chunk', { 'addr': addr + length, 'max': max })
+            length += len(response['data'])
+            text = decoder.decode(response['data'], final=response['terminated'])
+            if len(text) > 0:
+                yield text
+            if response['terminated']:
+                return
+            if len(response['data']) == 0:
+                raise DeviceProtocolException("Empty c-string chunk without terminator")
+        yield decoder.decode(b'', final=True) + f"... (cut off after {length} bytes)"
+
+    # Read a range of device memory in chunks that fit the link. With a dtype
+    # the result is a NumPy array in device byte order, otherwise a memoryview.
+    def readMemory(self, addr: int, size: int, dtype = None):
+        if dtype is not None:
+            try:
+                import numpy
+            except ImportError:
+                raise HostAPIException("Reading memory with dtype requires NumPy")
+            itemsize = numpy.dtype(dtype).itemsize
+            if size % itemsize != 0:
+                raise HostAPIException(
+                    f"Cannot read {size} bytes at 0x{addr:08x} as {numpy.dtype(dtype)}: "
+                    f"size must be a multiple of {itemsize}")
+        data = self.memory.read(addr, size)
+        if data is None:
+            buffer = bytearray(size)
+            chunk = self.transport.maxPayload
+            for offset in range(0, size, chunk):
+                length = min(chunk, size - offset)
+                response = self.call('memory.read', { 'addr': addr + offset, 'size': length })
+                buffer[offset:offset + length] = response['data']
+            data = memoryview(buffer)
+        if dtype is None:
+            return data
+        byteorder = '<' if self.stream.endian == 'little' else '>'
+        return numpy.frombuffer(data, dtype=numpy.dtype(dtype).newbyteorder(byteorder))
+
+    # Write a range of device memory to a file. Responses are streamed, so
+    # host memory use doesn't depend on the size of the range.
+    def dumpMemory(self, addr: int, size: int, file) -> int:
+        chunk = self.transport.maxPayload
+        for offset in range(0, size, chunk):
+            length = min(chunk, size - offset)
+            self.call('memory.read', { 'addr': addr + offset, 'size': length, 'into': file })
+        return size
+
+    def disconnect(self) -> bool:
+        stream = self.stream
+        if stream and stream.connected() and not self.disconnecting:
             with ez.util.ScopeGuard(self.disconnecting):
                 stream.message(ez.repl.opcode.Disconnect).send()
                 ez.repl.endpoints.HangupMessageDecoder(stream.receive())
@@ -311,6 +717,7 @@ class Session:
         return True
 
 import ez.repl.endpoints
+import ez.repl.telemetry
 register({
     IOSerializer: lambda: IOSerializer(),
     Recovery: lambda: Recovery(),
@@ -1,7 +1,16 @@
 from . import *
+from .journal import Journal
+from .memory import MemoryCache
+from .schema import Addr, Byte, Bytes, Layout, Repeated, Size, String
 
 # TODO: Setup and hangup are no endpoints! Make DeviceResponse
 class SetupMessageDecoder(EndpointResponseDecoder):
+    layout = Layout(
+        String('version'), # Device version is deprecated
+        Addr('codeBufferAddr'),
+        Size('codeBufferSize'),
+        Repeated('endpoints', String('symbol'), Addr('addr')),
+    )
     def __init__(self, msg: InboundMessage):
         import ez.repl.opcode
         if msg.opcode != ez.repl.opcode.Connect:
@@ -14,16 +23,12 @@ class SetupMessageDecoder(EndpointResponseDecoder):
             raise DeviceProtocolException(
                 "Expected TagAddr field to be zero in Setup message")
 
-        _ = msg.readString() # Device version is deprecated
-        self.codeBufferAddr = msg.readAddr()
-        self.codeBufferSize = msg.readSize()
-
+        setup = self.layout.decode(msg)
+        self.codeBufferAddr = setup['codeBufferAddr']
+        self.codeBufferSize = setup['codeBufferSize']
         self.endpoints = dict()
-        numBoostrapFuncs = msg.readSize()
-        for _ in range(numBoostrapFuncs):
-            symbol = msg.readString()
-            addr = msg.readAddr()
-            self.endpoints[symbol] = addr # TODO: Handle collisions?
+        for entry in setup['endpoints']:
+            self.endpoints[entry['symbol']] = entry['addr'] # TODO: Handle collisions?
         self.checkDone(msg)
 
 class HangupMessageDecoder(EndpointResponseDecoder):
@@ -43,17 +48,22 @@ class EmptyResponseDecoder(EndpointResponseDecoder):
     def decode(self, msg: InboundMessage) -> dict:
         return {}
 
+class LayoutResponseDecoder(EndpointResponseDecoder):
+    def __init__(self, layout: Layout):
+        self.layout = layout
+    def decode(self, msg: InboundMessage) -> dict:
+        return self.layout.decode(msg)
+
 class LookupResponseDecoder(EndpointResponseDecoder):
-    def __init__(self, symbols: dict):
+    def __init__(self, symbols: dict, layout: Layout):
         self.symbols = symbols
+        self.layout = layout
     def decode(self, msg: InboundMessage) -> dict:
-        self.checkSymbolCount(msg)
-        resp = {}
-        for key in self.symbols:
-            resp[key] = msg.readAddr()
-        return resp
-    def checkSymbolCount(self, msg: InboundMessage):
-        actualItems = msg.readSize()
+        addrs = self.layout.decode(msg)['addrs']
+        self.checkSymbolCount(addrs)
+        return dict(zip(self.symbols, addrs))
+    def checkSymbolCount(self, addrs: List[int]):
+        actualItems = len(addrs)
         expectedItems = len(self.symbols)
         if actualItems != expectedItems:
             raise DeviceProtocolException(
@@ -61,40 +71,54 @@ class LookupResponseDecoder(EndpointResponseDecoder):
                 f"expected {expectedItems} but received {actualItems}")
 
 class Lookup(Endpoint):
+    request = Layout(Repeated('symbols', String('symbol')))
+    response = Layout(Repeated('addrs', Addr('addr')))
     def encode(self, msg: OutboundMessage, symbols: dict):
         if len(symbols) == 0:
             raise HostAPIException("Empty symbol set in lookup request")
-        msg.writeSize(len(symbols))
-        for key in symbols:
-            msg.writeString(key)
-        return LookupResponseDecoder(symbols)
+        self.request.encode(msg, { 'symbols': list(symbols) })
+        return LookupResponseDecoder(symbols, self.response)
+    def record(self, journal: Journal, symbols: dict, output: dict):
+        journal.lookup(output)
 
 class Commit(Endpoint):
+    request = Layout(Repeated('segments', Addr('addr'), Size('size'), Bytes('data')))
+    response = Layout()
     def encode(self, msg: OutboundMessage, segments: dict):
         if len(segments) == 0:
             raise HostAPIException("Empty segment set in commit request")
-        msg.writeSize(len(segments))
         for addr in segments:
             assert type(addr) is not str or addr.isdigit(), "Segment key must be convertible to int"
             if not 'size' in segments[addr]:
                 raise HostAPIException(f"Missing 'size' attribute in segment 0x{addr}")
             if not 'data' in segments[addr]:
                 raise HostAPIException(f"Missing 'data' attribute in segment 0x{addr}")
-            msg.writeAddr(int(addr))
-            msg.writeSize(segments[addr]['size'])
-            msg.writeBytes(segments[addr]['data'])
-        return EmptyResponseDecoder()
+        return super().encode(msg, { 'segments': [
+            { 'addr': int(addr), 'size': segments[addr]['size'], 'data': segments[addr]['data'] }
+            for addr in segments
+        ]})
+    def invalidate(self, memory: MemoryCache, segments: dict):
+        for addr in segments:
+            memory.invalidate(int(addr), segments[addr]['size'])
+    def record(self, journal: Journal, segments: dict, output: dict):
+        journal.commit(segments)
+    # Device code may write to committed data, so it's dropped on execute.
+    # Segments flagged with 'const': True and regions that device scripts mark
+    # via MemoryCache.markConstant() stay cached.
+    def update(self, memory: MemoryCache, segments: dict, output: dict):
+        for addr in segments:
+            memory.store(int(addr), segments[addr]['data'], segments[addr].get('const', False))
 
 class Execute(Endpoint):
-    def encode(self, msg: OutboundMessage, input: dict):
-        if not 'addr' in input:
-            raise HostAPIException(f"Missing 'addr' attribute in execute request")
-        msg.writeAddr(input['addr'])
-        return EmptyResponseDecoder()
+    request = Layout(Addr('addr'))
+    response = Layout()
+    def __init__(self, symbol: str):
+        super().__init__(symbol)
+        self.idempotent = False
+    def invalidate(self, memory: MemoryCache, input: dict):
+        memory.invalidateVolatile()
 
-class CStringResponseDecoder(EndpointResponseDecoder):
-    def decode(self, msg: InboundMessage):
-        return { 'str': msg.readString() }
+class CStringResponseDecoder(LayoutResponseDecoder):
     # FIXME: Add a leading error byte to the response!
     def __call__(self, msg: InboundMessage):
         #self.checkErrorCode(msg)
@@ -103,7 +127,61 @@ class CStringResponseDecoder(EndpointResponseDecoder):
         return output
 
 class MemReadCString(Endpoint):
+    request = Layout(Addr('addr'))
+    response = Layout(String('str'))
     def encode(self, msg: OutboundMessage, input: dict):
-        assert 'addr' in input, "Missing 'addr' attribute in MemReadCString"
-        msg.writeAddr(input['addr'])
-        return CStringResponseDecoder()
+        self.request.encode(msg, input)
+        return CStringResponseDecoder(self.response)
+    def update(self, memory: MemoryCache, input: dict, output: dict):
+        memory.store(input['addr'], output['str'].encode('ascii') + b'\x00')
+
+# Continuation protocol for long strings: the device returns up to 'max' bytes
+# and whether it found the terminating zero. If not, the host asks for the next
+# chunk. Data excludes the terminator.
+class MemReadCStringChunk(Endpoint):
+    request = Layout(Addr('addr'), Size('max'))
+    response = Layout(Bytes('data'), Byte('terminated'))
+    def update(self, memory: MemoryCache, input: dict, output: dict):
+        memory.store(input['addr'], output['data'] + (b'\x00' if output['terminated'] else b''))
+
+# With an 'into' file object in the input, data is written there as it arrives
+# and the response only reports the size.
+class MemRead(Endpoint):
+    request = Layout(Addr('addr'), Size('size'))
+    response = Layout(Bytes('data'))
+    def encode(self, msg: OutboundMessage, input: dict):
+        self.request.encode(msg, input)
+        if 'into' in input:
+            return MemReadIntoResponseDecoder(input['size'], input['into'])
+        return MemReadResponseDecoder(input['size'], self.response)
+    def streaming(self, input: dict) -> bool:
+        return 'into' in input
+    def update(self, memory: MemoryCache, input: dict, output: dict):
+        if 'data' in output:
+            memory.store(input['addr'], output['data'])
+
+class MemReadResponseDecoder(LayoutResponseDecoder):
+    def __init__(self, size: int, layout: Layout):
+        super().__init__(layout)
+        self.size = size
+    def decode(self, msg: InboundMessage) -> dict:
+        output = self.layout.decode(msg)
+        self.checkSize(len(output['data']))
+        return output
+    def checkSize(self, actual: int):
+        if actual != self.size:
+            raise DeviceProtocolException(
+                "Memory read response has invalid size: " +
+                f"expected {self.size} but received {actual}")
+
+class MemReadIntoResponseDecoder(MemReadResponseDecoder):
+    def __init__(self, size: int, file):
+        self.size = size
+        self.file = file
+    def decode(self, msg: InboundMessage) -> dict:
+        written = 0
+        for chunk in msg.readBytesIter():
+            self.file.write(chunk)
+            written += len(chunk)
+        self.checkSize(written)
+        return { 'size': written }
@@ -0,0 +1,102 @@
+import zlib
+
+import ez.repl
+
+# Optional frame format for links that lose or corrupt bytes. Each message goes
+# into one frame:
+#
+#   sync marker (4 bytes) | payload size (4 bytes) | header CRC32 (4 bytes) |
+#   payload | CRC32 (4 bytes)
+#
+# Size and CRCs are little-endian. The header CRC covers the size, so we don't
+# wait for a payload that will never come. The trailing CRC covers size and
+# payload. Firmwares must be built with framing support and device scripts opt
+# in with Stream32.framing = True. The handshake sequence is sent before and
+# remains unframed.
+SYNC = bytes.fromhex("e7 5a c3 3c")
+HEADER_SIZE = 12
+TRAILER_SIZE = 4
+MAX_PAYLOAD = 1 << 16 # Larger sizes are corrupt, devices can't buffer that much
+# Messages carry a header and a few fields on top of the transport's payload
+MESSAGE_OVERHEAD = 64
+
+def frame(payload: bytes) -> bytes:
+    size = len(payload).to_bytes(4, 'little')
+    header = zlib.crc32(size).to_bytes(4, 'little')
+    crc = zlib.crc32(size + payload).to_bytes(4, 'little')
+    return SYNC + size + header + payload + crc
+
+# Stream wrapper that frames outbound messages and unpacks inbound frames. If a
+# frame is corrupt, the resynchronizer scans forward to the next sync marker
+# with a valid frame. The message in the corrupt frame is lost, but the link
+# stays usable.
+class FramedStream:
+    def __init__(self, stream, maxPayload: int = None):
+        self.stream = stream
+        # Sizes beyond what the transport can carry are corrupt
+        self.maxSize = MAX_PAYLOAD if maxPayload is None else maxPayload + MESSAGE_OVERHEAD
+        self.raw = bytearray()     # Bytes from the link that aren't parsed yet
+        self.payload = bytearray() # Payload of valid frames that isn't read yet
+        self.frames = 0
+        self.corruptFrames = 0
+        self.skippedBytes = 0
+
+    def write(self, data: bytes):
+        self.stream.write(frame(bytes(data)))
+
+    def read(self, size: int) -> bytes:
+        while len(self.payload) < size:
+            self.payload += self.nextFrame()
+        data = bytes(self.payload[:size])
+        del self.payload[:size]
+        return data
+
+    # Payload bytes that can be read without waiting for the link
+    def buffered(self) -> int:
+        return len(self.payload)
+
+    def close(self):
+        self.stream.close()
+
+    def fill(self, size: int):
+        while len(self.raw) < size:
+            data = self.stream.read(size - len(self.raw))
+            if len(data) == 0:
+                raise ez.repl.DeviceABIException("Link provided no data while awaiting frame")
+            self.raw += data
+
+    def nextFrame(self) -> bytes:
+        while True:
+            self.fill(len(SYNC))
+            idx = self.raw.find(SYNC)
+            if idx < 0:
+                # Keep the tail, it may be the start of a sync marker
+                drop = len(self.raw) - len(SYNC) + 1
+                self.skippedBytes += drop
+                del self.raw[:drop]
+                continue
+            self.skippedBytes += idx
+            del self.raw[:idx]
+            self.fill(HEADER_SIZE)
+            size = int.from_bytes(self.raw[4:8], 'little')
+            header = int.from_bytes(self.raw[8:12], 'little')
+            if zlib.crc32(self.raw[4:8]) != header or size > self.maxSize:
+                self.dropCorruptFrame()
+                continue
+            end = HEADER_SIZE + size
+            self.fill(end + TRAILER_SIZE)
+            crc = int.from_bytes(self.raw[end:end + TRAILER_SIZE], 'little')
+            if zlib.crc32(self.raw[4:8] + self.raw[HEADER_SIZE:end]) != crc:
+                self.dropCorruptFrame()
+                continue
+            payload = bytes(self.raw[HEADER_SIZE:end])
+            del self.raw[:end + TRAILER_SIZE]
+            self.frames += 1
+            return payload
+
+    # Scan for the next sync marker from the byte after the current one. The
+    # corrupt frame may contain the start of a valid one.
+    def dropCorruptFrame(self):
+        self.corruptFrames += 1
+        self.skippedBytes += 1
+        del self.raw[:1]
@@ -0,0 +1,43 @@
+from typing import Dict, Iterator, List, Tuple
+
+# Record of everything the host did to the device that a reboot would undo:
+# committed segments in commit order and resolved symbol addresses. Segments
+# that get overwritten entirely are dropped. Partial overlaps are kept, so that
+# replay in order restores the same memory contents.
+class Journal:
+    def __init__(self):
+        self.segments: List[Tuple[int, dict]] = []
+        self.symbols: Dict[str, int] = {}
+
+    def clear(self):
+        self.segments.clear()
+        self.symbols.clear()
+
+    def commit(self, segments: dict):
+        for addr in segments:
+            start = int(addr)
+            end = start + segments[addr]['size']
+            self.segments = [(a, s) for a, s in self.segments
+                             if a < start or a + s['size'] > end]
+            self.segments.append((start, segments[addr]))
+
+    def lookup(self, addresses: dict):
+        self.symbols.update({ s: a for s, a in addresses.items() if a != 0 })
+
+    def size(self) -> int:
+        return sum(segment['size'] for _, segment in self.segments)
+
+    # Commit requests for replay. Each takes segments up to the given number
+    # of bytes. Larger segments go on their own, the device accepted them once.
+    def batches(self, maxSize: int) -> Iterator[dict]:
+        batch = {}
+        batchSize = 0
+        for addr, segment in self.segments:
+            if len(batch) > 0 and (addr in batch or batchSize + segment['size'] > maxSize):
+                yield batch
+                batch = {}
+                batchSize = 0
+            batch[addr] = segment
+            batchSize += segment['size']
+        if len(batch) > 0:
+            yield batch
@@ -0,0 +1,126 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Union
+
+import ez.io
+import ez.repl
+
+from . import IOSerializer, Recovery, Session, Transport
+
+# Sessions for several devices in one host process. inject binds a single
+# component stack per process, so the manager builds its own stack for each
+# device from a snapshot of registered factories, see ez.repl.components().
+#
+#   import due.serial
+#   due = ez.repl.components()
+#   import teensylc.serial
+#   teensy = ez.repl.components()
+#
+#   manager = SessionManager()
+#   manager.add('due', dueInfo, due, host=host)
+#   manager.add('teensy', teensyInfo, teensy, host=host)
+#   manager.execute(lambda name, session: { 'addr': entryPoints[name] })
+#
+# Fan-out operations run concurrently, one thread per device. Operations on a
+# session run in an ez.repl.scope() of its stack, so components that inject
+# their dependencies, like Recovery, get the ones of the same device.
+class BroadcastException(Exception):
+    def __init__(self, endpoint: str, errors: Dict[str, Exception],
+                 results: Dict[str, dict]):
+        self.errors = errors
+        self.results = results
+        details = "\n".join(f"  {name}: {ex}" for name, ex in errors.items())
+        super().__init__(f"Call to {endpoint} failed on {len(errors)} out of " +
+                         f"{len(errors) + len(results)} devices:\n{details}")
+
+# Input for a fan-out call: the same for all devices or computed per device,
+# e.g. because code was linked for a device-specific address
+BroadcastInput = Union[dict, Callable[[str, Session], dict]]
+
+class SessionManager:
+    def __init__(self):
+        self.sessions: Dict[str, Session] = {}
+        self.stacks: Dict[str, dict] = {}
+
+    # The host formats expression results, without one they are printed raw
+    def add(self, name: str, info: Any, components: dict,
+            endian: str = 'little', framing: bool = False, host: Any = None) -> Session:
+        assert not name in self.sessions, f"Device name already taken: {name}"
+        session = components[Session]()
+        session.host = host
+        stream = components[IOSerializer]()
+        stream.endian = endian
+        stream.framing = framing
+        stack = {
+            Session: session,
+            Transport: components[Transport](),
+            Recovery: components[Recovery](),
+            IOSerializer: stream,
+        }
+        with ez.repl.scope(stack):
+            stream.open(session.connect(info, transport=stack[Transport],
+                                        recovery=stack[Recovery], stream=stream))
+            session.setup(stream.receive())
+        self.sessions[name] = session
+        self.stacks[name] = stack
+        return session
+
+    def remove(self, name: str) -> bool:
+        session = self.sessions.pop(name)
+        with ez.repl.scope(self.stacks.pop(name)):
+            return session.disconnect()
+
+    def names(self) -> List[str]:
+        return list(self.sessions.keys())
+
+    def call(self, name: str, endpoint: str, input: dict,
+             timeout: float = None) -> dict:
+        with ez.repl.scope(self.stacks[name]):
+            return self.sessions[name].call(endpoint, input, timeout)
+
+    # Call the endpoint on all devices concurrently. Raises BroadcastException
+    # with the results of the successful calls if any of them failed.
+    def broadcast(self, endpoint: str, input: BroadcastInput,
+                  timeout: float = None, names: List[str] = None) -> Dict[str, dict]:
+        names = names or self.names()
+        if len(names) == 0:
+            return {}
+        def run(name: str) -> dict:
+            session = self.sessions[name]
+            data = input(name, session) if callable(input) else input
+            with ez.repl.scope(self.stacks[name]):
+                return session.call(endpoint, data, timeout)
+
+        results = {}
+        errors = {}
+        with ThreadPoolExecutor(len(names), thread_name_prefix="ez-broadcast") as pool:
+            futures = { name: pool.submit(run, name) for name in names }
+            for name, future in futures.items():
+                try:
+                    results[name] = future.result()
+                except Exception as ex:
+                    errors[name] = ex
+        if len(errors) > 0:
+            raise BroadcastException(endpoint, errors, results)
+        return results
+
+    def commit(self, segments: BroadcastInput, **kwargs) -> Dict[str, dict]:
+        return self.broadcast('commit', segments, **kwargs)
+
+    def execute(self, addr: Union[int, Callable[[str, Session], int]],
+                **kwargs) -> Dict[str, dict]:
+        input = (lambda name, session: { 'addr': addr(name, session) }) \
+                if callable(addr) else { 'addr': addr }
+        return self.broadcast('execute', input, **kwargs)
+
+    def metrics(self) -> Dict[str, dict]:
+        return { name: session.metrics() for name, session in self.sessions.items() }
+
+    def disconnectAll(self) -> bool:
+        success = True
+        for name in self.names():
+            try:
+                success = self.remove(name) and success
+            except Exception as ex:
+                ez.io.warning(f"Failed to disconnect {name}: {ex}")
+                success = False
+        return success
@@ -0,0 +1,82 @@
+from bisect import bisect_right
+from typing import Callable, List, Tuple
+
+# Host-side copy of device memory ranges that the host knows the contents of:
+# bytes it committed itself and bytes it read back before. Device code may
+# write to memory while it executes. Thus, on execute all ranges are dropped
+# except the ones that the policy marks as constant.
+class Region:
+    def __init__(self, addr: int, data: bytes, constant: bool):
+        self.addr = addr
+        self.data = data
+        self.constant = constant
+    def end(self) -> int:
+        return self.addr + len(self.data)
+
+class MemoryCache:
+    def __init__(self):
+        self.regions: List[Region] = [] # Sorted by address and disjoint
+        self.constantRanges: List[Tuple[int, int]] = []
+        self.hits = 0
+        self.misses = 0
+        # Policy hook: decides whether a range survives execute. Device scripts
+        # can replace it, e.g. to keep everything that lives in flash.
+        self.policy: Callable[[int, int], bool] = self.isMarkedConstant
+
+    def markConstant(self, addr: int, size: int):
+        self.constantRanges.append((addr, addr + size))
+
+    def isMarkedConstant(self, addr: int, size: int) -> bool:
+        end = addr + size
+        return any(lo <= addr and end <= hi for lo, hi in self.constantRanges)
+
+    def clear(self):
+        self.regions.clear()
+        self.constantRanges.clear()
+
+    def store(self, addr: int, data: bytes, constant: bool = False):
+        self.invalidate(addr, len(data))
+        region = Region(addr, bytes(data), constant or self.policy(addr, len(data)))
+        self.regions.insert(self.index(addr), region)
+
+    # Drop all regions that overlap with the given range
+    def invalidate(self, addr: int, size: int):
+        end = addr + size
+        self.regions = [r for r in self.regions if r.end() <= addr or r.addr >= end]
+
+    def invalidateAll(self):
+        self.regions.clear()
+
+    def invalidateVolatile(self):
+        self.regions = [r for r in self.regions if r.constant]
+
+    def index(self, addr: int) -> int:
+        return bisect_right([r.addr for r in self.regions], addr)
+
+    def find(self, addr: int) -> Region:
+        idx = self.index(addr)
+        if idx > 0 and addr < self.regions[idx - 1].end():
+            return self.regions[idx - 1]
+        return None
+
+    # Returns None if the range isn't fully covered by a single region
+    def read(self, addr: int, size: int) -> memoryview:
+        region = self.find(addr)
+        if region and addr + size <= region.end():
+            self.hits += 1
+            offset = addr - region.addr
+            return memoryview(region.data)[offset:offset + size]
+        self.misses += 1
+        return None
+
+    # Returns None if the string isn't fully covered by a single region
+    def readCString(self, addr: int) -> str:
+        region = self.find(addr)
+        if region:
+            offset = addr - region.addr
+            end = region.data.find(b'\x00', offset)
+            if end >= 0:
+                self.hits += 1
+                return region.data[offset:end].decode('utf-8', errors='replace')
+        self.misses += 1
+        return None
@@ -4,9 +4,11 @@ Return = 2 # TODO: Switch IDs: Call <--> Return
 Call = 3
 Result = 4 # TODO: Eliminate async messages?
 StdOut = 5 #
+Telemetry = 6 # Binary samples for a stream ID
+Interrupt = 7 # Ask the device to abort the current call
 
 def name(opcode: int) -> str:
-  if opcode > StdOut:
+  if opcode > Interrupt:
     return "Unknown opcode"
   else:
     return {
@@ -16,4 +18,6 @@ def name(opcode: int) -> str:
       Call: 'Call',
       Result: 'Result',
       StdOut: 'StdOut',
+      Telemetry: 'Telemetry',
+      Interrupt: 'Interrupt',
     }[opcode]
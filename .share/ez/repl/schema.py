@@ -0,0 +1,191 @@
+import struct
+
+from typing import Any, Callable, Dict, List
+
+from . import HostAPIException, InboundMessage, OutboundMessage
+
+# Declarative message layouts. A Layout lists the fields of a message body in
+# wire order and compiles into specialized encode/decode functions per
+# endianness. Consecutive fixed-size fields are packed with a single
+# precompiled struct. Length prefixes of variable-size fields and counts of
+# repeated fields join the preceding group, so that e.g. each segment of a
+# commit request takes one pack() call plus the raw data.
+#
+# FIXME: In 0.0.5 protocol all numeric fields are still 64-bit wide!
+
+class Field:
+    def __init__(self, name: str):
+        self.name = name
+
+class UInt(Field):
+    format = 'Q'
+    size = 8
+
+class Addr(UInt):
+    pass
+
+class Size(UInt):
+    pass
+
+class Byte(Field):
+    format = 'B'
+    size = 1
+
+class Bytes(Field):
+    def encode(self, value) -> bytes:
+        return value
+    def decode(self, data: bytes):
+        return data
+
+class String(Bytes):
+    def encode(self, value: str) -> bytes:
+        return value.encode('ascii') # FIXME: Let's assume that for now
+    def decode(self, data: bytes) -> str:
+        return data.decode('ascii')
+
+# Count-prefixed sequence of items. Items with a single field are plain values,
+# otherwise they are dicts.
+class Repeated(Field):
+    def __init__(self, name: str, *fields: Field):
+        super().__init__(name)
+        self.fields = fields
+
+# A group is a run of fixed-size fields, optionally followed by the payload of a
+# variable-size field or by the items of a repeated field. Its struct covers
+# the length prefix or count for the latter.
+class Group:
+    def __init__(self, scalars: List[Field], tail: Field = None):
+        self.scalars = scalars
+        self.tail = tail
+    def format(self) -> str:
+        return ''.join(f.format for f in self.scalars) + ('Q' if self.tail else '')
+    def sizes(self) -> List[int]:
+        return [f.size for f in self.scalars] + ([8] if self.tail else [])
+
+def groups(fields: List[Field]) -> List[Group]:
+    result = []
+    scalars = []
+    for f in fields:
+        if isinstance(f, (Bytes, Repeated)):
+            result.append(Group(scalars, f))
+            scalars = []
+        else:
+            scalars.append(f)
+    if len(scalars) > 0:
+        result.append(Group(scalars))
+    return result
+
+Encoder = Callable[[Any, bytearray, List[int]], None]
+Decoder = Callable[[InboundMessage], Any]
+
+def compileEncoder(fields: List[Field], prefix: str, plain: bool = False) -> Encoder:
+    steps = [compileGroupEncoder(g, prefix, plain) for g in groups(fields)]
+    if len(steps) == 1:
+        return steps[0]
+    def encode(values, out: bytearray, layout: List[int]):
+        for step in steps:
+            step(values, out, layout)
+    return encode
+
+def compileGroupEncoder(group: Group, prefix: str, plain: bool) -> Encoder:
+    packer = struct.Struct(prefix + group.format())
+    sizes = group.sizes()
+    names = [f.name for f in group.scalars]
+    tail = group.tail
+    if isinstance(tail, Bytes):
+        def encode(values, out: bytearray, layout: List[int]):
+            data = tail.encode(values if plain else values[tail.name])
+            out += packer.pack(*[values[n] for n in names], len(data))
+            out += data
+            layout += sizes
+            layout[-1] += len(data) # Size + Content as a single item
+    elif isinstance(tail, Repeated):
+        item = compileEncoder(tail.fields, prefix, len(tail.fields) == 1)
+        def encode(values, out: bytearray, layout: List[int]):
+            items = values[tail.name]
+            out += packer.pack(*[values[n] for n in names], len(items))
+            layout += sizes
+            for entry in items:
+                item(entry, out, layout)
+    else:
+        def encode(values, out: bytearray, layout: List[int]):
+            out += packer.pack(*([values] if plain else [values[n] for n in names]))
+            layout += sizes
+    return encode
+
+def compileDecoder(fields: List[Field], prefix: str, plain: bool = False) -> Decoder:
+    steps = [compileGroupDecoder(g, prefix) for g in groups(fields)]
+    def decode(msg: InboundMessage):
+        values = {}
+        for step in steps:
+            step(msg, values)
+        return values[fields[0].name] if plain else values
+    return decode
+
+def compileGroupDecoder(group: Group, prefix: str):
+    unpacker = struct.Struct(prefix + group.format())
+    sizes = group.sizes()
+    names = [f.name for f in group.scalars]
+    tail = group.tail
+    if isinstance(tail, Bytes):
+        def decode(msg: InboundMessage, values: dict):
+            *scalars, length = unpacker.unpack(msg.readRaw(unpacker.size, sizes))
+            values.update(zip(names, scalars))
+            values[tail.name] = tail.decode(msg.readRaw(length))
+    elif isinstance(tail, Repeated) and all(isinstance(f, (UInt, Byte)) for f in tail.fields):
+        # Fixed-size items: read all of them at once and unpack in a loop
+        item = struct.Struct(prefix + ''.join(f.format for f in tail.fields))
+        itemSizes = [f.size for f in tail.fields]
+        itemNames = [f.name for f in tail.fields]
+        plain = len(tail.fields) == 1
+        def decode(msg: InboundMessage, values: dict):
+            *scalars, count = unpacker.unpack(msg.readRaw(unpacker.size, sizes))
+            values.update(zip(names, scalars))
+            data = msg.readRaw(count * item.size, itemSizes * count)
+            if plain:
+                values[tail.name] = [entry[0] for entry in item.iter_unpack(data)]
+            else:
+                values[tail.name] = [dict(zip(itemNames, entry))
+                                     for entry in item.iter_unpack(data)]
+    elif isinstance(tail, Repeated):
+        item = compileDecoder(tail.fields, prefix, len(tail.fields) == 1)
+        def decode(msg: InboundMessage, values: dict):
+            *scalars, count = unpacker.unpack(msg.readRaw(unpacker.size, sizes))
+            values.update(zip(names, scalars))
+            values[tail.name] = [item(msg) for _ in range(count)]
+    else:
+        def decode(msg: InboundMessage, values: dict):
+            values.update(zip(names, unpacker.unpack(msg.readRaw(unpacker.size, sizes))))
+    return decode
+
+class Layout:
+    def __init__(self, *fields: Field):
+        self.fields = fields
+        self.encoders: Dict[str, Encoder] = {}
+        self.decoders: Dict[str, Decoder] = {}
+
+    def encoder(self, endian: str) -> Encoder:
+        if not endian in self.encoders:
+            prefix = '<' if endian == 'little' else '>'
+            self.encoders[endian] = compileEncoder(self.fields, prefix)
+        return self.encoders[endian]
+
+    def decoder(self, endian: str) -> Decoder:
+        if not endian in self.decoders:
+            prefix = '<' if endian == 'little' else '>'
+            self.decoders[endian] = compileDecoder(self.fields, prefix)
+        return self.decoders[endian]
+
+    def encode(self, msg: OutboundMessage, values: dict):
+        out = bytearray()
+        layout = []
+        try:
+            self.encoder(msg.endian)(values, out, layout)
+        except KeyError as ex:
+            raise HostAPIException(f"Missing {ex} attribute in request")
+        except struct.error as ex:
+            raise HostAPIException(f"Invalid value in request: {ex}")
+        msg.writeRaw(bytes(out), layout)
+
+    def decode(self, msg: InboundMessage) -> dict:
+        return self.decoder(msg.endian)(msg)
@@ -1,5 +1,6 @@
 import ez.io
 import ez.repl
+import ez.util
 
 import inject
 import time
@@ -8,7 +9,7 @@ import serial
 from abc import abstractmethod
 from serial.tools.list_ports_linux import SysFS, comports
 from overrides import override
-from typing import List
+from typing import Any, List
 
 class SerialHandshakeFailedException(ez.repl.HandshakeFailedException):
     def __init__(self, actual: bytes):
@@ -30,10 +31,15 @@ class Transport(ez.repl.Transport):
         self.stream.timeout = self.timeout
         return self.info
 
+    # Devices that keep sending garbage would keep us here forever, so we
+    # respect the active deadline, see ez.util.deadline()
     def awaitToken(self, token: bytes):
         idx = 0
         actual = bytearray()
+        deadline = ez.util.activeDeadline()
         while idx < len(token):
+            if deadline:
+                deadline.check()
             byte = self.stream.read(1)
             if len(byte) == 0:
                 raise SerialHandshakeFailedException(actual)
@@ -44,10 +50,105 @@ class Transport(ez.repl.Transport):
                 idx = 0   # Mismatch: start from beginning
         return # Success
 
+    # Sessions read and write through the transport, so that blocking calls
+    # respect the active deadline of the calling thread, see ez.util.deadline()
     @override
-    def finalize(self) -> serial.Serial:
+    def finalize(self):
         self.stream.timeout = None
-        return self.stream
+        return self
+
+    def read(self, size: int) -> bytes:
+        deadline = ez.util.activeDeadline()
+        if not deadline:
+            return self.stream.read(size)
+        data = bytearray()
+        while len(data) < size:
+            if not self.poll(deadline.remaining()):
+                deadline.check()
+                continue
+            data += self.stream.read(min(size - len(data), self.stream.in_waiting or 1))
+        return bytes(data)
+
+    def readinto(self, buffer) -> int:
+        if not ez.util.activeDeadline():
+            return self.stream.readinto(buffer)
+        view = memoryview(buffer).cast('B')
+        data = self.read(min(len(view), self.stream.in_waiting or 1))
+        view[:len(data)] = data
+        return len(data)
+
+    def write(self, data: bytes) -> int:
+        deadline = ez.util.activeDeadline()
+        if not deadline:
+            return self.stream.write(data)
+        import os
+        import select
+        view = memoryview(data)
+        written = 0
+        while written < len(view):
+            _, writable, _ = select.select([], [ self.stream.fileno() ], [],
+                                           deadline.remaining())
+            if len(writable) == 0:
+                deadline.check()
+                continue
+            try:
+                written += os.write(self.stream.fileno(), view[written:])
+            except BlockingIOError:
+                pass
+        return written
+
+    def close(self):
+        self.stream.close()
+
+    @override
+    def poll(self, timeout: float) -> bool:
+        import select
+        if self.stream.in_waiting > 0:
+            return True
+        readable, _, _ = select.select([ self.stream.fileno() ], [], [], timeout)
+        return len(readable) > 0
+
+    # Wait until a port for the device with the given serial number shows up.
+    # We poll with exponential backoff. If pyudev is installed, tty events cut
+    # the wait short. Returns None if the deadline expires.
+    # Pass a monitor from udevMonitor() to wake up on hotplug events instead of
+    # polling. Callers own it and close it when they're done.
+    def awaitPort(self, serialNumber: str, deadline: ez.util.Deadline,
+                  monitor: Any = None) -> SysFS:
+        delay = 0.02
+        while True:
+            for info in comports():
+                if info.serial_number == serialNumber:
+                    return info
+            if deadline.expired():
+                return None
+            wait = min(delay, deadline.remaining())
+            monitor.poll(timeout=wait) if monitor else time.sleep(wait)
+            delay = min(delay * 2, 0.5)
+
+    @staticmethod
+    def udevMonitor():
+        try:
+            import pyudev
+        except ImportError:
+            return None
+        monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+        monitor.filter_by('tty')
+        monitor.start()
+        return monitor
+
+    # Discard bytes that the device sent before it was ready, e.g. output from
+    # the bootloader or parts of a duplicated handshake. Returns once the line
+    # was quiet for the given time or the active deadline expires.
+    def drain(self, quiet: float = 0.05) -> int:
+        self.stream.reset_input_buffer()
+        dropped = 0
+        deadline = ez.util.activeDeadline()
+        while self.poll(quiet):
+            if deadline:
+                deadline.check()
+            dropped += len(self.stream.read(self.stream.in_waiting or 1))
+        return dropped
 
     def awaitReconnect(self, threshold: float = 3.0) -> SysFS:
         ez.io.note("Await reconnect")
@@ -81,8 +182,10 @@ class SerialRecoveryFailedException(ez.repl.RecoveryFailedException):
 
 class Recovery(ez.repl.Recovery):
     @inject.params(transport=ez.repl.Transport)
-    def softReset(self, info: SysFS, transport: Transport):
+    @override(check_signature=False)
+    def softReset(self, info: SysFS, transport: Transport) -> bool:
         transport.reset(info)
+        return True
 
     @inject.params(transport=ez.repl.Transport)
     def hardReset(self, info: SysFS, transport: Transport):
@@ -122,6 +225,61 @@ class Recovery(ez.repl.Recovery):
         ez.io.error(message)
         return False
 
+    # Wait until the device finished booting after a firmware upload and return
+    # the info for its (maybe new) port. Each attempt drains pre-boot garbage,
+    # runs the handshake, reads the Setup message and hangs up, so that the
+    # device is back in its initial state for the next connection. Attempts
+    # back off exponentially until the timeout expires. This only works for
+    # devices that answer a handshake from the host.
+    @inject.params(transport=ez.repl.Transport)
+    def awaitBootReady(self, timeout: float = 10.0, endian: str = 'little',
+                       transport: Transport = None) -> SysFS:
+        ez.io.note("Await device boot")
+        deadline = ez.util.Deadline(timeout)
+        serialNumber = transport.info.serial_number
+        info = transport.info
+        reason = "Device didn't show up"
+        delay = 0.05
+        try:
+            monitor = transport.udevMonitor()
+        except OSError:
+            monitor = None # Poll instead
+        try:
+            while True:
+                try:
+                    with ez.util.deadline(deadline.remaining(), "Await device boot"):
+                        info = transport.awaitPort(serialNumber, deadline, monitor) or info
+                        transport.reset(info)
+                        transport.drain()
+                        transport.handshake()
+                        self.hangup(transport, endian)
+                    ez.io.note(f"Device ready after {timeout - deadline.remaining():.2f}s")
+                    return transport.reset(info)
+                except (ez.repl.HandshakeFailedException, ez.repl.DeviceABIException,
+                        ez.repl.DeviceProtocolException, ez.repl.OperationFailedException,
+                        OSError) as ex:
+                    # OSError covers port, udev and timeout errors, e.g. if the
+                    # port vanishes while we look for it or the device keeps
+                    # sending garbage. The caller's deadlines still apply.
+                    outer = ez.util.activeDeadline()
+                    if outer and outer.expired():
+                        raise
+                    reason = str(ex) or type(ex).__name__
+                if deadline.expired():
+                    ez.io.warning(f"Device not ready after {timeout:.2f}s: {reason}")
+                    return transport.reset(info) # Best guess, like awaitReconnect()
+                time.sleep(min(delay, deadline.remaining()))
+                delay = min(delay * 2, 1.0)
+        finally:
+            if monitor:
+                monitor.stop()
+
+    # Read from the port directly: unlike finalized transports, it times out if
+    # the device doesn't answer.
+    @override(check_signature=False)
+    def hangup(self, transport: Transport, endian: str):
+        self.hangupStream(transport.stream, endian)
+
     @inject.params(transport=ez.repl.Transport)
     @override(check_signature=False)
     def attemptAutoRecovery(self, transport: Transport) -> bool:
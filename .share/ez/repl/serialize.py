@@ -2,7 +2,7 @@ from codecs import ascii_encode, ascii_decode
 from functools import reduce
 from io import BytesIO
 from overrides import override
-from typing import List
+from typing import Iterator, List
 
 import ez.io
 import ez.repl
@@ -15,6 +15,20 @@ def uint32_t(n):
     assert is_uint32_t(n)
     return n
 
+# Size field of an inbound message. Short reads and bogus sizes mean that the
+# link is out of sync and surface as DeviceABIException.
+def messageSize(bytesSize: bytes, endian: str, headerSize: int) -> int:
+    if len(bytesSize) != 8:
+        raise ez.repl.DeviceABIException(f"Message truncated: expected 8 bytes " +
+                                         f"for size field, but got {len(bytesSize)}")
+    size = int.from_bytes(bytesSize, endian)
+    if not is_uint32_t(size) or size < headerSize:
+        raise ez.repl.DeviceABIException(f"Invalid message size: {size}")
+    return size
+
+# Devices send this sequence when they boot, right before the Connect message
+HANDSHAKE = bytes.fromhex("01 23 57 bd bd 57 23 01")
+
 def sum(values: List[int]):
     return reduce(lambda x,y: x+y, values) if len(values) > 0 else 0
 
@@ -39,6 +53,10 @@ class InboundMessage32(ez.repl.InboundMessage):
         # Message size is first header item. Copy the bytes to the buffer and
         # read it back so it's considered in the message layout.
         bytesSize = parent.stream.read(8)
+        if bytesSize == HANDSHAKE:
+            # Device rebooted. Its Connect message follows.
+            bytesSize = parent.stream.read(8)
+        messageSize(bytesSize, self.endian, self.HEADER_SIZE)
         self.buffer.write(bytesSize)
         self.buffer.seek(0)
         self.size = self.readUInt32()
@@ -47,7 +65,9 @@ class InboundMessage32(ez.repl.InboundMessage):
         # Copy remaining message to the buffer and read all header info
         numBytesRemaining = self.size - len(bytesSize)
         bytesRemaining = parent.stream.read(numBytesRemaining)
-        assert len(bytesRemaining) == numBytesRemaining
+        if len(bytesRemaining) != numBytesRemaining:
+            raise ez.repl.DeviceABIException(f"Message truncated: expected {numBytesRemaining} " +
+                                             f"more bytes, but got {len(bytesRemaining)}")
         self.buffer.write(bytesRemaining)
         self.buffer.seek(len(bytesSize))
         self.opcode = self.readUInt32()
@@ -81,6 +101,22 @@ class InboundMessage32(ez.repl.InboundMessage):
         bytes = self.readBytes()
         str, _ = ascii_decode(bytes)
         return str
+    @override
+    def readRaw(self, size: int, items: List[int] = None) -> bytes:
+        if items is None:
+            self.layout[-1] += size
+        else:
+            self.layout += items
+        data = self.buffer.read(size)
+        if len(data) != size:
+            raise ez.repl.DeviceABIException(f"Message truncated: expected {size} " +
+                                             f"more bytes, but got {len(data)}")
+        return data
+    @override
+    def readinto(self, buffer, items: List[int] = None) -> int:
+        view = memoryview(buffer).cast('B')
+        view[:] = self.readRaw(len(view), items)
+        return len(view)
     # FIXME: Deprecated! Firmwares should stop to send such messages!
     @override
     def readBytesRemaining(self) -> bytes:
@@ -96,12 +132,132 @@ class InboundMessage32(ez.repl.InboundMessage):
                   self.buffer.read(self.size), self.layout)
         return True
 
-seqId = 0 # FIXME: New firmware ABIs shouldn't need that
+# Inbound message that doesn't buffer its body. The header is parsed eagerly.
+# All other fields are read from the transport on demand, so that large
+# payloads can be consumed incrementally, e.g. written to a file in chunks.
+# Message bytes are only kept for verbose dumps.
+class StreamingInboundMessage32(ez.repl.InboundMessage):
+    HEADER_SIZE = 32
+    def __init__(self, parent):
+        self.parent = parent
+        self.stream = parent.stream
+        self.endian = parent.endian
+        self.layout = []
+        self.dump = parent.dumpMessage
+        self.record = bytearray() if parent.verbose else None
+        self.pos = 0
+        bytesSize = self.stream.read(8)
+        if bytesSize == HANDSHAKE:
+            # Device rebooted. Its Connect message follows.
+            bytesSize = self.stream.read(8)
+        if self.record is not None:
+            self.record += bytesSize
+        self.layout += [8]
+        self.pos = 8
+        self.size = messageSize(bytesSize, self.endian, self.HEADER_SIZE)
+        self.opcode = self.readUInt32()
+        _ = self.readUInt32() # TODO: seqID is unused. but right now it's still in the protocol
+        self.tag = self.readUInt32()
+        assert len(self.layout) == 4, "Header fields recorded in message layout"
+        assert self.pos == self.HEADER_SIZE, "Done with header"
+    def remaining(self) -> int:
+        return self.size - self.pos
+    def consume(self, size: int):
+        if size > self.remaining():
+            raise ez.repl.DeviceABIException(f"Message overrun: expected at most " +
+                                             f"{self.remaining()} more bytes, but need {size}")
+        self.pos += size
+    def read(self, size: int) -> bytes:
+        self.consume(size)
+        data = self.stream.read(size)
+        if len(data) != size:
+            raise ez.repl.DeviceABIException(f"Message truncated: expected {size} " +
+                                             f"more bytes, but got {len(data)}")
+        if self.record is not None:
+            self.record += data
+        return data
+    # Read the next len(buffer) bytes of the message straight into the buffer
+    @override
+    def readinto(self, buffer, items: List[int] = None) -> int:
+        view = memoryview(buffer).cast('B')
+        if items is None:
+            self.layout[-1] += len(view)
+        else:
+            self.layout += items
+        self.consume(len(view))
+        readinto = getattr(self.stream, 'readinto', None)
+        filled = 0
+        while filled < len(view):
+            if readinto:
+                count = readinto(view[filled:])
+            else:
+                data = self.stream.read(len(view) - filled)
+                count = len(data)
+                view[filled:filled + count] = data
+            if not count:
+                raise ez.repl.DeviceABIException(f"Message truncated: expected {len(view)} " +
+                                                 f"more bytes, but got {filled}")
+            filled += count
+        if self.record is not None:
+            self.record += view
+        return filled
+    def readByte(self) -> int:
+        self.layout += [1]
+        return self.read(1)[0]
+    @override
+    def readErrorCode(self) -> int:
+        assert self.pos == self.HEADER_SIZE, "Error code is first byte in body"
+        return self.readByte()
+    def readUInt32(self) -> int:
+        self.layout += [8]
+        return uint32_t(int.from_bytes(self.read(8), self.endian))
+    @override
+    def readAddr(self) -> int:
+        return self.readUInt32()
+    @override
+    def readSize(self) -> int:
+        return self.readUInt32()
+    @override
+    def readBytes(self) -> bytes:
+        return b''.join(self.readBytesIter())
+    # Content of a bytes field in chunks of limited size
+    def readBytesIter(self, chunkSize: int = 4096) -> Iterator[bytes]:
+        length = self.readSize()
+        self.layout[-1] += length # Size + Content as a single item
+        while length > 0:
+            chunk = self.read(min(chunkSize, length))
+            length -= len(chunk)
+            yield chunk
+    @override
+    def readString(self) -> str:
+        str, _ = ascii_decode(self.readBytes())
+        return str
+    @override
+    def readRaw(self, size: int, items: List[int] = None) -> bytes:
+        if items is None:
+            self.layout[-1] += size
+        else:
+            self.layout += items
+        return self.read(size)
+    # FIXME: Deprecated! Firmwares should stop to send such messages!
+    @override
+    def readBytesRemaining(self) -> bytes:
+        length = self.remaining()
+        self.layout += [length] # Size + Content as a single item
+        return self.read(length)
+    @override
+    def done(self) -> bool:
+        if self.pos < self.size:
+            return False
+        if self.record is not None:
+            self.dump(ez.repl.opcode.name(self.opcode) + ' <-', bytes(self.record), self.layout)
+        return True
 
 class OutboundMessage32(ez.repl.OutboundMessage):
     def __init__(self, parent, banner: str):
         self.buffer = BytesIO()
         self.parent = parent
+        self.endian = parent.endian
         self.layout = []
         self.banner = banner
     @override
@@ -134,12 +290,15 @@ class OutboundMessage32(ez.repl.OutboundMessage):
         byteData, _ = ascii_encode(data) # FIXME: Let's assume that for now
         self.writeBytes(byteData)
     @override
+    def writeRaw(self, data: bytes, items: List[int]):
+        self.buffer.write(data)
+        self.layout += items
+    @override
     def send(self):
-        global seqId
-        seqId += 1 # TODO: Right now seqID is still in the protocol
+        self.parent.seqId += 1 # TODO: Right now seqID is still in the protocol
         bufferSize = self.buffer.tell()
         self.fixupUInt32(bufferSize, 0)
-        self.fixupUInt32(seqId, 2)
+        self.fixupUInt32(self.parent.seqId, 2)
         self.buffer.seek(0)
         data = self.buffer.read(bufferSize)
         self.parent.stream.write(data)
@@ -150,12 +309,20 @@ class Stream32(ez.repl.IOSerializer):
     def __init__(self):
         super().__init__()
         self.stream = None
+        self.framing = False # Firmware must be built with framing support
+        self.seqId = 0 # FIXME: New firmware ABIs shouldn't need that
     @override
     def open(self, stream):
         if self.stream:
             self.stream.close()
+        if self.framing:
+            import ez.repl.framing
+            stream = ez.repl.framing.FramedStream(stream, getattr(stream, 'maxPayload', None))
         self.stream = stream
     @override
+    def buffered(self) -> bool:
+        return self.framing and self.stream.buffered() > 0
+    @override
     def connected(self) -> bool:
         return self.stream != None
     @override
@@ -172,8 +339,10 @@ class Stream32(ez.repl.IOSerializer):
         msg.writeUInt32(tag)
         return msg
     @override
-    def receive(self) -> InboundMessage32:
+    def receive(self, streaming: bool = False) -> ez.repl.InboundMessage:
         assert self.endian != 'unknown', "Endianness undefined. Can only read single bytes."
+        if streaming:
+            return StreamingInboundMessage32(self)
         return InboundMessage32(self)
     def dumpMessage(self, banner: str, data: bytes, layout: List[int], indent: str = "  "):
         if self.verbose:
@@ -1,8 +1,8 @@
 import ez.repl
+import ez.util
 
 import socket
 from overrides import override
-from tcping import Ping
 from typing import Tuple
 
 class InvalidNetworkAddressException(Exception):
@@ -12,6 +12,8 @@ class NetworkAddressUnreachableException(Exception):
     pass
 
 class Transport(ez.repl.Transport):
+    maxPayload = 4096
+
     def __init__(self):
         self.conn = None
         self.hostname = None
@@ -30,6 +32,7 @@ class Transport(ez.repl.Transport):
 
     @classmethod
     def ping(cls, info: Tuple[str, int], timeout: int = 60):
+        from tcping import Ping
         try:
             hostname = info[0]
             port = info[1]
@@ -75,16 +78,40 @@ class Transport(ez.repl.Transport):
                 # We don't follow the advice from the docs to pass something
                 # like 4096. Instead, we abuse the parameter to receive exactly
                 # one message and keep our code simple.
-                batch = self.conn.recv(numBytesRemaining)
+                deadline = self.applyDeadline()
+                try:
+                    batch = self.conn.recv(numBytesRemaining)
+                except (socket.timeout, BlockingIOError):
+                    raise TimeoutError(deadline.message())
                 numBytesRemaining -= len(batch)
                 bytesReceived += batch
         except ValueError:
             raise ConnectionAbortedError(f"Lost connection to {self.hostname}:{self.port}")
         return bytesReceived
 
+    @override
+    def poll(self, timeout: float) -> bool:
+        import select
+        assert self.conn, "Not yet connected"
+        readable, _, _ = select.select([ self.conn ], [], [], timeout)
+        return len(readable) > 0
+
     def write(self, data: bytes):
         assert self.conn, "Not yet connected"
-        self.conn.send(data)
+        deadline = self.applyDeadline()
+        try:
+            self.conn.sendall(data)
+        except (socket.timeout, BlockingIOError):
+            raise TimeoutError(deadline.message())
+
+    # Blocking calls respect the active deadline of the calling thread, see
+    # ez.util.deadline()
+    def applyDeadline(self) -> ez.util.Deadline:
+        deadline = ez.util.activeDeadline()
+        timeout = deadline.remaining() if deadline else None
+        if timeout != self.conn.gettimeout():
+            self.conn.settimeout(timeout)
+        return deadline
 
     def close(self):
         assert self.conn, "Not yet connected"
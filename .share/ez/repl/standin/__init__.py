@@ -0,0 +1,312 @@
+import ez.repl
+import ez.repl.errorcode
+import ez.repl.framing
+import ez.repl.opcode
+
+from overrides import override
+from typing import Callable, Dict
+
+class StandinHandshakeFailedException(ez.repl.HandshakeFailedException):
+    def __init__(self, actual: bytes):
+        self.actualReceived = " ".join([f"{byte:02x}" for byte in actual])
+
+# Sequential reader for the body of a request message
+class Reader:
+    def __init__(self, data: bytes, endian: str):
+        self.data = data
+        self.endian = endian
+        self.pos = 0
+    def uint(self) -> int:
+        value = int.from_bytes(self.data[self.pos:self.pos + 8], self.endian)
+        self.pos += 8
+        return value
+    def blob(self) -> bytes:
+        length = self.uint()
+        value = bytes(self.data[self.pos:self.pos + length])
+        self.pos += length
+        return value
+    def string(self) -> str:
+        return self.blob().decode('ascii')
+
+class DeviceFault(Exception):
+    pass
+
+# Raise from emulated functions to keep the device busy, like code that runs
+# away. The call only returns once the host interrupts it.
+class Hang(Exception):
+    pass
+
+# Raised by reboot() to abort the current request without response
+class Reboot(Exception):
+    pass
+
+# Pure Python stand-in for a device firmware. It speaks the 0.0.5 wire protocol
+# (all numeric fields 64-bit wide) and answers requests synchronously, so that
+# host-side code can be tested and benchmarked without hardware or QEMU. Code
+# can't actually run here. Tests register Python functions at device addresses
+# instead and execute() calls them.
+class Firmware:
+    HANDSHAKE = bytes.fromhex("01 23 57 bd bd 57 23 01")
+    HEADER_SIZE = 32
+
+    def __init__(self, codeBufferAddr: int = 0x20000000,
+                 codeBufferSize: int = 0x8000, endian: str = 'little',
+                 framing: bool = False):
+        self.endian = endian
+        self.framing = framing
+        self.frames = bytearray() # Inbound frames that aren't complete yet
+        self.codeBufferAddr = codeBufferAddr
+        self.memory = bytearray(codeBufferSize)
+        self.outbound = bytearray()
+        self.inbound = bytearray()
+        self.functions: Dict[int, Callable] = {}
+        self.running = None # Address of a function that hangs
+        self.interruptible = True
+        self.handlers = {}
+        self.symbols = {}
+        addr = 0x1000
+        for symbol, handler in self.builtinEndpoints().items():
+            self.symbols[symbol] = addr
+            self.handlers[addr] = handler
+            addr += 0x10
+        self.symbols['__ez_clang_report_value'] = addr
+        # Endpoints that are announced in the Setup message. All others must
+        # be looked up by the host.
+        self.bootstrap = [ '__ez_clang_rpc_lookup' ]
+
+    def builtinEndpoints(self) -> Dict[str, Callable[[Reader], bytes]]:
+        return {
+            '__ez_clang_rpc_lookup': self.lookup,
+            '__ez_clang_rpc_commit': self.commit,
+            '__ez_clang_rpc_execute': self.execute,
+            '__ez_clang_rpc_mem_read_cstring': self.readCString,
+            '__ez_clang_rpc_mem_read_cstring_chunk': self.readCStringChunk,
+            '__ez_clang_rpc_mem_read': self.readMemory,
+        }
+
+    # Encoding helpers for response bodies
+    def uint(self, value: int) -> bytes:
+        return int.to_bytes(value, 8, self.endian)
+    def blob(self, data: bytes) -> bytes:
+        return self.uint(len(data)) + data
+    def string(self, value: str) -> bytes:
+        return self.blob(value.encode('ascii'))
+    def success(self, body: bytes = b'') -> bytes:
+        return bytes([ez.repl.errorcode.Success]) + body
+    def failure(self, message: str) -> bytes:
+        return bytes([ez.repl.errorcode.ErrorMessage]) + self.string(message)
+
+    def send(self, opcode: int, body: bytes, tag: int = 0):
+        size = self.HEADER_SIZE + len(body)
+        msg = self.uint(size) + self.uint(opcode) + self.uint(0) + self.uint(tag) + body
+        self.outbound += ez.repl.framing.frame(msg) if self.framing else msg
+
+    # Device reboots unexpectedly, e.g. from a watchdog or a fault handler. RAM
+    # contents are lost, pending output isn't.
+    def reboot(self):
+        self.memory[:] = bytes(len(self.memory))
+        self.running = None
+        self.inbound.clear()
+        self.boot()
+        raise Reboot()
+
+    # Device boots, sends the handshake sequence and the Setup message
+    def reset(self):
+        self.running = None
+        self.frames.clear()
+        self.inbound.clear()
+        self.outbound.clear()
+        self.boot()
+
+    def boot(self):
+        self.outbound += self.HANDSHAKE
+        body = self.string("standin") # Device version is deprecated
+        body += self.uint(self.codeBufferAddr) + self.uint(len(self.memory))
+        body += self.uint(len(self.bootstrap))
+        for symbol in self.bootstrap:
+            body += self.string(symbol) + self.uint(self.symbols[symbol])
+        self.send(ez.repl.opcode.Connect, body)
+
+    # Receive bytes from the host and process all complete messages
+    def receive(self, data: bytes):
+        if self.framing:
+            self.frames += data
+            data = self.unframe()
+        self.inbound += data
+        while len(self.inbound) >= 8:
+            size = int.from_bytes(self.inbound[:8], self.endian)
+            if len(self.inbound) < size:
+                return
+            msg = Reader(bytes(self.inbound[:size]), self.endian)
+            del self.inbound[:size]
+            _ = msg.uint()
+            opcode = msg.uint()
+            _ = msg.uint() # seqId
+            tag = msg.uint()
+            self.dispatch(opcode, tag, msg)
+
+    # The host doesn't corrupt frames, so we don't need to resynchronize here
+    def unframe(self) -> bytes:
+        from ez.repl.framing import HEADER_SIZE, TRAILER_SIZE
+        payload = bytearray()
+        while len(self.frames) >= HEADER_SIZE + TRAILER_SIZE:
+            if self.frames[:4] != ez.repl.framing.SYNC:
+                raise DeviceFault("Missing sync marker in inbound frame")
+            size = int.from_bytes(self.frames[4:8], 'little')
+            end = HEADER_SIZE + size
+            if len(self.frames) < end + TRAILER_SIZE:
+                break
+            frame = bytes(self.frames[:end + TRAILER_SIZE])
+            if ez.repl.framing.frame(frame[HEADER_SIZE:end]) != frame:
+                raise DeviceFault("Inbound frame has invalid CRC")
+            payload += frame[HEADER_SIZE:end]
+            del self.frames[:end + TRAILER_SIZE]
+        return payload
+
+    def dispatch(self, opcode: int, tag: int, msg: Reader):
+        if opcode == ez.repl.opcode.Disconnect:
+            self.send(ez.repl.opcode.Disconnect, self.success())
+        elif opcode == ez.repl.opcode.Call:
+            if not tag in self.handlers:
+                raise DeviceFault(f"Call to unknown endpoint address 0x{tag:08x}")
+            try:
+                response = self.handlers[tag](msg)
+            except Reboot:
+                return
+            if response is not None:
+                self.send(ez.repl.opcode.Return, response)
+        elif opcode == ez.repl.opcode.Interrupt:
+            if self.running and self.interruptible:
+                self.running = None
+                self.send(ez.repl.opcode.Return, self.failure("Execution interrupted"))
+        else:
+            raise DeviceFault("Unexpected opcode: " + ez.repl.opcode.name(opcode))
+
+    # Access to the code buffer, which is the only memory we have
+    def offset(self, addr: int, size: int) -> int:
+        offset = addr - self.codeBufferAddr
+        if offset < 0 or offset + size > len(self.memory):
+            raise DeviceFault(f"Access violation: 0x{addr:08x} ({size} bytes)")
+        return offset
+    def write(self, addr: int, data: bytes):
+        offset = self.offset(addr, len(data))
+        self.memory[offset:offset + len(data)] = data
+    def read(self, addr: int, size: int) -> bytes:
+        offset = self.offset(addr, size)
+        return bytes(self.memory[offset:offset + size])
+
+    # Messages that functions may send while they execute
+    def stdout(self, text: str):
+        self.send(ez.repl.opcode.StdOut, text.encode('ascii'))
+    def result(self, data: bytes):
+        self.send(ez.repl.opcode.Result, data)
+    def telemetry(self, streamId: int, samples: bytes):
+        self.send(ez.repl.opcode.Telemetry, self.uint(streamId) + samples)
+
+    def lookup(self, msg: Reader) -> bytes:
+        symbols = [msg.string() for _ in range(msg.uint())]
+        body = self.uint(len(symbols))
+        for symbol in symbols:
+            body += self.uint(self.symbols.get(symbol, 0))
+        return self.success(body)
+
+    def commit(self, msg: Reader) -> bytes:
+        try:
+            for _ in range(msg.uint()):
+                addr = msg.uint()
+                size = msg.uint()
+                data = msg.blob()
+                assert len(data) == size, "Segment size mismatch"
+                self.write(addr, data)
+        except DeviceFault as ex:
+            return self.failure(str(ex))
+        return self.success()
+
+    def execute(self, msg: Reader) -> bytes:
+        addr = msg.uint()
+        if addr in self.functions:
+            try:
+                self.functions[addr](self)
+            except Hang:
+                self.running = addr
+                return None # Return message is pending
+        return self.success()
+
+    # FIXME: Response has no leading error byte, see CStringResponseDecoder
+    def readCString(self, msg: Reader) -> bytes:
+        offset = self.offset(msg.uint(), 1)
+        end = self.memory.find(b'\x00', offset)
+        if end < 0:
+            raise DeviceFault("Unterminated string")
+        return self.blob(bytes(self.memory[offset:end]))
+
+    def readCStringChunk(self, msg: Reader) -> bytes:
+        addr = msg.uint()
+        max = msg.uint()
+        try:
+            offset = self.offset(addr, 1)
+        except DeviceFault as ex:
+            return self.failure(str(ex))
+        limit = min(offset + max, len(self.memory))
+        end = self.memory.find(b'\x00', offset, limit)
+        terminated = end >= 0
+        data = bytes(self.memory[offset:end if terminated else limit])
+        return self.success(self.blob(data) + bytes([terminated]))
+
+    def readMemory(self, msg: Reader) -> bytes:
+        addr = msg.uint()
+        size = msg.uint()
+        try:
+            return self.success(self.blob(self.read(addr, size)))
+        except DeviceFault as ex:
+            return self.failure(str(ex))
+
+# In-memory connection to a stand-in firmware. Implements the stream interface
+# that serializers expect, i.e. read(), write() and close().
+class Transport(ez.repl.Transport):
+    maxPayload = 1024
+
+    def __init__(self):
+        super().__init__()
+        self.firmware = None
+
+    @override(check_signature=False)
+    def reset(self, info: Firmware) -> Firmware:
+        self.firmware = info or self.firmware
+        self.firmware.reset()
+        return self.firmware
+
+    # Same as serial transports: the object we were reset with
+    @property
+    def info(self) -> Firmware:
+        return self.firmware
+
+    @override
+    def handshake(self):
+        token = Firmware.HANDSHAKE
+        actual = self.read(len(token))
+        if actual != token:
+            raise StandinHandshakeFailedException(actual)
+
+    @override
+    def finalize(self):
+        return self
+
+    @override
+    def poll(self, timeout: float) -> bool:
+        if len(self.firmware.outbound) == 0:
+            import time
+            time.sleep(timeout) # Nothing will come while we wait
+        return len(self.firmware.outbound) > 0
+
+    # There's no latency: data that isn't there now will never come
+    def read(self, size: int) -> bytes:
+        data = bytes(self.firmware.outbound[:size])
+        del self.firmware.outbound[:size]
+        return data
+
+    def write(self, data: bytes):
+        self.firmware.receive(data)
+
+    def close(self):
+        pass
@@ -70,6 +70,10 @@ class Transport(ez.repl.Transport):
             if minimum and size > minimum:
                 return size
 
+    @override
+    def poll(self, timeout: float) -> bool:
+        return len(self.inbound_pending) > 0 or len(self.inbound_poll.poll(timeout)) > 0
+
     def read(self, size: int) -> bytes:
         data = bytearray()
         missing = size - len(self.inbound_pending)
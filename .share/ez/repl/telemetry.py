@@ -0,0 +1,99 @@
+from typing import Dict
+
+from . import HostAPIException, InboundMessage
+
+# Binary sample streams from the device. Telemetry messages carry a stream ID
+# followed by raw samples in device byte order. Host code registers a dtype and
+# a capacity per stream ID and samples go into a preallocated NumPy ring buffer.
+# With streaming messages they are read from the transport straight into the
+# ring buffer memory.
+#
+# FIXME: In 0.0.5 protocol the stream ID is 64-bit wide like all numeric fields
+
+class RingBuffer:
+    def __init__(self, dtype, capacity: int):
+        try:
+            import numpy
+        except ImportError:
+            raise HostAPIException("Telemetry streams require NumPy")
+        self.samples = numpy.empty(capacity, dtype)
+        self.itemsize = self.samples.itemsize
+        self.head = 0 # Total number of samples received
+        self.tail = 0 # Total number of samples consumed
+        self.overruns = 0 # Samples dropped before they were consumed
+
+    def available(self) -> int:
+        return self.head - self.tail
+
+    def receive(self, msg: InboundMessage, size: int):
+        count = size // self.itemsize
+        capacity = len(self.samples)
+        items = [size] # Frame payload is a single layout item
+        if count > capacity:
+            # Only the last samples fit
+            msg.readRaw((count - capacity) * self.itemsize, items)
+            items = []
+            self.head += count - capacity
+            count = capacity
+        while count > 0:
+            start = self.head % capacity
+            end = min(start + count, capacity)
+            msg.readinto(self.samples[start:end], items)
+            items = []
+            self.head += end - start
+            count -= end - start
+        if self.head - self.tail > capacity:
+            self.overruns += self.head - self.tail - capacity
+            self.tail = self.head - capacity
+
+    # Consume up to max samples, oldest first. Returns a copy, because the
+    # ring buffer memory gets overwritten by later frames.
+    def read(self, max: int = None):
+        import numpy
+        count = self.available() if max is None else min(max, self.available())
+        capacity = len(self.samples)
+        start = self.tail % capacity
+        end = start + count
+        if end <= capacity:
+            result = self.samples[start:end].copy()
+        else:
+            result = numpy.concatenate((self.samples[start:], self.samples[:end - capacity]))
+        self.tail += count
+        return result
+
+class Telemetry:
+    def __init__(self):
+        self.streams: Dict[int, RingBuffer] = {}
+        self.endian = 'little'
+        self.dropped = 0 # Frames for unregistered stream IDs
+        self.malformed = 0 # Frames that are no multiple of the sample size
+
+    def register(self, streamId: int, dtype, capacity: int = 65536) -> RingBuffer:
+        import numpy
+        byteorder = '<' if self.endian == 'little' else '>'
+        self.streams[streamId] = RingBuffer(numpy.dtype(dtype).newbyteorder(byteorder), capacity)
+        return self.streams[streamId]
+
+    def unregister(self, streamId: int):
+        del self.streams[streamId]
+
+    def stream(self, streamId: int) -> RingBuffer:
+        if not streamId in self.streams:
+            raise HostAPIException(f"No telemetry stream registered with ID {streamId}")
+        return self.streams[streamId]
+
+    def active(self) -> bool:
+        return len(self.streams) > 0
+
+    def receive(self, msg: InboundMessage):
+        streamId = msg.readSize()
+        size = msg.size - msg.HEADER_SIZE - 8
+        if streamId in self.streams and size % self.streams[streamId].itemsize == 0:
+            self.streams[streamId].receive(msg, size)
+            return
+        # Consume the payload so the link stays in sync with the device
+        if streamId in self.streams:
+            self.malformed += 1
+        else:
+            self.dropped += 1
+        msg.readRaw(size, [size])
@@ -1,5 +1,4 @@
 from os import path, listdir
-from serial.tools.list_ports_linux import comports
 from ez.util.script import Script
 
 import ez.io
@@ -64,6 +63,7 @@ def pokeTeensy(id: str):
 
 # E.g. "/dev/ttyACM0"
 def scanSerialFindPort(port: str):
+  from serial.tools.list_ports_linux import comports
   infos = [dev for dev in comports() if dev.device == port]
   if len(infos) == 0:
     ez.io.error(f"Cannot open serial port: {port}")
@@ -81,12 +81,16 @@ def scanSerialFindPort(port: str):
 
 # E.g. "due"
 def scanSerialFindId(id: str):
+  from serial.tools.list_ports_linux import comports
   file = path.join(resourceDir(), id, "serial.py")
   if path.exists(file) and path.isfile(file):
     script = Script(file, f"{id}.serial")
-    for info in comports():
-      if script.accept(info):
-        return script
+    candidates = [info for info in comports() if script.accept(info)]
+    if len(candidates) > 1:
+      candidates = [selectSerialPort(id, candidates)]
+    if len(candidates) == 1:
+      script.accept(candidates[0]) # Last accept() call determines the port
+      return script
   # Special-case fallback for teensy devices
   if id == 'teensylc':
     pokeTeensy(id)
@@ -96,6 +100,93 @@ def scanSerialFindId(id: str):
   ez.io.error(f"Failed to find device ID: {id}")
   return None
 
+# Maximum time for a single port to answer the handshake when probing
+probeTimeout = 0.5
+
+# Pick one of multiple ports that accept the device ID. If none of them answers
+# the handshake, we fall back to the first one and let the script deal with it.
+def selectSerialPort(id: str, candidates: list):
+  info = probeSerialPorts(id, candidates)
+  if not info:
+    info = candidates[0]
+    ez.io.warning(f"No port answered the handshake, trying {info.device}")
+  return info
+
+# Run the handshake on all candidate ports concurrently and pick the first one
+# that answers. The result is cached and the next scan tries the last winner
+# alone first, so that we don't disturb the other boards if it still answers.
+# The cached ranking orders ports by the latency they had when they won.
+def probeSerialPorts(id: str, candidates: list):
+  import ez.util
+  cacheFile = path.join(ez.util.cacheDir('scan'), f"{id}.json")
+  cache = ez.util.loadJson(cacheFile, {})
+  last = [info for info in candidates if info.serial_number and
+                                         info.serial_number == cache.get('best')]
+  winner = probePorts(last) if len(last) > 0 else None
+  if not winner:
+    winner = probePorts([info for info in candidates if not info in last])
+  if not winner:
+    return None
+
+  info, latency = winner
+  others = [entry for entry in cache.get('ranking', [])
+                  if entry.get('serial_number') != info.serial_number]
+  ez.util.storeJson(cacheFile, {
+    'best': info.serial_number,
+    'ranking': sorted(others + [{ 'port': info.device, 'serial_number': info.serial_number,
+                                  'latency': latency }], key=lambda entry: entry['latency']),
+  })
+  ez.io.note(f"Selected port {info.device} ({latency * 1000:.0f}ms) " +
+             f"out of {len(candidates)} candidates")
+  return info
+
+# Returns the first port that answers the handshake and its latency or None if
+# none of them did. Only the winner gets a hangup. We don't wait for the other
+# ports: they are closed as soon as their handshake ends.
+def probePorts(infos: list):
+  from concurrent.futures import ThreadPoolExecutor, as_completed
+  import ez.repl
+  transports = [ez.repl.create(ez.repl.Transport) for _ in infos]
+  pool = ThreadPoolExecutor(len(infos))
+  probes = { pool.submit(probePort, info, transport): (info, transport)
+                                     for info, transport in zip(infos, transports) }
+  winner = None
+  try:
+    for probe in as_completed(probes):
+      if probe.result() is not None:
+        info, transport = probes.pop(probe)
+        winner = (info, probe.result())
+        break
+  finally:
+    for probe, (_, other) in probes.items():
+      probe.add_done_callback(lambda _, other=other: closePort(other))
+    pool.shutdown(wait=False)
+  if winner:
+    try:
+      # Get the device back into its initial state for the actual connection
+      ez.repl.create(ez.repl.Recovery).hangup(transport, 'little')
+    except Exception:
+      pass # The connection will tell
+    finally:
+      closePort(transport)
+  return winner
+
+# Returns the handshake latency or None if the port didn't answer
+def probePort(info, transport) -> float:
+  import time
+  transport.timeout = probeTimeout
+  start = time.monotonic()
+  try:
+    transport.reset(info)
+    transport.handshake()
+    return time.monotonic() - start
+  except Exception:
+    return None # Any failure disqualifies the port
+
+def closePort(transport):
+  if transport.stream:
+    transport.stream.close()
+
 # E.g. "due", "/dev/ttyACM0"
 def scanSerial(id: str, port: str):
   file = path.join(resourceDir(), id, "serial.py")
@@ -105,6 +196,7 @@ def scanSerial(id: str, port: str):
   if not path.isfile(file):
     ez.io.error(f"Path to serial connection script is not a file: {file}")
     return None
+  from serial.tools.list_ports_linux import comports
   infos = [dev for dev in comports() if dev.device == port]
   if len(infos) == 0:
     ez.io.error(f"Cannot open serial port: {port}")
@@ -1,22 +1,37 @@
-import signal
+import threading
+
 from contextlib import contextmanager
+from typing import List
 
 class ScopeGuardException(Exception):
     pass
 
+# Bound the execution time of a scope. Transports check the active deadline of
+# the calling thread on every read and write, so this works in any thread. The
+# main thread also gets a real-time interval timer as a backstop for code that
+# doesn't do any I/O. Scopes nest: the earliest deadline always wins.
 @contextmanager
-def timeout(seconds: int, caption: str):
-    if seconds is None:
-      yield
-    else:
-      def timeout_handler(signum, frame):
-          raise TimeoutError(f"{caption} cancelled after {seconds} seconds")
-      signal.signal(signal.SIGALRM, timeout_handler)
-      signal.alarm(seconds)
-      try:
-          yield
-      finally:
-          signal.alarm(0)
+def timeout(seconds: float, caption: str):
+    import signal
+    with deadline(seconds, caption) as scope:
+        if scope is None or threading.current_thread() is not threading.main_thread():
+            yield
+            return
+        scope.interrupts = True
+        def timeout_handler(signum, frame):
+            raise TimeoutError((activeDeadline(interrupts=True) or scope).message())
+        previous = signal.signal(signal.SIGALRM, timeout_handler)
+        earliest = activeDeadline(interrupts=True)
+        signal.setitimer(signal.ITIMER_REAL, max(earliest.remaining(), 1e-6))
+        try:
+            yield
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+            scope.interrupts = False
+            outer = activeDeadline(interrupts=True)
+            if outer:
+                signal.setitimer(signal.ITIMER_REAL, max(outer.remaining(), 1e-6))
 
 class ScopeGuard:
     def __init__(self, locked):
@@ -32,3 +47,81 @@ class ScopeGuard:
         else:
             self.locked = False
 
+# Per-user cache directory for data that is expensive to recompute, but safe to
+# drop at any time. Entries are versioned with the ez package.
+def cacheDir(*parts: str) -> str:
+    import ez
+    import os
+    root = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    path = os.path.join(root, 'ez-clang', ez.__version__, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def loadJson(file: str, default):
+    import json
+    try:
+        with open(file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default # Missing or corrupt files just miss the cache
+
+# Write to a temporary file and move it in place, so that concurrent readers
+# never see partial content.
+def storeJson(file: str, data):
+    import json
+    import os
+    import tempfile
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(file), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, file)
+    except OSError:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+# Point in time on the monotonic clock, after which an operation should give up
+class Deadline:
+    def __init__(self, seconds: float, caption: str = "Operation"):
+        import time
+        self.seconds = seconds
+        self.caption = caption
+        self.interrupts = False # Armed as timer in the main thread
+        self.end = time.monotonic() + seconds
+    def remaining(self) -> float:
+        import time
+        return max(0.0, self.end - time.monotonic())
+    def expired(self) -> bool:
+        return self.remaining() == 0.0
+    def message(self) -> str:
+        return f"{self.caption} cancelled after {self.seconds:g} seconds"
+    def check(self):
+        if self.expired():
+            raise TimeoutError(self.message())
+
+_deadlines = threading.local()
+
+def activeDeadlines() -> List[Deadline]:
+    if not hasattr(_deadlines, 'stack'):
+        _deadlines.stack = []
+    return _deadlines.stack
+
+# The earliest deadline of the calling thread or None
+def activeDeadline(interrupts: bool = False) -> Deadline:
+    stack = [d for d in activeDeadlines() if d.interrupts or not interrupts]
+    return min(stack, key=lambda d: d.end) if len(stack) > 0 else None
+
+# Make a deadline active for the calling thread within the scope. Nested
+# scopes can't extend outer ones.
+@contextmanager
+def deadline(seconds: float, caption: str):
+    if seconds is None:
+        yield None
+        return
+    scope = Deadline(seconds, caption)
+    stack = activeDeadlines()
+    stack.append(scope)
+    try:
+        yield scope
+    finally:
+        stack.remove(scope)
@@ -0,0 +1,188 @@
+import os
+import sys
+import time
+
+from pathlib import Path
+from serial.tools.list_ports_linux import SysFS, comports
+from typing import Callable, Dict, List, Tuple
+
+import ez.io
+import ez.util.test
+
+# Run the tests of a device type on all connected boards of that type. Each
+# board gets a worker process that is pinned to its serial number. inject
+# bindings and the locked device are per process. Test timeouts interrupt the
+# main thread of the worker via ez.util.timeout() and nested deadlines stay in
+# the thread that set them, so workers can run the regular test code.
+#
+# Tests go out longest-first based on the durations of earlier runs. Workers
+# pull the next test once they finished the previous one. Thus, a board that
+# drops out for a reflash doesn't hold up the others, and if its worker dies
+# its test goes back to the queue.
+def run(driver: str, accept: Callable[[SysFS], SysFS], tests: List[Path],
+        image: str, timeout: float, force: bool = False,
+        fingerprints: ez.util.test.Fingerprints = None) -> Tuple[List[Path], List[Path]]:
+    import multiprocessing
+    import multiprocessing.connection
+    boards = [info for info in comports() if accept(info)]
+    if len(boards) == 0:
+        raise RuntimeError("Failed to find compatible device")
+    print(f"Running on {len(boards)} boards: " +
+          ", ".join(f"{info.serial_number} ({info.device})" for info in boards))
+
+    deviceId = Path(driver).resolve().parent.parent.name
+    history = ez.util.test.History(deviceId)
+    pending = history.order(tests, 'longest-first')
+
+    # Each worker reports through a pipe of its own. A shared queue could stay
+    # locked if a worker dies while it writes. Once a worker is gone, its pipe
+    # signals EOF.
+    context = multiprocessing.get_context('spawn')
+    workers = {}
+    channels = {}
+    for info in boards:
+        tasks = context.Queue()
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=work, daemon=True,
+                                  args=(driver, accept, info.serial_number,
+                                        image, force, timeout, tasks, sender))
+        process.start()
+        sender.close()
+        workers[info.serial_number] = (process, tasks)
+        channels[receiver] = info.serial_number
+
+    passed = []
+    failed = []
+    inflight: Dict[str, Path] = {}
+    active = set(workers.keys())
+    # Workers without a test stay around until all tests are done. A test may
+    # go back to the queue if its board drops out.
+    idle: List[str] = []
+    def dispatch():
+        while len(pending) > 0 and len(idle) > 0:
+            serialNumber = idle.pop(0)
+            inflight[serialNumber] = pending.pop(0)
+            workers[serialNumber][1].put(inflight[serialNumber])
+    def dropout(serialNumber: str, reason: str):
+        if not serialNumber in active:
+            return
+        active.discard(serialNumber)
+        if serialNumber in idle:
+            idle.remove(serialNumber)
+        if serialNumber in inflight:
+            pending.insert(0, inflight.pop(serialNumber))
+        ez.io.warning(f"Board {serialNumber} dropped out{reason}")
+        dispatch()
+
+    try:
+        while len(passed) + len(failed) < len(tests) and len(active) > 0:
+            for channel in multiprocessing.connection.wait(list(channels.keys())):
+                serialNumber = channels[channel]
+                try:
+                    event = channel.recv()
+                except EOFError:
+                    # The worker died, put back its test
+                    del channels[channel]
+                    dropout(serialNumber, "")
+                    continue
+
+                kind = event[0]
+                if kind == 'done':
+                    _, test, ok, duration, output = event
+                    inflight.pop(serialNumber, None)
+                    reportTest(serialNumber, output)
+                    history.record(test, duration, ok,
+                                   fingerprints.get(test) if fingerprints else None)
+                    (passed if ok else failed).append(test)
+                elif kind == 'dropout':
+                    dropout(serialNumber, f": {event[1]}")
+                    continue
+                if kind in ('ready', 'done'):
+                    idle.append(serialNumber)
+                    dispatch()
+
+        # Tests that no board could run
+        for test in pending + list(inflight.values()):
+            ez.io.error(f"No board left to run test: {test}")
+            failed.append(test)
+    finally:
+        for process, tasks in workers.values():
+            tasks.put(None)
+        for process, _ in workers.values():
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for channel in channels.keys():
+            channel.close()
+        history.store()
+    return passed, failed
+
+def reportTest(serialNumber: str, output: str):
+    lines = output.rstrip('\n').split('\n')
+    lines[0] += f" [{serialNumber}]"
+    sys.stdout.write("\n".join(lines) + "\n")
+    sys.stdout.flush()
+
+# Worker entry point: runs in a spawned process
+def work(driver: str, accept: Callable[[SysFS], SysFS], serialNumber: str,
+         image: str, force: bool, timeout: float, tasks, events):
+    import importlib.util
+    import inject
+    import ez.repl
+    import ez.util.firmware
+
+    # Driver scripts register their test recovery when imported. Their main
+    # section doesn't run under a different module name.
+    spec = importlib.util.spec_from_file_location('ez_farm_driver', driver)
+    spec.loader.exec_module(importlib.util.module_from_spec(spec))
+    firmware = ez.util.firmware.FirmwareManager()
+    ez.util.test.sessionScope = 'worker' # Tests from all categories come in
+
+    def prepare(force: bool = False) -> SysFS:
+        with ez.util.test.capture_tool_output():
+            info = lockBoard(accept, serialNumber)
+            inject.instance(ez.repl.Transport).reset(info)
+            if image:
+                info = firmware.ensure(image, force)
+        return info
+
+    try:
+        info = prepare(force)
+    except Exception as ex:
+        events.send(('dropout', str(ex)))
+        return
+
+    events.send(('ready',))
+    while True:
+        test = tasks.get()
+        if test is None:
+            ez.util.test.close_shared_session()
+            return
+        ez.repl.register({})
+        start = time.time()
+        with ez.util.test.capture_tool_output() as output:
+            ok = ez.util.test.run(test, timeout)
+        duration = time.time() - start
+        events.send(('done', test, ok, duration,
+                     output['stdout']() + output['stderr']()))
+        try:
+            # Failed tests may leave the board in a bad state
+            if ok:
+                info = getattr(inject.instance(ez.repl.Transport), 'info', None) or info
+            else:
+                info = prepare()
+            if info.serial_number != serialNumber:
+                raise RuntimeError("Connected device changed")
+        except Exception as ex:
+            events.send(('dropout', str(ex)))
+            return
+
+# Like ez.util.test.lock_device() but for a given board
+def lockBoard(accept: Callable[[SysFS], SysFS], serialNumber: str) -> SysFS:
+    for info in comports():
+        if info.serial_number == serialNumber:
+            wrapped = accept(info)
+            if wrapped:
+                ez.util.test._testDeviceInfo = info # Tests may lock_device() again
+                return wrapped
+    raise RuntimeError(f"Failed to find board {serialNumber}")
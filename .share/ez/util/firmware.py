@@ -0,0 +1,91 @@
+import inject
+import os
+import time
+
+from typing import Any, Dict
+
+import ez.io
+import ez.repl
+import ez.util
+
+# Remembers the image that was flashed to each device last, keyed by the serial
+# number of the board. Uploads take tens of seconds, but test drivers replace
+# the firmware at start-up and after each failed test. If the image didn't
+# change and the device still answers the handshake, we can skip the upload.
+#
+# The version string in the Setup message is deprecated and images carry no
+# build ID, so we compare content hashes on the host.
+class FirmwareManager:
+    def __init__(self, file: str = None):
+        self.file = file or os.path.join(ez.util.cacheDir('firmware'), 'flashed.json')
+        self.uploads = 0
+        self.skipped = 0
+
+    @staticmethod
+    def imageHash(image: str) -> str:
+        import hashlib
+        digest = hashlib.sha256()
+        with open(image, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    # Other drivers may share the file, so don't hold records in memory
+    def records(self) -> Dict[str, Dict[str, Any]]:
+        return ez.util.loadJson(self.file, {})
+
+    def isFlashed(self, serialNumber: str, image: str) -> bool:
+        record = self.records().get(serialNumber)
+        return record is not None and record.get('sha256') == self.imageHash(image)
+
+    def recordFlashed(self, serialNumber: str, image: str):
+        records = self.records()
+        records[serialNumber] = {
+            'image': str(image),
+            'sha256': self.imageHash(image),
+            'time': time.time(),
+        }
+        ez.util.storeJson(self.file, records)
+
+    def forget(self, serialNumber: str):
+        records = self.records()
+        if records.pop(serialNumber, None) is not None:
+            ez.util.storeJson(self.file, records)
+
+    # Reconnect and check that the firmware on the device is still responsive.
+    # Hang up afterwards, so the next connection finds it in its initial state.
+    @inject.params(recovery=ez.repl.Recovery, transport=ez.repl.Transport)
+    def probe(self, endian: str = 'little', recovery: ez.repl.Recovery = None,
+              transport: ez.repl.Transport = None) -> bool:
+        try:
+            transport.reset(transport.info)
+            transport.handshake()
+            recovery.hangup(transport, endian)
+            return True
+        except (ez.repl.HandshakeFailedException, ez.repl.DeviceABIException,
+                ez.repl.DeviceProtocolException, ez.repl.OperationFailedException,
+                OSError):
+            return False # Serial exceptions derive from OSError
+
+    # Upload the image unless the device runs it already. Returns the new
+    # transport info like Recovery.replaceDeviceFirmware() does.
+    @inject.params(recovery=ez.repl.Recovery, transport=ez.repl.Transport)
+    def ensure(self, image: str, force: bool = False, endian: str = 'little',
+               recovery: ez.repl.Recovery = None,
+               transport: ez.repl.Transport = None) -> Any:
+        serialNumber = getattr(transport.info, 'serial_number', None)
+        if serialNumber and not force and self.isFlashed(serialNumber, image):
+            if self.probe(endian):
+                ez.io.note("Firmware on device is up-to-date, skip upload")
+                self.skipped += 1
+                return transport.info
+
+        # Don't trust the record if the upload fails halfway
+        if serialNumber:
+            self.forget(serialNumber)
+        info = recovery.replaceDeviceFirmware(image)
+        self.uploads += 1
+        serialNumber = getattr(info, 'serial_number', None) or serialNumber
+        if serialNumber:
+            self.recordFlashed(serialNumber, image)
+        return info
@@ -0,0 +1,189 @@
+import os
+import sys
+import time
+
+from typing import Any, Callable, List, Tuple
+
+import ez.io
+
+# Upload firmware to many boards at once. Each board is flashed in a process of
+# its own: the device script registers its components with inject and these
+# are global per process. Thus, workers are isolated from each other and from
+# the caller, and a failure on one board doesn't affect the others.
+#
+#   results = ez.util.flash.run([ ('due', None), ('teensylc', 'firmware.hex') ])
+#   ez.util.flash.reportResults(results)
+#
+# Jobs without an image get the bundled firmware of the device. Same from the
+# command line:
+#
+#   python3 -m ez.util.flash due teensylc=firmware.hex
+
+# teensy_loader_cli can't select a board. Flash them one after the other, so
+# the loader doesn't pick up another board that's in bootloader mode.
+SEQUENTIAL = [ 'teensylc' ]
+
+class Board:
+    def __init__(self, deviceId: str, info: Any, image: str):
+        self.deviceId = deviceId
+        self.info = info
+        self.image = image
+        self.index = 0 # Position in the caller's list, workers get copies
+    def __str__(self) -> str:
+        return f"{self.deviceId} {self.info.serial_number}"
+
+class Result:
+    def __init__(self, board: Board, image: str, port: str, duration: float,
+                 error: str = None):
+        self.board = board
+        self.image = image
+        self.port = port
+        self.duration = duration
+        self.error = error
+    def ok(self) -> bool:
+        return self.error is None
+
+# Find all connected boards for the given jobs. The device's serial script
+# decides which ports belong to it, like in ez.scan.
+def discover(jobs: List[Tuple[str, str]]) -> List[Board]:
+    from serial.tools.list_ports_linux import comports
+    import ez.scan
+    from ez.util.script import Script
+    boards = []
+    for deviceId, image in jobs:
+        file = os.path.join(ez.scan.resourceDir(), deviceId, "serial.py")
+        if not os.path.isfile(file):
+            ez.io.error(f"Cannot find script for serial connection: {file}")
+            continue
+        script = Script(file, f"{deviceId}.serial")
+        found = [Board(deviceId, script.acceptedInfo, image)
+                 for info in comports() if script.accept(info)]
+        if len(found) == 0:
+            ez.io.warning(f"No connected board for device ID: {deviceId}")
+        boards += found
+    return boards
+
+def run(jobs: List[Tuple[str, str]], workers: int = None,
+        progress: Callable[[Board, str], None] = None) -> List[Result]:
+    return flash(discover(jobs), workers, progress)
+
+# Workers import device scripts as {deviceId}.serial from the resource dir
+def flash(boards: List[Board], workers: int = None,
+          progress: Callable[[Board, str], None] = None,
+          resdir: str = None) -> List[Result]:
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+    import ez.scan
+    progress = progress or (lambda board, text: ez.io.note(f"[{board}] {text}"))
+    for idx, board in enumerate(boards):
+        board.index = idx
+    groups = [[b] for b in boards if b.deviceId not in SEQUENTIAL]
+    for deviceId in SEQUENTIAL:
+        sequential = [b for b in boards if b.deviceId == deviceId]
+        groups += [sequential] if len(sequential) > 0 else []
+
+    # Fresh interpreters, so workers don't inherit the caller's components
+    context = multiprocessing.get_context('spawn')
+    resdir = str(resdir or ez.scan.resourceDir())
+    with context.Manager() as manager:
+        events = manager.Queue()
+        with ProcessPoolExecutor(workers or len(groups) or 1, context) as pool:
+            pending = [pool.submit(flashGroup, group, resdir, events) for group in groups]
+            results = []
+            while len(pending) > 0:
+                done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                forwardEvents(events, boards, progress)
+                for future in done:
+                    results += future.result()
+            forwardEvents(events, boards, progress)
+    return sorted(results, key=lambda r: r.board.index)
+
+def forwardEvents(events, boards: List[Board], progress: Callable[[Board, str], None]):
+    import queue
+    while True:
+        try:
+            idx, text = events.get_nowait()
+        except queue.Empty:
+            return
+        progress(boards[idx], text)
+
+# Worker entry point: runs in a spawned process
+def flashGroup(group: List[Board], resdir: str, events) -> List[Result]:
+    if not resdir in sys.path:
+        sys.path.append(resdir)
+    return [flashBoard(board, events) for board in group]
+
+def flashBoard(board: Board, events) -> Result:
+    import importlib
+    import inject
+    import ez.repl
+
+    def report(kind, messages: Tuple[object]):
+        events.put((board.index, " ".join(str(msg) for msg in messages)))
+    ez.io._write_output = report
+
+    start = time.monotonic()
+    image = board.image
+    port = board.info.device
+    try:
+        importlib.import_module(f"{board.deviceId}.serial") # Registers components
+        inject.instance(ez.repl.Transport).reset(board.info)
+        recovery = inject.instance(ez.repl.Recovery)
+        image = image or recovery.bundledFirmware()
+        if not os.path.exists(image):
+            raise FileNotFoundError(f"Firmware image doesn't exist: {image}")
+        info = recovery.replaceDeviceFirmware(image)
+        port = getattr(info, 'device', port)
+        report('note', ("Done",))
+        return Result(board, image, port, time.monotonic() - start)
+    except Exception as ex:
+        error = str(ex) or type(ex).__name__
+        report('error', ("Failed: " + error.splitlines()[0],))
+        return Result(board, image, port, time.monotonic() - start, error)
+
+def reportResults(results: List[Result]):
+    rows = [("Device", "Serial number", "Port", "Time", "Result")]
+    for r in results:
+        outcome = "OK" if r.ok() else "FAILED: " + r.error.splitlines()[0]
+        rows.append((r.board.deviceId, str(r.board.info.serial_number), r.port,
+                     f"{r.duration:.2f}s", outcome))
+    widths = [max(len(row[col]) for row in rows) for col in range(4)]
+    print()
+    for row in rows:
+        print("  ".join(cell.ljust(w) for cell, w in zip(row, widths)) + "  " + row[4])
+    failed = len([r for r in results if not r.ok()])
+    print(f"\nFlashed {len(results) - failed} out of {len(results)} boards")
+
+# E.g. "due" or "teensylc=firmware.hex"
+def parseJob(arg: str) -> Tuple[str, str]:
+    deviceId, _, image = arg.partition('=')
+    return deviceId, os.path.abspath(image) if image else None
+
+def parseCommandLineArgs(args: List[str] = None):
+    from argparse import ArgumentParser
+    parser = ArgumentParser(prog="python3 -m ez.util.flash",
+            description="Upload firmware to all connected boards of the given device types")
+    parser.add_argument("jobs",
+            help="Device ID with optional firmware image, default is the bundled firmware",
+            metavar="DEVICE[=IMAGE]", type=parseJob, nargs="+")
+    parser.add_argument("--workers",
+            help="Maximum number of boards to flash in parallel",
+            type=int, default=None)
+    return parser.parse_args(args)
+
+# Exit code is non-zero if any board failed or none was found
+def main(args: List[str] = None) -> int:
+    args = parseCommandLineArgs(args)
+    results = run(args.jobs, args.workers)
+    if len(results) == 0:
+        ez.io.error("No boards to flash")
+        return 1
+    reportResults(results)
+    return 0 if all(r.ok() for r in results) else 1
+
+# Workers pickle boards and results, so run the functions of the imported
+# module and not those of __main__
+if __name__ == '__main__':
+    import ez.util.flash
+    sys.exit(ez.util.flash.main())
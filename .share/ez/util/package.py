@@ -1,11 +1,11 @@
 
 import os.path
-import re
 import sys
-import subprocess
 
 from abc import abstractmethod
-from typing import List
+from typing import List, Tuple
+
+import ez.util
 
 def unique(items: List[str]):
     return list(dict.fromkeys(items)) # dict is insertion-ordered
@@ -18,12 +18,86 @@ def splitPaths(output: str, line_sep: str) -> str:
 class CompilerPackage():
     def __init__(self, path: str):
         self.bin = path
+    # Identifies the exact compiler binary: resolved path, mtime and size
+    def fingerprint(self) -> Tuple[str, int, int]:
+        path = os.path.realpath(self.bin)
+        stat = os.stat(path)
+        return path, stat.st_mtime_ns, stat.st_size
+    # Cached wrapper for queryHeaderSearchPaths()
+    def parseHeaderSearchPaths(self, extraArgs: List[str]) -> List[str]:
+        return self.parseHeaderSearchPathsForEach([extraArgs])[0]
+    # Look up header search paths for multiple sets of flags. Cache misses are
+    # queried from the compiler concurrently.
+    def parseHeaderSearchPathsForEach(self, flagSets: List[List[str]]) -> List[List[str]]:
+        cache = headerSearchPathsCache()
+        results = [cache.get(self, flags) for flags in flagSets]
+        missing = [idx for idx, paths in enumerate(results) if paths is None]
+        if len(missing) == 1:
+            results[missing[0]] = self.queryHeaderSearchPaths(flagSets[missing[0]])
+        elif len(missing) > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+                queried = executor.map(self.queryHeaderSearchPaths,
+                                       [flagSets[idx] for idx in missing])
+                for idx, paths in zip(missing, queried):
+                    results[idx] = paths
+        if len(missing) > 0:
+            cache.put(self, [(flagSets[idx], results[idx]) for idx in missing])
+        return [list(paths) for paths in results]
     @abstractmethod
-    def parseHeaderSearchPaths(self, extraArgs: List[str]):
+    def queryHeaderSearchPaths(self, extraArgs: List[str]) -> List[str]:
         pass
 
+# On-disk cache for compiler queries. Entries are stored per compiler binary and
+# dropped once the binary changes on disk. Layout:
+#   { "<realpath>": { "mtime": int, "size": int, "queries": { "<json args>": [...] } } }
+class CompilerQueryCache():
+    def __init__(self, file: str):
+        self.file = file
+        self.entries = None
+        import threading
+        self.lock = threading.Lock()
+    def load(self) -> dict:
+        if self.entries is None:
+            self.entries = ez.util.loadJson(self.file, {})
+        return self.entries
+    # Unambiguous for arguments that contain spaces
+    @staticmethod
+    def key(args: List[str]) -> str:
+        import json
+        return json.dumps(args)
+    def get(self, compiler: CompilerPackage, args: List[str]):
+        path, mtime, size = compiler.fingerprint()
+        with self.lock:
+            entry = self.load().get(path)
+            if not entry or entry['mtime'] != mtime or entry['size'] != size:
+                return None
+            return entry['queries'].get(self.key(args))
+    # Store a batch of (args, result) pairs with a single write
+    def put(self, compiler: CompilerPackage, queries: List[Tuple[List[str], List[str]]]):
+        path, mtime, size = compiler.fingerprint()
+        with self.lock:
+            entries = self.load()
+            entry = entries.get(path)
+            if not entry or entry['mtime'] != mtime or entry['size'] != size:
+                entry = { 'mtime': mtime, 'size': size, 'queries': {} }
+                entries[path] = entry
+            for args, paths in queries:
+                entry['queries'][self.key(args)] = paths
+            ez.util.storeJson(self.file, entries)
+
+_headerSearchPathsCache = None
+def headerSearchPathsCache() -> CompilerQueryCache:
+    global _headerSearchPathsCache
+    if not _headerSearchPathsCache:
+        file = os.path.join(ez.util.cacheDir(), 'header-search-paths.json')
+        _headerSearchPathsCache = CompilerQueryCache(file)
+    return _headerSearchPathsCache
+
 class GCCPackage(CompilerPackage):
-    def parseHeaderSearchPaths(self, extraArgs: List[str]) -> List[str]:
+    def queryHeaderSearchPaths(self, extraArgs: List[str]) -> List[str]:
+        import re
+        import subprocess
         command = [self.bin, '-xc++', '-E', '-v', '/dev/null'] + extraArgs
         try:
             byteOutput = subprocess.check_output(command, stderr=subprocess.STDOUT, timeout=3)
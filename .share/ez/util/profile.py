@@ -0,0 +1,150 @@
+import os.path
+import time
+
+from concurrent.futures import Future
+from typing import Callable, List
+
+import ez.io
+import ez.util
+import ez.util.package
+import ez_clang_api
+
+# Device properties that make up the resolved compiler configuration. Code
+# buffer and endpoints are specific to the connection and come with the Setup
+# message. They are not part of the profile.
+SCALAR_PROPERTIES = [ 'triple', 'cpu', 'page_size', 'default_alignment' ]
+LIST_PROPERTIES = [ 'flags', 'header_search_paths', 'archive_search_paths' ]
+
+# Bump whenever the snapshot format or the set of properties changes
+VERSION = 2
+
+# The profile is valid as long as the inputs for the build function don't
+# change: firmware features, debug mode, toolchain and the script itself. The
+# libraries that the build function resolves are checked separately, see
+# searchPathStamps().
+def fingerprint(deviceId: str, device: ez_clang_api.Device,
+                toolchain: List[ez.util.package.CompilerPackage],
+                build: Callable[[], None], script: str = None) -> str:
+    import hashlib
+    import json
+    script = script or build.__code__.co_filename
+    stat = os.stat(script) if os.path.exists(script) else None
+    inputs = [
+        VERSION, deviceId,
+        getattr(device, 'debug', None), getattr(device, 'features', None),
+        [ list(tool.fingerprint()) for tool in toolchain ],
+        [ script, stat.st_mtime_ns, stat.st_size ] if stat else script,
+    ]
+    return hashlib.sha1(json.dumps(inputs).encode()).hexdigest()
+
+# Resolved search paths and their mtimes. Updating a toolchain or library
+# package, e.g. framework-arduino-sam for the Due, replaces its directories.
+def searchPathStamps(props: dict) -> List[list]:
+    stamps = []
+    for path in props['header_search_paths'] + props['archive_search_paths']:
+        stat = os.stat(path) if os.path.exists(path) else None
+        stamps.append([ path, stat.st_mtime_ns if stat else None ])
+    return stamps
+
+# Snapshots for other fingerprints of the device are outdated
+def prune(deviceId: str, keep: str):
+    import re
+    dir = os.path.dirname(keep)
+    pattern = re.compile(re.escape(deviceId) + r"-[0-9a-f]{16}\.json")
+    for name in os.listdir(dir):
+        if pattern.fullmatch(name) and name != os.path.basename(keep):
+            try:
+                os.unlink(os.path.join(dir, name))
+            except OSError:
+                pass # Another process got there first
+
+def capture(device: ez_clang_api.Device) -> dict:
+    props = { name: getattr(device, name) for name in SCALAR_PROPERTIES }
+    props.update({ name: list(getattr(device, name)) for name in LIST_PROPERTIES })
+    return props
+
+# List properties may hold entries from before the build. Only record what the
+# build function appended.
+def delta(before: dict, after: dict) -> dict:
+    props = { name: after[name] for name in SCALAR_PROPERTIES }
+    for name in LIST_PROPERTIES:
+        assert after[name][:len(before[name])] == before[name], \
+               f"Profile build must only append to property '{name}'"
+        props[name] = after[name][len(before[name]):]
+    return props
+
+def restore(device: ez_clang_api.Device, props: dict):
+    for name in SCALAR_PROPERTIES:
+        if props[name] is not None:
+            setattr(device, name, props[name])
+    for name in LIST_PROPERTIES:
+        setattr(device, name, getattr(device, name) + props[name])
+
+# Configure the device from a snapshot of its resolved configuration. If there
+# is no valid snapshot, run the build function on the device and record one.
+# Load and build times are only reported in verbose mode.
+def load(deviceId: str, device: ez_clang_api.Device,
+         toolchain: List[ez.util.package.CompilerPackage],
+         build: Callable[[], None], script: str = None, verbose: bool = False) -> bool:
+    key = fingerprint(deviceId, device, toolchain, build, script)
+    file = os.path.join(ez.util.cacheDir('profiles'), f"{deviceId}-{key[:16]}.json")
+
+    start = time.perf_counter()
+    snapshot = ez.util.loadJson(file, None)
+    if snapshot and snapshot.get('version') == VERSION and snapshot.get('fingerprint') == key \
+                and snapshot.get('searchPaths') == searchPathStamps(snapshot['properties']):
+        restore(device, snapshot['properties'])
+        duration = time.perf_counter() - start
+        if verbose:
+            ez.io.debug(f"Loaded device profile {deviceId} in {duration * 1000:.1f}ms " +
+                        f"(build took {snapshot['buildTime'] * 1000:.1f}ms)")
+        return True
+
+    before = capture(device)
+    build()
+    duration = time.perf_counter() - start
+    props = delta(before, capture(device))
+    ez.util.storeJson(file, {
+        'version': VERSION,
+        'fingerprint': key,
+        'searchPaths': searchPathStamps(props),
+        'buildTime': duration,
+        'properties': props,
+    })
+    prune(deviceId, file)
+    if verbose:
+        ez.io.debug(f"Built device profile {deviceId} in {duration * 1000:.1f}ms")
+    return False
+
+# Plain-data stand-in for the device that build functions can run against on
+# a worker thread. ez_clang_api.Device comes from the host and scripts can't
+# rely on creating instances of it. Scalars that the build didn't set stay None.
+class Properties:
+    def __init__(self, debug: bool = None, features: List[str] = None):
+        self.debug = debug
+        self.features = list(features or [])
+        for name in SCALAR_PROPERTIES:
+            setattr(self, name, None)
+        for name in LIST_PROPERTIES:
+            setattr(self, name, [])
+
+# Resolve the configuration on a worker thread, e.g. while the host handshakes
+# with the device. Toolchain lookup and build function record into Properties,
+# so the actual device is only touched on the caller's thread. Pass the result
+# to restore(). Exceptions are raised from the future's result().
+def loadAsync(deviceId: str, device: ez_clang_api.Device,
+              toolchain: Callable[[], List[ez.util.package.CompilerPackage]],
+              build: Callable[..., None], verbose: bool = False) -> Future:
+    from concurrent.futures import ThreadPoolExecutor
+    props = Properties(getattr(device, 'debug', None), getattr(device, 'features', []))
+
+    def resolve() -> dict:
+        tools = toolchain()
+        load(deviceId, props, tools, lambda: build(props, *tools),
+             build.__code__.co_filename, verbose)
+        return capture(props)
+
+    pool = ThreadPoolExecutor(1, thread_name_prefix=f"ez-profile-{deviceId}")
+    future = pool.submit(resolve)
+    pool.shutdown(wait=False)
+    return future
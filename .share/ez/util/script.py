@@ -1,5 +1,7 @@
 import ez_clang_api
 
+from concurrent.futures import Future
+
 class ContextSwitch:
     def __init__(self, inner):
         self.outer_context = None
@@ -30,6 +32,9 @@ class Script:
             self.acceptedInfo = self.api['accept'](info)
             return True if self.acceptedInfo else False
     def connect(self, ez_clang: ez_clang_api.Host) -> bool:
+        self.awaitConnect()
+        return self.runConnect(ez_clang)
+    def runConnect(self, ez_clang: ez_clang_api.Host) -> bool:
         with self.script_context:
             device = ez_clang_api.Device()
             stream = self.api['connect'](self.acceptedInfo, ez_clang, device)
@@ -37,12 +42,32 @@ class Script:
                 return False
             return self.api['setup'](stream, ez_clang, device)
     def disconnect(self) -> bool:
+        self.awaitConnect()
         with self.script_context:
             return self.api['disconnect']()
     def call(self, endpoint: str, input: dict) -> dict:
+        self.awaitConnect()
         with self.script_context:
             return self.api['call'](endpoint, input)
 
+    # Run connect() on a background thread, so that the host can initialize in
+    # the meantime. The context switch isn't thread-safe: other calls into the
+    # script wait until the connection is ready.
+    def connectAsync(self, ez_clang: ez_clang_api.Host) -> Future:
+        from concurrent.futures import ThreadPoolExecutor
+        self.awaitConnect()
+        pool = ThreadPoolExecutor(1, thread_name_prefix="ez-connect")
+        self.pendingConnect = pool.submit(self.runConnect, ez_clang)
+        pool.shutdown(wait=False)
+        return self.pendingConnect
+
+    # Errors go to the owner of the future
+    def awaitConnect(self):
+        if self.pendingConnect:
+            pending = self.pendingConnect
+            self.pendingConnect = None
+            pending.exception()
+
     def __init__(self, path: str, module: str):
         with open(path) as script:
             code = script.read()
@@ -66,3 +91,4 @@ class Script:
 
         # Will store the wrapped connectivity info that matches this script
         self.acceptedInfo = None
+        self.pendingConnect: Future = None
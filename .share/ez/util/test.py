@@ -1,24 +1,26 @@
 import os
-import re
 import sys
+import time
 
-from argparse import *
 from contextlib import contextmanager
 from io import StringIO
 from pathlib import Path
 from serial.tools.list_ports_linux import SysFS, comports
-from typing import Callable, List, Pattern, Tuple
+from typing import Any, Callable, Dict, List, Pattern, Tuple
 
 import ez.io
 import ez.util
 
 def regex_case_insensitive(arg) -> Pattern:
+    import re
+    from argparse import ArgumentError
     try:
         return re.compile(arg, re.IGNORECASE)
     except re.error as reason:
         raise ArgumentError(arg, "Invalid regular expression: " + reason)
 
 def parseCommandLineArgs():
+    from argparse import ArgumentParser
     parser = ArgumentParser()
     parser.add_argument("--connect",
             help="Serial port of target device",
@@ -29,9 +31,22 @@ def parseCommandLineArgs():
     parser.add_argument("--no-firmware",
             help="Don't upload a new firmware image to the target device",
             action="store_true", default=False)
+    parser.add_argument("--force-firmware",
+            help="Upload the firmware image even if the device runs it already",
+            action="store_true", default=False)
+    parser.add_argument("--farm",
+            help="Run tests in parallel on all connected boards of the device type",
+            action="store_true", default=False)
+    parser.add_argument("--force",
+            help="Run tests that passed before with the same inputs",
+            action="store_true", default=False)
+    parser.add_argument("--order",
+            help="Order of test execution based on results from earlier runs",
+            choices=["failures-first", "longest-first", "path"],
+            default="failures-first")
     parser.add_argument("--timeout",
-            help="Maximum duration for running a single test",
-            type=int, default=30)
+            help="Maximum duration in seconds for running a single test",
+            type=float, default=30)
     parser.add_argument("--filter",
             metavar="REGEX",
             type=regex_case_insensitive,
@@ -53,6 +68,24 @@ def add_module_roots(test_file: str):
     if not test_root in sys.path:
         sys.path.append(test_root)
 
+# Import the given module in a fresh interpreter with -X importtime and return
+# the cumulative import time in seconds for each module that got loaded. The
+# first run only warms up the bytecode cache.
+def import_times(module: str) -> Dict[str, float]:
+    import subprocess
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    cmd = [sys.executable, '-X', 'importtime', '-c', f"import {module}"]
+    for _ in range(2):
+        result = subprocess.run(cmd, env=env, capture_output=True, check=True, text=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative) / 1e6
+    return times
+
 def categories(root: Path) -> List[Path]:
     return [d for d in root.iterdir() if d.is_dir() and not d.is_symlink()]
 
@@ -71,12 +104,239 @@ def discover(categories: List[Path]) -> Tuple[List[Path], List[Path]]:
     disabled.sort(key=lambda path: str(path.resolve()))
     return tests, disabled
 
+# Durations and outcomes of earlier test runs. They determine the order of
+# tests: failures first for quick feedback during development, longest first
+# to balance parallel runs. Keys are paths relative to the device directory,
+# so that checkouts can share the file.
+class History:
+    keep = 10 # Durations per test
+    # A pass counts as regression if it's that much slower than the median
+    regressionFactor = 1.5
+    regressionMinimum = 0.1 # Seconds, avoid noise from very short tests
+
+    def __init__(self, deviceId: str):
+        self.file = os.path.join(ez.util.cacheDir('tests'), f"{deviceId}.json")
+        self.entries: Dict[str, dict] = ez.util.loadJson(self.file, {})
+        self.regressions: List[Tuple[Path, float, float]] = []
+
+    @staticmethod
+    def key(test: Path) -> str:
+        test = test.resolve()
+        return str(test.relative_to(test.parent.parent.parent))
+
+    def entry(self, test: Path) -> dict:
+        return self.entries.get(self.key(test), {})
+
+    def duration(self, test: Path, default: float = None) -> float:
+        durations = sorted(self.entry(test).get('durations', []))
+        return durations[len(durations) // 2] if len(durations) > 0 else default
+
+    def failed(self, test: Path) -> bool:
+        return self.entry(test).get('passed') == False
+
+    # Failed tests are cut short, only passes have meaningful durations
+    def record(self, test: Path, duration: float, passed: bool = True,
+               fingerprint: str = None) -> float:
+        entry = self.entries.setdefault(self.key(test), {})
+        baseline = self.duration(test)
+        entry['passed'] = passed
+        entry['time'] = time.time()
+        entry['fingerprint'] = fingerprint if passed else None
+        if not passed:
+            return None
+        entry['durations'] = (entry.get('durations', []) + [duration])[-self.keep:]
+        if baseline is not None and duration > baseline * self.regressionFactor and \
+           duration - baseline > self.regressionMinimum:
+            self.regressions.append((test, baseline, duration))
+            return baseline
+        return None
+
+    def order(self, tests: List[Path], mode: str) -> List[Path]:
+        if mode == 'failures-first':
+            return sorted(tests, key=lambda t: not self.failed(t)) # Stable
+        if mode == 'longest-first':
+            return sorted(tests, key=lambda t: self.duration(t, 0.0), reverse=True)
+        return tests
+
+    def fingerprint(self, test: Path) -> str:
+        return self.entry(test).get('fingerprint')
+
+    # Tests that passed in their last run with the same inputs
+    def unchanged(self, tests: List[Path], fingerprints: 'Fingerprints') -> List[Path]:
+        return [t for t in tests if not self.failed(t) and
+                self.fingerprint(t) is not None and
+                self.fingerprint(t) == fingerprints.get(t)]
+
+    def store(self):
+        ez.util.storeJson(self.file, self.entries)
+
+# Hash the inputs of a test: its own code, all modules from the resource
+# directory that it imports directly or indirectly, and the given files that
+# every test depends on, like the test driver, device script and firmware
+# image. Imports are collected statically, including the ones inside of
+# functions. Paths are relative to the resource directory.
+class Fingerprints:
+    def __init__(self, inputs: List[str]):
+        import ez.scan
+        self.resdir = ez.scan.resourceDir()
+        self.roots = [ self.resdir, self.resdir / '.share' ]
+        self.hashes: Dict[Path, str] = {}
+        self.imports: Dict[Path, List[Path]] = {}
+        self.common = self.closure([Path(f).resolve() for f in inputs])
+
+    def get(self, test: Path) -> str:
+        import hashlib
+        digest = hashlib.sha256()
+        files = self.common | self.closure([test.resolve()])
+        for file in sorted(files):
+            name = file.relative_to(self.resdir) if self.resdir in file.parents else file.name
+            digest.update(f"{name}:{self.hash(file)}\n".encode())
+        return digest.hexdigest()
+
+    def hash(self, file: Path) -> str:
+        if not file in self.hashes:
+            import hashlib
+            self.hashes[file] = hashlib.sha256(file.read_bytes()).hexdigest() \
+                                if file.is_file() else "missing"
+        return self.hashes[file]
+
+    def closure(self, files: List[Path]) -> set:
+        visited = set()
+        pending = list(files)
+        while len(pending) > 0:
+            file = pending.pop()
+            if not file in visited:
+                visited.add(file)
+                if file.suffix == '.py' and file.is_file():
+                    pending += self.dependencies(file)
+        return visited
+
+    def dependencies(self, file: Path) -> List[Path]:
+        if not file in self.imports:
+            import ast
+            names = []
+            package = self.moduleName(file).split('.')
+            package = package[:-1] if file.name != '__init__.py' else package
+            for node in ast.walk(ast.parse(file.read_bytes(), str(file))):
+                if isinstance(node, ast.Import):
+                    names += [alias.name for alias in node.names]
+                elif isinstance(node, ast.ImportFrom):
+                    base = package[:len(package) - node.level + 1] if node.level > 0 else []
+                    module = ".".join(base + ([node.module] if node.module else []))
+                    names.append(module)
+                    names += [f"{module}.{alias.name}" for alias in node.names]
+            self.imports[file] = [f for name in names for f in self.moduleFiles(name)]
+        return self.imports[file]
+
+    def moduleName(self, file: Path) -> str:
+        for root in self.roots:
+            if root in file.parents:
+                return ".".join(file.relative_to(root).with_suffix('').parts)
+        return file.stem
+
+    # Importing a module executes the packages it's nested in
+    def moduleFiles(self, name: str) -> List[Path]:
+        files = []
+        parts = name.split('.')
+        for idx in range(1, len(parts) + 1):
+            for root in self.roots:
+                path = root.joinpath(*parts[:idx])
+                for file in [ path.with_suffix('.py'), path / '__init__.py' ]:
+                    if file.is_file():
+                        files.append(file)
+        return files
+
 def select(discovered: List[Path], include: Pattern, exclude: Pattern) -> List[Path]:
     return [t for t in discovered if
         include.search(str(t.resolve())) and not
         exclude.search(str(t.resolve()))]
 
-def run(test: Path, timeout: int) -> bool:
+# Live session that consecutive tests can share instead of connecting on their
+# own, so they don't pay for handshake and Setup decode each time. Tests opt in
+# with the directive below on a line of its own and get the session from
+# shared_session(). It's checked before each handout and replaced if it doesn't
+# answer. It's closed when a test fails, when a test runs that doesn't share it
+# and when its scope ends: after each category or, for 'worker' scope, at the
+# end of the run.
+SHARED_SESSION = "# ez-test: shared-session"
+sessionScope = 'category'
+healthCheckTimeout = 1.0
+sharedSessionStats = { 'connects': 0, 'handouts': 0 }
+_sharedSession = None
+_sharedSessionScript = None
+_sharedSessionScope = None
+_sharedSessionCategory = None
+_currentCategory = None
+
+def shares_session(code: str) -> bool:
+    return SHARED_SESSION in code.splitlines()
+
+# Connect through the device script's own connect() and setup(), so the shared
+# session gets the script's stream settings, flags and profile just like in a
+# regular test. Tests keep using the script's call() afterwards. The accept
+# function returns the info to connect to, e.g. from lock_device(). It's only
+# called when there's no healthy session. A request from another script
+# replaces the session.
+def shared_session(script: Any, accept: Callable[[], Any],
+                   host: Callable[[], Any] = None) -> 'ez.repl.Session':
+    global _sharedSession, _sharedSessionScript, _sharedSessionScope, _sharedSessionCategory
+    import contextlib
+    import inject
+    import ez.repl
+    if _sharedSession and _sharedSessionScript is not script:
+        close_shared_session()
+    if _sharedSession and not session_healthy(_sharedSession):
+        ez.io.note("Shared session didn't answer, reconnecting")
+        close_shared_session()
+    if not _sharedSession:
+        import ez_clang_api
+        # Own components for this thread, so they survive ez.repl.register()
+        # between tests and recovery finds the ones the script connected with
+        components = [ ez.repl.Session, ez.repl.Transport, ez.repl.Recovery,
+                       ez.repl.IOSerializer ]
+        _sharedSessionScope = contextlib.ExitStack()
+        _sharedSessionScope.enter_context(
+            ez.repl.scope({ c: ez.repl.create(c) for c in components }))
+        host = (host or ez_clang_api.Host)()
+        device = ez_clang_api.Device()
+        try:
+            stream = script.connect(accept(), host, device)
+            script.setup(stream, host, device)
+        except:
+            _sharedSessionScope.close()
+            raise
+        _sharedSession = inject.instance(ez.repl.Session)
+        _sharedSessionScript = script
+        _sharedSessionCategory = _currentCategory
+        sharedSessionStats['connects'] += 1
+    sharedSessionStats['handouts'] += 1
+    return _sharedSession
+
+def session_healthy(session: 'ez.repl.Session') -> bool:
+    try:
+        with ez.util.deadline(healthCheckTimeout, "Session health check"):
+            response = session.call('lookup', { '__ez_clang_report_value': 0 })
+        return response['__ez_clang_report_value'] != 0
+    except Exception:
+        return False
+
+def close_shared_session():
+    global _sharedSession, _sharedSessionScript, _sharedSessionScope
+    if _sharedSession:
+        try:
+            with capture_tool_output():
+                _sharedSessionScript.disconnect()
+        except Exception as ex:
+            ez.io.warning(f"Failed to disconnect shared session: {ex}")
+        finally:
+            _sharedSessionScope.close()
+    _sharedSession = None
+    _sharedSessionScript = None
+    _sharedSessionScope = None
+
+def run(test: Path, timeout: float, history: History = None,
+        fingerprints: Fingerprints = None) -> bool:
+    global _currentCategory
     name = test.stem.strip('0123456789-')
     category = test.parent.name.strip('0123456789-')
     head = f"  [{category}] {name}"
@@ -84,10 +344,15 @@ def run(test: Path, timeout: int) -> bool:
     sys.stdout.flush()
 
     path_str = str(test.resolve())
-    with open(path_str) as test:
-        code = test.read()
+    with open(path_str) as file:
+        code = file.read()
+    fingerprint = fingerprints.get(test) if fingerprints else None
+
+    _currentCategory = test.parent.resolve()
+    if not shares_session(code) or \
+       (sessionScope == 'category' and _sharedSessionCategory != _currentCategory):
+        close_shared_session()
 
-    import time
     test_start = time.time()
     try:
         with ez.util.timeout(timeout, "Test execution"):
@@ -95,11 +360,16 @@ def run(test: Path, timeout: int) -> bool:
                 exec(compile(code, path_str, 'exec'), { '__file__': path_str })
     except:
         reportFailure(path_str, output['stdout'](), output['stderr']())
+        close_shared_session() # The device might be in a bad state
+        if history:
+            history.record(test, time.time() - test_start, False)
         return False
 
     duration = time.time() - test_start
     dots = max(0, 60 - len(head) - 2)
-    sys.stdout.write(f" {'.'*dots} {duration:.2f}s\n")
+    baseline = history.record(test, duration, True, fingerprint) if history else None
+    regression = f" (regressed from {baseline:.2f}s)" if baseline else ""
+    sys.stdout.write(f" {'.'*dots} {duration:.2f}s{regression}\n")
     sys.stdout.flush()
     return True
 
@@ -119,13 +389,22 @@ def reportFailure(path: str, stdout: str, stderr: str):
     sys.stderr.write(  "********************\n")
     sys.stdout.flush()
 
-def reportResults(discovered: int, disabled: int, selected: int, passed: int, failed: int, duration: int):
+def reportResults(discovered: int, disabled: int, selected: int, passed: int, failed: int, duration: int,
+                  history: History = None, skipped: int = 0):
+    if history and len(history.regressions) > 0:
+        print("\nRegressed tests:")
+        for test, baseline, actual in history.regressions:
+            print(f"  {History.key(test)}: {baseline:.2f}s -> {actual:.2f}s")
+    if sharedSessionStats['handouts'] > 0:
+        print(f"\nShared session: {sharedSessionStats['handouts']} handouts, " +
+              f"{sharedSessionStats['connects']} connects")
     print(f"\nTesting Time: {duration:.2f}s")
     print(f"  Disabled: {disabled}")
     print(f"  Excluded: {discovered - selected}")
+    print(f"  Skipped : {skipped}")
     print(f"  Failed  : {failed}")
     print(f"  Passed  : {passed}")
-    print("\nSUCCESS" if selected == passed else "\nFAILED")
+    print("\nSUCCESS" if selected == passed + skipped else "\nFAILED")
 
 _testDeviceInfo = None
 def lock_device(accept: Callable[[SysFS], bool], initialPort: SysFS = None) -> SysFS:
@@ -152,6 +431,101 @@ def lock_device(accept: Callable[[SysFS], bool], initialPort: SysFS = None) -> S
                     return wrappedInfo
         raise RuntimeError("Failed to find compatible device")
 
+# Main section of test drivers for boards on serial ports. Drivers register
+# their test recovery with inject and pass the module of their device script,
+# which provides accept() for the ports of its boards. Returns True if all
+# selected tests passed or were skipped.
+def runDeviceTests(driver: str, device: Any, recovery: 'ez.repl.Recovery' = None) -> bool:
+    import inject
+    import ez.repl
+    import ez.util.firmware
+    start = time.time()
+    args = parseCommandLineArgs()
+    recovery = recovery or inject.instance(ez.repl.Recovery)
+
+    # Discover and select test cases
+    root = Path(os.path.dirname(driver))
+    print("Running tests from", root.resolve())
+    enabled, disabled = discover(categories(root))
+    selected = select(enabled, args.filter, args.filter_out)
+    print(f"Selecting {len(selected)} out of {len(enabled + disabled)} discovered tests")
+
+    # Order by outcomes and durations of earlier runs
+    history = History(root.resolve().parent.name)
+    selected = history.order(selected, args.order)
+
+    # Skip tests that passed before with the same inputs. Without an upload we
+    # don't know the firmware on the device, so all tests run.
+    image = None
+    fingerprints = None
+    skipped = []
+    if not args.no_firmware:
+        image = args.firmware or recovery.bundledFirmware()
+        fingerprints = Fingerprints([driver, device.__file__, image])
+        if not args.force:
+            skipped = history.unchanged(selected, fingerprints)
+    if len(skipped) > 0:
+        print(f"Skipping {len(skipped)} tests that passed before with the same inputs")
+
+    # Shard tests across all connected boards of this type
+    if args.farm:
+        import ez.util.farm
+        if image:
+            print("Firmware under test:", Path(image).resolve())
+        pending = [t for t in selected if not t in skipped]
+        passed, failed = ez.util.farm.run(driver, device.accept, pending, image,
+                                          args.timeout, args.force_firmware, fingerprints)
+        duration = time.time() - start
+        reportResults(len(enabled), len(disabled), len(selected), len(passed),
+                      len(failed), duration, None, len(skipped))
+        return len(failed) == 0
+
+    info = lock_device(device.accept, args.connect)
+
+    # Remember UID and check between tests to make sure we stick to one device
+    deviceUID = info.serial_number
+    print(f"Device unique identifier: {deviceUID}")
+
+    # Wire up transport, so we can reset the firmware
+    inject.instance(ez.repl.Transport).reset(info)
+
+    # Override and upload firmware under test, unless it's on the device already.
+    # Recoveries that support it use the custom image for auto-recovery too.
+    firmware = ez.util.firmware.FirmwareManager()
+    if not args.no_firmware:
+        if args.firmware and hasattr(recovery, 'setCustomFirmware'):
+            recovery.setCustomFirmware(args.firmware)
+        print("Firmware under test:", Path(image).resolve())
+        with capture_tool_output():
+            info = firmware.ensure(image, args.force_firmware)
+
+    # Run actual tests one by one
+    passed = []
+    failed = []
+    try:
+        for path in selected:
+            if path in skipped:
+                continue
+            ez.repl.register({})
+            if run(path, args.timeout, history, fingerprints):
+                passed.append(path)
+                info = inject.instance(ez.repl.Transport).info or info # Shared sessions don't use it
+            else:
+                failed.append(path)
+                if not args.no_firmware:
+                    with capture_tool_output():
+                        info = lock_device(device.accept, args.connect)
+                        inject.instance(ez.repl.Transport).reset(info)
+                        info = firmware.ensure(image)
+            assert deviceUID == info.serial_number, "Connected device changed"
+    finally:
+        close_shared_session()
+        history.store()
+        duration = time.time() - start
+        reportResults(len(enabled), len(disabled), len(selected), len(passed),
+                      len(failed), duration, history, len(skipped))
+    return len(failed) == 0
+
 _testSocketInfo = None
 def lock_socket(accept: Callable[[str], bool], networkAddress: str) -> Tuple[str, int]:
     global _testSocketInfo
@@ -16,6 +16,7 @@ import ez.repl.serial
 import ez.repl.serialize
 import ez.util
 import ez.util.package
+import ez.util.profile
 
 from overrides import override
 from serial.tools.list_ports_linux import SysFS
@@ -25,8 +26,8 @@ class MetroTransport(ez.repl.serial.Transport):
     def handshake(self):
         assert self.stream, "Connect serial stream first"
         magic = "01 23 57 bd bd 57 23 01"
-        with ez.util.timeout(self.timeout, "Connect attempt"):
-            self.stream.write(bytes.fromhex(magic))
+        with ez.util.deadline(self.timeout, "Connect attempt"):
+            self.write(bytes.fromhex(magic))
         try:
             self.awaitToken(bytes.fromhex(magic))
         except ez.repl.HandshakeFailedException as ex:
@@ -55,14 +56,9 @@ class MetroRecovery(ez.repl.serial.Recovery):
             raise ez.repl.ReplaceFirmwareException(ex.returncode, cmd,
                                                    ex.output.decode())
 
-        # FIXME: Make sure the device finished booting before sending more data.
-        #
-        # This looks like a bug. It appeared first time, when the long-blink
-        # was introduced as the reboot inidicator. This blocks the Arduino
-        # setup() function for a bit.
-        #
-        # If the delay here is shorter than the boot time, the handshake
-        # sequence gets duplicated into the new stream somehow:
+        # The device may still be booting when the port reappears. If we send
+        # data too early, the handshake sequence gets duplicated into the new
+        # stream somehow:
         #
         #   ez.repl.OperationFailedException: Disconnect failed.
         #   Message header invalid. All values must be in 32-bit range.
@@ -72,13 +68,10 @@ class MetroRecovery(ez.repl.serial.Recovery):
         #     SeqID:   20 00 00 00 00 00 00 00
         #     TagAddr: 01 00 00 00 00 00 00 00
         #
-        # Not sure why it happens or how to prevent it. The delay workaround is
-        # annoying, but it works for now. TeensyLC shows the same symptom,
-        # Arduino Due doesn't.
-        from time import sleep
-        sleep(3)
-
-        return transport.awaitReconnect()
+        # It appeared first time, when the long-blink was introduced as the
+        # reboot indicator, which blocks the Arduino setup() function for a bit.
+        # Instead of a fixed delay, probe until the device completes a session.
+        return self.awaitBootReady()
 
 ez.repl.register({
     ez.repl.Recovery: lambda: MetroRecovery(),
@@ -95,48 +88,56 @@ def accept(info: SysFS) -> SysFS:
             return info
     return None
 
+_session: ez.repl.Session = None
+_profile = None # Future for the device profile, see setup()
+
 @inject.params(session=ez.repl.Session, stream=ez.repl.IOSerializer)
 def connect(info: SysFS, host: ez_clang_api.Host, m0: ez_clang_api.Device,
             session: ez.repl.Session, stream: ez.repl.serialize.Stream32
             ) -> ez.repl.IOSerializer:
+    global _session
+    _session = session
     session.host = host # FIXME: formatExpressionResult()
     m0.name = session.deviceId
     m0.transport = info.device + " -> Adafruit Metro M0" # TODO: Rename property to 'description' or so
     stream.endian = 'little'
     stream.verbose = 'rpc_bytes' in host.verbose()
+
+    # TODO: Include debug/release build and built-in features in setup message
+    m0.debug = True
+    m0.features = [ "-lc" ]
+
+    # Resolved configuration only changes with features and toolchain. Extract
+    # default paths from the reference compiler while we handshake.
+    global _profile
+    _profile = ez.util.profile.loadAsync(session.deviceId, m0,
+        lambda: [ ez.util.package.findCompiler("toolchain-gccarmnoneeabi@1.70201.0") ], configure,
+        verbose=len(host.verbose()) > 0)
+
     stream.open(session.connect(info))
     return stream
 
 @inject.params(session=ez.repl.Session)
 def setup(stream: ez.repl.IOSerializer, host: ez_clang_api.Host,
           m0: ez_clang_api.Device, session: ez.repl.Session):
-    # Read setup message
-    setup = ez.repl.endpoints.SetupMessageDecoder(stream.receive())
+    # Read setup message and relocate bootstrap endpoints
+    setup = session.setup(stream.receive())
 
     # Start configuring device
     m0.setCodeBuffer(setup.codeBufferAddr, setup.codeBufferSize)
-    for symbol in setup.endpoints:
-        if not session.relocateEndpoint(symbol, setup.endpoints[symbol]):
-            ez.io.warning(f"No endpoint for bootstrap function {symbol} " +
-                          f"(0x{setup.endpoints[symbol]:08x})")
 
-    if session.endpoints['lookup'].addr == 0:
-        raise ez.repl.DeviceProtocolException("Missing bootstrap symbol " +
-                                              session.endpoints['lookup'].symbol)
+    # Configuration was resolved in the background since connect()
+    ez.util.profile.restore(m0, _profile.result())
 
-    # TODO: Include debug/release build and built-in features in setup message
-    m0.debug = True
-    m0.features = [ "-lc" ]
+    return host.addDevice(m0)
 
+def configure(m0: ez_clang_api.Device, gcc: ez.util.package.CompilerPackage):
     # Hardware specific infos can be hardcoded
     m0.triple = "arm-none-eabi"
     m0.cpu = "cortex-m0plus"
     m0.page_size = 256
     m0.default_alignment = 32
 
-    # Extract default paths from the reference compiler
-    gcc = ez.util.package.findCompiler("toolchain-gccarmnoneeabi@1.70201.0")
-
     # If the firmware has libc builtin, we need matching includes
     if "-lc" in m0.features:
         m0.header_search_paths += gcc.parseHeaderSearchPaths(["-mcpu=cortex-m0plus"])
@@ -157,12 +158,10 @@ def setup(stream: ez.repl.IOSerializer, host: ez_clang_api.Host,
         "-DF_CPU=84000000L",
     ]
 
-    return host.addDevice(m0)
-
-@inject.params(session=ez.repl.Session)
-def call(endpoint: str, data: dict, session: ez.repl.Session) -> dict:
-    return session.call(endpoint, data)
+def call(endpoint: str, data: dict, timeout: float = None) -> dict:
+    return _session.call(endpoint, data, timeout)
 
-@inject.params(session=ez.repl.Session)
-def disconnect(session: ez.repl.Session):
-    return session.disconnect()
+def disconnect():
+    global _session
+    session, _session = _session, None
+    return session.disconnect() if session else True
@@ -16,6 +16,7 @@ import ez.repl.serial
 import ez.repl.serialize
 import ez.util
 import ez.util.package
+import ez.util.profile
 
 from serial.tools.list_ports_linux import SysFS
 
@@ -68,48 +69,58 @@ def accept(info: SysFS) -> SysFS:
             return info
     return None
 
+# Session of the current connection. RPCs go there directly and don't pay for
+# injector lookups.
+_session: ez.repl.Session = None
+_profile = None # Future for the device profile, see setup()
+
 @inject.params(session=ez.repl.Session, stream=ez.repl.IOSerializer)
 def connect(info: SysFS, host: ez_clang_api.Host, due: ez_clang_api.Device,
             session: ez.repl.Session, stream: ez.repl.serialize.Stream32
             ) -> ez.repl.IOSerializer:
+    global _session
+    _session = session
     session.host = host # FIXME: formatExpressionResult()
     due.name = session.deviceId
     due.transport = info.device + " -> Arduino Due" # TODO: Rename property to 'description' or so
     stream.endian = 'little'
     stream.verbose = 'rpc_bytes' in host.verbose()
+
+    # TODO: Include debug/release build and built-in features in setup message
+    due.debug = True
+    due.features = [ "-lc", "framework-arduino-sam" ]
+
+    # Resolved configuration only changes with features and toolchain. Extract
+    # default paths from the reference compiler while we handshake.
+    global _profile
+    _profile = ez.util.profile.loadAsync(session.deviceId, due,
+        lambda: [ ez.util.package.findCompiler("toolchain-gccarmnoneeabi@1.70201.0") ], configure,
+        verbose=len(host.verbose()) > 0)
+
     stream.open(session.connect(info))
     return stream
 
 @inject.params(session=ez.repl.Session)
 def setup(stream: ez.repl.IOSerializer, host: ez_clang_api.Host,
           due: ez_clang_api.Device, session: ez.repl.Session):
-    # Read setup message
-    setup = ez.repl.endpoints.SetupMessageDecoder(stream.receive())
+    # Read setup message and relocate bootstrap endpoints
+    setup = session.setup(stream.receive())
 
     # Start configuring device
     due.setCodeBuffer(setup.codeBufferAddr, setup.codeBufferSize)
-    for symbol in setup.endpoints:
-        if not session.relocateEndpoint(symbol, setup.endpoints[symbol]):
-            ez.io.warning(f"No endpoint for bootstrap function {symbol} " +
-                          f"(0x{setup.endpoints[symbol]:08x})")
 
-    if session.endpoints['lookup'].addr == 0:
-        raise ez.repl.DeviceProtocolException("Missing bootstrap symbol " +
-                                              session.endpoints['lookup'].symbol)
+    # Configuration was resolved in the background since connect()
+    ez.util.profile.restore(due, _profile.result())
 
-    # TODO: Include debug/release build and built-in features in setup message
-    due.debug = True
-    due.features = [ "-lc", "framework-arduino-sam" ]
+    return host.addDevice(due)
 
+def configure(due: ez_clang_api.Device, gcc: ez.util.package.CompilerPackage):
     # Hardware specific infos can be hardcoded
     due.triple = "arm-none-eabi"
     due.cpu = "cortex-m3"
     due.page_size = 256
     due.default_alignment = 32
 
-    # Extract default paths from the reference compiler
-    gcc = ez.util.package.findCompiler("toolchain-gccarmnoneeabi@1.70201.0")
-
     # If the firmware has libc builtin, we need matching includes
     if "-lc" in due.features:
         due.header_search_paths += gcc.parseHeaderSearchPaths(["-mcpu=cortex-m3"])
@@ -135,12 +146,10 @@ def setup(stream: ez.repl.IOSerializer, host: ez_clang_api.Host,
         "-DF_CPU=84000000L",
     ]
 
-    return host.addDevice(due)
-
-@inject.params(session=ez.repl.Session)
-def call(endpoint: str, data: dict, session: ez.repl.Session) -> dict:
-    return session.call(endpoint, data)
+def call(endpoint: str, data: dict, timeout: float = None) -> dict:
+    return _session.call(endpoint, data, timeout)
 
-@inject.params(session=ez.repl.Session)
-def disconnect(session: ez.repl.Session):
-    return session.disconnect()
+def disconnect():
+    global _session
+    session, _session = _session, None
+    return session.disconnect() if session else True
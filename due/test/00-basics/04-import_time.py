@@ -0,0 +1,14 @@
+# Test import time of the device script, which ez-clang loads before the first
+# prompt. Modules for rarely taken paths must be imported lazily.
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+times = ez.util.test.import_times('due.serial')
+for module in ['argparse', 'debugpy', 'subprocess', 'tcping']:
+    assert module not in times, f"Module {module} should not load on connect path"
+
+# Budget covers inject, overrides and pyserial. Bump with care.
+budget = 0.25
+assert times['due.serial'] < budget, \
+    f"Import time {times['due.serial']:.3f}s exceeds budget of {budget:.3f}s"
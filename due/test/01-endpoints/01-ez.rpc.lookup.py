@@ -1,16 +1,11 @@
 # Test device response for calls to the lookup endpoint
+# ez-test: shared-session
 
 import ez.util.test
 ez.util.test.add_module_roots(__file__)
 
 import due.serial
-info = ez.util.test.lock_device(due.serial.accept)
-
-import ez_clang_api
-device = ez_clang_api.Device()
-host = ez_clang_api.Host()
-stream = due.serial.connect(info, host, device)
-due.serial.setup(stream, host, device)
+ez.util.test.shared_session(due.serial, lambda: ez.util.test.lock_device(due.serial.accept))
 
 import time
 for _ in range(3):
@@ -34,5 +29,3 @@ for _ in range(3):
     assert response[symbol2] == 0, "Failure should return a NULL address"
     
     time.sleep(1)
-
-due.serial.disconnect()
@@ -17,6 +17,7 @@ import ez.repl.subprocess
 import ez.repl.serialize
 import ez.util
 import ez.util.package
+import ez.util.profile
 
 class LM3S811Transport(ez.repl.subprocess.Transport):
     @override
@@ -79,48 +80,56 @@ def accept(id: str, recovery: LM3S811Recovery):
         return recovery.bundledFirmware()
     return None
 
+_session: ez.repl.Session = None
+_profile = None # Future for the device profile, see setup()
+
 @inject.params(session=ez.repl.Session, stream=ez.repl.IOSerializer)
 def connect(firmware: str, host: ez_clang_api.Host,
             lm3s811: ez_clang_api.Device, session: ez.repl.Session,
             stream: ez.repl.serialize.Stream32) -> ez.repl.IOSerializer:
+    global _session
+    _session = session
     session.host = host # FIXME: formatExpressionResult()
     lm3s811.name = session.deviceId
     lm3s811.transport = "qemu -> lm3s811" # TODO: Rename property to 'description' or so
     stream.endian = 'little'
     stream.verbose = 'rpc_bytes' in host.verbose()
+
+    # TODO: Include debug/release build and built-in features in setup message
+    lm3s811.debug = True
+    lm3s811.features = [ "-lc" ]
+
+    # Resolved configuration only changes with features and toolchain. Extract
+    # default paths from the reference compiler while we handshake.
+    global _profile
+    _profile = ez.util.profile.loadAsync(session.deviceId, lm3s811,
+        lambda: [ ez.util.package.findCompiler("toolchain-gccarmnoneeabi") ], configure,
+        verbose=len(host.verbose()) > 0)
+
     stream.open(session.connect(firmware))
     return stream
 
 @inject.params(session=ez.repl.Session)
 def setup(stream: ez.repl.IOSerializer, host: ez_clang_api.Host,
           lm3s811: ez_clang_api.Device, session: ez.repl.Session):
-    # Read setup message
-    setup = ez.repl.endpoints.SetupMessageDecoder(stream.receive())
+    # Read setup message and relocate bootstrap endpoints
+    setup = session.setup(stream.receive())
 
     # Start configuring device
     lm3s811.setCodeBuffer(setup.codeBufferAddr, setup.codeBufferSize)
-    for symbol in setup.endpoints:
-        if not session.relocateEndpoint(symbol, setup.endpoints[symbol]):
-            ez.io.warning(f"No endpoint for bootstrap function {symbol} " +
-                          f"(0x{setup.endpoints[symbol]:08x})")
 
-    if session.endpoints['lookup'].addr == 0:
-        raise ez.repl.DeviceProtocolException("Missing bootstrap symbol " +
-                                              session.endpoints['lookup'].symbol)
+    # Configuration was resolved in the background since connect()
+    ez.util.profile.restore(lm3s811, _profile.result())
 
-    # TODO: Include debug/release build and built-in features in setup message
-    lm3s811.debug = True
-    lm3s811.features = [ "-lc" ]
+    return host.addDevice(lm3s811)
 
+def configure(lm3s811: ez_clang_api.Device, gcc: ez.util.package.CompilerPackage):
     # Hardware specific infos can be hardcoded
     lm3s811.triple = "arm-none-eabi"
     lm3s811.cpu = "cortex-m3"
     lm3s811.page_size = 64
     lm3s811.default_alignment = 16
 
-    # Extract default paths from the reference compiler
-    gcc = ez.util.package.findCompiler("toolchain-gccarmnoneeabi")
-
     # If the firmware has libc builtin, we need matching includes
     if "-lc" in lm3s811.features:
         lm3s811.header_search_paths += gcc.parseHeaderSearchPaths(["-mcpu=cortex-m3"])
@@ -134,14 +143,14 @@ def setup(stream: ez.repl.IOSerializer, host: ez_clang_api.Host,
                        "-fno-threadsafe-statics" ]
     lm3s811.flags += [ "-DDEBUG" ] if lm3s811.debug else [ "-DNDEBUG" ]
 
-    return host.addDevice(lm3s811)
-
-@inject.params(session=ez.repl.Session)
-def call(endpoint: str, data: dict, session: ez.repl.Session) -> dict:
-    return session.call(endpoint, data)
+def call(endpoint: str, data: dict, timeout: float = None) -> dict:
+    return _session.call(endpoint, data, timeout)
 
-@inject.params(session=ez.repl.Session, transport=ez.repl.Transport)
-def disconnect(session: ez.repl.Session, transport: LM3S811Transport):
+def disconnect():
+    global _session
+    session, _session = _session, None
+    if not session:
+        return True
     res = session.disconnect()
-    transport.shutdown()
+    session.transport.shutdown()
     return res
@@ -1,16 +1,11 @@
 # Test device response for calls to the lookup endpoint
+# ez-test: shared-session
 
 import ez.util.test
 ez.util.test.add_module_roots(__file__)
 
 import lm3s811.qemu
-firmware = lm3s811.qemu.accept('lm3s811')
-
-import ez_clang_api
-testHost = ez_clang_api.Host()
-testDevice = ez_clang_api.Device()
-stream = lm3s811.qemu.connect(firmware, ez_clang_api.Host(), ez_clang_api.Device())
-lm3s811.qemu.setup(stream, testHost, testDevice)
+ez.util.test.shared_session(lm3s811.qemu, lambda: lm3s811.qemu.accept('lm3s811'))
 
 for _ in range(3):
     # Lookup the built-in function for returning expression results
@@ -31,5 +26,3 @@ for _ in range(3):
     assert symbol2 in response, "Missing symbol2 in lookup response"
     assert response[symbol1] != 0, "Success should return a symbol address"
     assert response[symbol2] == 0, "Failure should return a NULL address"
-
-lm3s811.qemu.disconnect()
@@ -8,9 +8,6 @@ if ez_clang_api.Host.debugPython(__debug__):
     debugpy.breakpoint()
 
 import inject
-import os
-import socket
-from tcping import Ping
 from typing import Tuple
 from overrides import override
 
@@ -20,6 +17,7 @@ import ez.repl.serialize
 import ez.repl.socket
 import ez.util
 import ez.util.package
+import ez.util.profile
 
 class Raspi32Transport(ez.repl.socket.Transport):
     pass
@@ -95,55 +93,63 @@ def accept(networkAddress: str) -> Tuple[str, int]:
         ez.io.debug(str(ex))
         return None
 
+_session: ez.repl.Session = None
+_profile = None # Future for the device profile, see setup()
+
 @inject.params(session=ez.repl.Session, stream=ez.repl.IOSerializer)
 def connect(info: Tuple[str, int], host: ez_clang_api.Host,
             raspi32: ez_clang_api.Device, session: ez.repl.Session,
             stream: ez.repl.serialize.Stream32) -> ez.repl.IOSerializer:
+    global _session
+    _session = session
     session.host = host # FIXME: formatExpressionResult()
     raspi32.name = session.deviceId
     raspi32.transport = "TCP -> raspi32" # TODO: Rename property to 'description' or so
     stream.endian = 'little'
     stream.verbose = 'rpc_bytes' in host.verbose()
+
+    # TODO: Include debug/release build and built-in features in setup message
+    raspi32.debug = True
+    raspi32.features = [ "-lc" ]
+
+    # Resolved configuration only changes with features and toolchain. Extract
+    # default paths from the reference compiler while we handshake.
+    #
+    # Note: PlatformIO has no toolchain packages for arm-linux-gnueabihf (yet?),
+    # so we must install it manually. E.g. on Ubuntu run:
+    #
+    #   > sudo apt update
+    #   > sudo apt install -y g++-arm-linux-gnueabihf
+    #
+    global _profile
+    _profile = ez.util.profile.loadAsync(session.deviceId, raspi32,
+        lambda: [ ez.util.package.findCompiler("arm-linux-gnueabihf-g++") ], configure,
+        verbose=len(host.verbose()) > 0)
+
     stream.open(session.connect(info))
     return stream
 
 @inject.params(session=ez.repl.Session)
 def setup(stream: ez.repl.IOSerializer, host: ez_clang_api.Host,
           raspi32: ez_clang_api.Device, session: ez.repl.Session):
-    # Read setup message
-    setup = ez.repl.endpoints.SetupMessageDecoder(stream.receive())
+    # Read setup message and relocate bootstrap endpoints
+    setup = session.setup(stream.receive())
 
     # Start configuring device
     raspi32.setCodeBuffer(setup.codeBufferAddr, setup.codeBufferSize)
-    for symbol in setup.endpoints:
-        if not session.relocateEndpoint(symbol, setup.endpoints[symbol]):
-            ez.io.warning(f"No endpoint for bootstrap function {symbol} " +
-                          f"(0x{setup.endpoints[symbol]:08x})")
 
-    if session.endpoints['lookup'].addr == 0:
-        raise ez.repl.DeviceProtocolException("Missing bootstrap symbol " +
-                                              session.endpoints['lookup'].symbol)
+    # Configuration was resolved in the background since connect()
+    ez.util.profile.restore(raspi32, _profile.result())
 
-    # TODO: Include debug/release build and built-in features in setup message
-    raspi32.debug = True
-    raspi32.features = [ "-lc" ]
+    return host.addDevice(raspi32)
 
+def configure(raspi32: ez_clang_api.Device, gcc: ez.util.package.CompilerPackage):
     # Hardware specific infos can be hardcoded
     raspi32.triple = "arm-none-eabi"
     raspi32.cpu = "cortex-a53"
     raspi32.page_size = 4096
     raspi32.default_alignment = 64
 
-    # Extract default paths from the reference compiler
-    #
-    # Note: PlatformIO has no toolchain packages for arm-linux-gnueabihf (yet?),
-    # so we must install it manually. E.g. on Ubuntu run:
-    #
-    #   > sudo apt update
-    #   > sudo apt install -y g++-arm-linux-gnueabihf
-    #
-    gcc = ez.util.package.findCompiler("arm-linux-gnueabihf-g++")
-
     # If the firmware has libc builtin, we need matching includes
     if "-lc" in raspi32.features:
         raspi32.header_search_paths += gcc.parseHeaderSearchPaths(["-march=armv6+fp"])
@@ -159,18 +165,17 @@ def setup(stream: ez.repl.IOSerializer, host: ez_clang_api.Host,
     raspi32.flags += [ "-fno-rtti", "-fno-exceptions", "-std=c++17" ]
     raspi32.flags += [ "-DDEBUG" ] if raspi32.debug else [ "-DNDEBUG" ]
 
-    return host.addDevice(raspi32)
+def call(endpoint: str, data: dict, timeout: float = None) -> dict:
+    return _session.call(endpoint, data, timeout)
 
-@inject.params(session=ez.repl.Session)
-def call(endpoint: str, data: dict, session: ez.repl.Session) -> dict:
-    return session.call(endpoint, data)
-
-@inject.params(session=ez.repl.Session, stream=ez.repl.IOSerializer)
-def disconnect(session: ez.repl.Session, stream: ez.repl.IOSerializer):
+def disconnect():
     # In our TCP connection, the remote host is the server and we are the
     # client! Let's issue a second disconnect to let the server know we finished
     # receiving its response and it can finally shut down the connection.
-    if stream.connected() and not session.disconnecting:
+    global _session
+    session, _session = _session, None
+    stream = session.stream if session else None
+    if stream and stream.connected() and not session.disconnecting:
         with ez.util.ScopeGuard(session.disconnecting):
             stream.message(ez.repl.opcode.Disconnect).send()
             ez.repl.endpoints.HangupMessageDecoder(stream.receive())
@@ -0,0 +1,14 @@
+# Test import time of the device script, which ez-clang loads before the first
+# prompt. Modules for rarely taken paths must be imported lazily.
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+times = ez.util.test.import_times('raspi32.socket')
+for module in ['argparse', 'debugpy', 'subprocess', 'tcping']:
+    assert module not in times, f"Module {module} should not load on connect path"
+
+# Budget covers inject and overrides. Bump with care.
+budget = 0.2
+assert times['raspi32.socket'] < budget, \
+    f"Import time {times['raspi32.socket']:.3f}s exceeds budget of {budget:.3f}s"
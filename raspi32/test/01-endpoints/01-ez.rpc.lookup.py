@@ -1,17 +1,13 @@
 # Test device response for calls to the lookup endpoint
+# ez-test: shared-session
 
 import ez.util.test
 ez.util.test.add_module_roots(__file__)
 
 # For standalone testing fill in the hostname:port of your remote host
 import raspi32.socket
-info = ez.util.test.lock_socket(raspi32.socket.accept, '192.168.1.107:10819')
-
-import ez_clang_api
-testHost = ez_clang_api.Host()
-testDevice = ez_clang_api.Device()
-stream = raspi32.socket.connect(info, ez_clang_api.Host(), ez_clang_api.Device())
-raspi32.socket.setup(stream, testHost, testDevice)
+ez.util.test.shared_session(raspi32.socket,
+    lambda: ez.util.test.lock_socket(raspi32.socket.accept, '192.168.1.107:10819'))
 
 for _ in range(3):
     # Lookup the built-in function for returning expression results
@@ -32,5 +28,3 @@ for _ in range(3):
     assert symbol2 in response, "Missing symbol2 in lookup response"
     assert response[symbol1] != 0, "Success should return a symbol address"
     assert response[symbol2] == 0, "Failure should return a NULL address"
-
-raspi32.socket.disconnect()
@@ -40,17 +40,23 @@ if __name__ == '__main__':
     selected = ez.util.test.select(enabled, args.filter, args.filter_out)
     print(f"Selecting {len(selected)} out of {len(enabled + disabled)} discovered tests")
 
+    # Order by outcomes and durations of earlier runs
+    history = ez.util.test.History(root.resolve().parent.name)
+    selected = history.order(selected, args.order)
+
     passed = []
     failed = []
     try:
         for path in selected:
             ez.repl.register({})
-            if ez.util.test.run(path, args.timeout):
+            if ez.util.test.run(path, args.timeout, history):
                 passed.append(path)
             else:
                 # No need for recovery; each connect() launches a fresh subprocess
                 failed.append(path)
     finally:
+        ez.util.test.close_shared_session()
+        history.store()
         duration = time.time() - start
         ez.util.test.reportResults(len(enabled), len(disabled), len(selected),
-                                   len(passed), len(failed), duration)
+                                   len(passed), len(failed), duration, history)
@@ -0,0 +1,113 @@
+import ez.io
+import ez_clang_api
+if ez_clang_api.Host.debugPython(__debug__):
+    import debugpy
+    debugpy.listen(('0.0.0.0', 5678))
+    ez.io.note("Python API waiting for debugger. Attach to 0.0.0.0:5678 to proceed.")
+    debugpy.wait_for_client()
+    debugpy.breakpoint()
+
+import inject
+from overrides import override
+
+import ez.repl
+import ez.repl.endpoints
+import ez.repl.serialize
+import ez.repl.standin
+import ez.util
+import ez.util.profile
+
+# Stand-in device for host-side testing: the firmware is emulated in-process
+class StandinTransport(ez.repl.standin.Transport):
+    pass
+
+class StandinRecovery(ez.repl.Recovery):
+    @inject.params(transport=ez.repl.Transport)
+    @override(check_signature=False)
+    def softReset(self, info: ez.repl.standin.Firmware,
+                  transport: StandinTransport) -> bool:
+        transport.reset(info)
+        return True
+    @override
+    def bundledFirmware(self) -> str:
+        return None
+    @override
+    def attemptAutoRecovery(self) -> bool:
+        return False
+    @override
+    def negotiateRecovery(self) -> bool:
+        return False
+
+ez.repl.register({
+    ez.repl.IOSerializer: lambda: ez.repl.serialize.Stream32(),
+    ez.repl.Recovery: lambda: StandinRecovery(),
+    ez.repl.Session: lambda: ez.repl.Session(deviceId='standin'),
+    ez.repl.Transport: lambda: StandinTransport(),
+})
+
+def accept(id: str) -> ez.repl.standin.Firmware:
+    if id.startswith('standin'):
+        return ez.repl.standin.Firmware()
+    return None
+
+_session: ez.repl.Session = None
+_profile = None # Future for the device profile, see setup()
+
+@inject.params(session=ez.repl.Session, stream=ez.repl.IOSerializer)
+def connect(firmware: ez.repl.standin.Firmware, host: ez_clang_api.Host,
+            standin: ez_clang_api.Device, session: ez.repl.Session,
+            stream: ez.repl.serialize.Stream32) -> ez.repl.IOSerializer:
+    global _session
+    _session = session
+    session.host = host # FIXME: formatExpressionResult()
+    standin.name = session.deviceId
+    standin.transport = "loopback -> standin" # TODO: Rename property to 'description' or so
+    stream.endian = firmware.endian
+    stream.framing = firmware.framing
+    stream.verbose = 'rpc_bytes' in host.verbose()
+
+    standin.debug = True
+    standin.features = []
+
+    # No toolchain: the stand-in can't run compiled code anyway
+    global _profile
+    _profile = ez.util.profile.loadAsync(session.deviceId, standin, lambda: [], configure,
+                                         verbose=len(host.verbose()) > 0)
+
+    stream.open(session.connect(firmware))
+    return stream
+
+@inject.params(session=ez.repl.Session)
+def setup(stream: ez.repl.IOSerializer, host: ez_clang_api.Host,
+          standin: ez_clang_api.Device, session: ez.repl.Session):
+    # Read setup message and relocate bootstrap endpoints
+    setup = session.setup(stream.receive())
+
+    # Start configuring device
+    standin.setCodeBuffer(setup.codeBufferAddr, setup.codeBufferSize)
+
+    # Configuration was resolved in the background since connect()
+    ez.util.profile.restore(standin, _profile.result())
+
+    return host.addDevice(standin)
+
+def configure(standin: ez_clang_api.Device):
+    # Pretend to be a Cortex-M3 like LM3S811
+    standin.triple = "arm-none-eabi"
+    standin.cpu = "cortex-m3"
+    standin.page_size = 64
+    standin.default_alignment = 16
+
+    standin.flags += [ "-target", "arm-none-eabi", "-mcpu=cortex-m3", "-mthumb",
+                       "-march=armv7m", "-mfpu=none", "-mfloat-abi=soft" ]
+    standin.flags += [ "-Og", "-g2", "-ggdb2" ] if standin.debug else [ "-Os", "-g0" ]
+    standin.flags += [ "-fno-rtti", "-fno-exceptions", "-std=gnu++17", "-nostdlib" ]
+    standin.flags += [ "-DDEBUG" ] if standin.debug else [ "-DNDEBUG" ]
+
+def call(endpoint: str, data: dict, timeout: float = None) -> dict:
+    return _session.call(endpoint, data, timeout)
+
+def disconnect():
+    global _session
+    session, _session = _session, None
+    return session.disconnect() if session else True
@@ -0,0 +1,23 @@
+# Test stand-in device connect/disconnect
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+import standin.loopback
+firmware = standin.loopback.accept('standin')
+
+# Test a raw handshake
+import ez_clang_api
+stream = standin.loopback.connect(firmware, ez_clang_api.Host(), ez_clang_api.Device())
+assert stream.connected(), "Connection should be established"
+
+# Consume and dump setup message
+setup = stream.receive()
+setup.readBytesRemaining()
+setup.done()
+
+# Disconnect to hand back the device in a well-defined state
+standin.loopback.disconnect()
+assert not stream.connected(), "Connection should be closed"
+assert standin.loopback._session is None, "Script should forget the session"
+assert standin.loopback.disconnect(), "Disconnecting again is a no-op"
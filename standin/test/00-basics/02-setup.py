@@ -0,0 +1,44 @@
+# Test stand-in device setup
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+import standin.loopback
+firmware = standin.loopback.accept('standin')
+
+# A test device for checking mandatory properties
+import ez_clang_api
+testDevice = ez_clang_api.Device()
+
+# Check that the device from connect() will be passed on here
+class TestHost(ez_clang_api.Host):
+    def addDevice(self, dev: ez_clang_api.Device):
+        assert dev == testDevice, "Expected given testDevice instance"
+
+testHost = TestHost()
+stream = standin.loopback.connect(firmware, testHost, testDevice)
+assert stream.connected(), "Connection should be established"
+
+standin.loopback.setup(stream, testHost, testDevice)
+
+# Check that setup() initialized mandatory properties
+assert testDevice.name != None, "Failed to initialize mandatory property"
+assert testDevice.triple != None, "Failed to initialize mandatory property"
+assert testDevice.cpu != None, "Failed to initialize mandatory property"
+assert testDevice.page_size != 0, "Failed to initialize mandatory property"
+assert testDevice.default_alignment != 0, "Failed to initialize mandatory property"
+assert len(testDevice.flags) > 0, "Failed to initialize mandatory property"
+
+standin.loopback.disconnect()
+
+# Profile timings are only reported in verbose mode
+class QuietHost(ez_clang_api.Host):
+    @staticmethod
+    def verbose():
+        return []
+for host, expected in [ (QuietHost(), False), (ez_clang_api.Host(), True) ]:
+    with ez.util.test.capture_tool_output() as output:
+        stream = standin.loopback.connect(standin.loopback.accept('standin'), host, testDevice)
+        standin.loopback.setup(stream, host, ez_clang_api.Device())
+        standin.loopback.disconnect()
+    assert ("device profile standin" in output['stdout']()) == expected, output['stdout']()
@@ -0,0 +1,91 @@
+# Test streaming inbound messages: incremental reads from the transport, dumps
+# straight to a file and framing checks
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+import io
+import standin.loopback
+firmware = standin.loopback.accept('standin')
+
+import ez_clang_api
+class QuietHost(ez_clang_api.Host):
+    @staticmethod
+    def verbose():
+        return []
+
+host = QuietHost()
+stream = standin.loopback.connect(firmware, host, ez_clang_api.Device())
+standin.loopback.setup(stream, host, ez_clang_api.Device())
+session = standin.loopback._session
+
+# Memory dumps go to the file chunk by chunk
+addr = firmware.codeBufferAddr
+sample = bytes(i % 253 for i in range(len(firmware.memory)))
+firmware.write(addr, sample)
+file = io.BytesIO()
+assert session.dumpMemory(addr, len(sample), file) == len(sample)
+assert file.getvalue() == sample, "Dumped memory doesn't match"
+
+# Header is parsed eagerly, the body on demand
+import ez.repl.opcode
+payload = b'0123456789' * 1000
+firmware.send(ez.repl.opcode.StdOut, firmware.blob(payload))
+msg = stream.receive(streaming=True)
+assert msg.opcode == ez.repl.opcode.StdOut
+assert msg.remaining() == 8 + len(payload)
+chunks = list(msg.readBytesIter(chunkSize=1024))
+assert max(len(chunk) for chunk in chunks) == 1024, "Chunks are limited in size"
+assert b''.join(chunks) == payload
+assert msg.done()
+
+# readinto() fills caller-provided buffers
+firmware.send(ez.repl.opcode.StdOut, payload)
+msg = stream.receive(streaming=True)
+buffer = bytearray(4000)
+assert msg.readinto(buffer, [4000]) == 4000 and buffer == payload[:4000]
+assert not msg.done(), "Message isn't consumed yet"
+assert msg.readBytesRemaining() == payload[4000:]
+assert msg.done()
+
+# Padding is reported by the usual decoder checks
+decoder = ez.repl.endpoints.LayoutResponseDecoder(ez.repl.schema.Layout())
+firmware.send(ez.repl.opcode.Return, firmware.success(b'\x00\x00'))
+try:
+    decoder(stream.receive(streaming=True))
+    assert False, "Expected DeviceResponsePaddingException"
+except ez.repl.DeviceResponsePaddingException as ex:
+    assert "2 extra bytes" in str(ex)
+
+# Reading beyond the declared size is a framing error
+firmware.send(ez.repl.opcode.Return, firmware.success())
+msg = stream.receive(streaming=True)
+msg.readErrorCode()
+try:
+    msg.readSize()
+    assert False, "Expected DeviceABIException"
+except ez.repl.DeviceABIException as ex:
+    assert "overrun" in str(ex)
+
+# Messages that end early or claim bogus sizes mean the link is out of sync
+for streaming in [ False, True ]:
+    for data in [ b'\x00\x01', b'\xff' * 8, firmware.uint(64) + b'\x00' * 8 ]:
+        firmware.outbound += data
+        try:
+            stream.receive(streaming)
+            assert False, "Expected DeviceABIException"
+        except ez.repl.DeviceABIException as ex:
+            assert "truncated" in str(ex) or "Invalid message size" in str(ex), str(ex)
+        firmware.outbound.clear()
+
+# Verbose mode dumps the streamed bytes
+stream.verbose = True
+firmware.send(ez.repl.opcode.StdOut, b'abc')
+with ez.util.test.capture_stdout() as output:
+    msg = stream.receive(streaming=True)
+    msg.readBytesRemaining()
+    assert msg.done()
+    assert "61 62 63" in output(), "Missing message dump"
+stream.verbose = False
+
+standin.loopback.disconnect()
@@ -0,0 +1,36 @@
+# Test connecting the stand-in device in the background through the script API
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+import os
+import threading
+from ez.util.script import Script
+
+import ez_clang_api
+class QuietHost(ez_clang_api.Host):
+    @staticmethod
+    def verbose():
+        return []
+    def addDevice(self, dev: ez_clang_api.Device) -> bool:
+        self.device = dev
+        self.thread = threading.current_thread()
+        return super().addDevice(dev)
+
+root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+script = Script(os.path.join(root, 'loopback.py'), 'standin.loopback')
+assert script.accept('standin')
+
+host = QuietHost()
+future = script.connectAsync(host)
+
+# Calls into the script wait for the connection
+symbol = '__ez_clang_report_value'
+result = script.call('lookup', { symbol: 0 })
+assert result[symbol] != 0, "Lookup should work once connected"
+assert future.done() and future.result() == True
+assert host.thread != threading.main_thread(), "Expected setup on background thread"
+assert len(host.device.flags) > 0, "Profile should be applied in setup"
+assert host.device.page_size == 64, "Recorded scalars should be applied too"
+
+assert script.disconnect()
@@ -0,0 +1,42 @@
+# Test that tests which opt in share one session per category, that it gets
+# checked between tests and replaced if it doesn't answer anymore
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+import tempfile
+from pathlib import Path
+
+header = """# ez-test: shared-session
+import ez.util.test
+import standin.loopback
+session = ez.util.test.shared_session(standin.loopback, lambda: standin.loopback.accept('standin'))
+firmware = session.info
+"""
+tests = {
+    '01-category/01-first.py': header + "firmware.marker = 'first'\n",
+    '01-category/02-reuse.py': header + "assert firmware.marker == 'first'\n",
+    '01-category/03-own.py': "import standin.loopback\n" +
+                             "assert standin.loopback.accept('standin')\n",
+    '01-category/04-after_own.py': header + "assert not hasattr(firmware, 'marker')\n" +
+                                   "firmware.marker = 'after_own'\n" +
+                                   "session.transport.read = lambda size: b''\n",
+    '01-category/05-after_broken.py': header + "assert not hasattr(firmware, 'marker')\n" +
+                                      "firmware.marker = 'after_broken'\n",
+    '02-category/01-next.py': header + "assert not hasattr(firmware, 'marker')\n",
+}
+
+stats = ez.util.test.sharedSessionStats
+connects, handouts = stats['connects'], stats['handouts']
+with tempfile.TemporaryDirectory() as dir:
+    for name, code in tests.items():
+        path = Path(dir) / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(code)
+    with ez.util.test.capture_tool_output():
+        results = [ ez.util.test.run(Path(dir) / name, 5) for name in tests ]
+    ez.util.test.close_shared_session()
+
+assert all(results), f"Expected all tests to pass: {results}"
+assert stats['handouts'] - handouts == 5
+assert stats['connects'] - connects == 4, "Reconnect after own, broken and new category"
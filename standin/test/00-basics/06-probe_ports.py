@@ -0,0 +1,140 @@
+# Test port probing for devices with multiple candidate ports: the first port
+# that answers wins, only the winner gets a hangup and the next scan tries the
+# last winner alone first
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+import os
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from overrides import override
+
+import ez.repl
+import ez.scan
+import ez.util
+
+# Fake ports answer the handshake after the given delay. None means stuck.
+delays = { '/dev/ttyFAST': 0.02, '/dev/ttySLOW': 0.15, '/dev/ttySTUCK': None }
+opened = []
+closed = []
+hangups = []
+lock = threading.Lock()
+
+class FakeStream:
+    def __init__(self, device: str):
+        self.device = device
+    def close(self):
+        with lock:
+            closed.append(self.device)
+
+class FakeTransport(ez.repl.Transport):
+    def __init__(self):
+        self.stream = None
+        self.timeout = 1
+    @override(check_signature=False)
+    def reset(self, info):
+        with lock:
+            opened.append(info.device)
+        self.info = info
+        self.stream = FakeStream(info.device)
+        return info
+    @override(check_signature=False)
+    def handshake(self):
+        delay = delays[self.info.device]
+        time.sleep(self.timeout if delay is None else delay)
+        if delay is None:
+            raise ez.repl.HandshakeFailedException()
+    @override(check_signature=False)
+    def finalize(self):
+        return self
+
+class FakeRecovery(ez.repl.Recovery):
+    @override(check_signature=False)
+    def bundledFirmware(self) -> str:
+        return None
+    @override(check_signature=False)
+    def attemptAutoRecovery(self) -> bool:
+        return False
+    @override(check_signature=False)
+    def negotiateRecovery(self) -> bool:
+        return False
+    @override(check_signature=False)
+    def hangup(self, transport: ez.repl.Transport, endian: str):
+        hangups.append(transport.info.device)
+
+def port(device: str):
+    return SimpleNamespace(device=device, serial_number=device[len('/dev/tty'):])
+candidates = [ port('/dev/ttySTUCK'), port('/dev/ttySLOW'), port('/dev/ttyFAST') ]
+
+def settle():
+    time.sleep(ez.scan.probeTimeout + 0.1) # Losers close once their handshake ends
+    assert sorted(opened) == sorted(closed), f"Opened {opened}, closed {closed}"
+    opened.clear()
+    closed.clear()
+
+components = ez.repl.components()
+ez.repl.register({
+    ez.repl.Transport: lambda: FakeTransport(),
+    ez.repl.Recovery: lambda: FakeRecovery(),
+})
+probeTimeout = ez.scan.probeTimeout
+ez.scan.probeTimeout = 0.3
+cacheHome = os.environ.get('XDG_CACHE_HOME')
+try:
+    with tempfile.TemporaryDirectory() as dir:
+        os.environ['XDG_CACHE_HOME'] = dir
+        cacheFile = os.path.join(ez.util.cacheDir('scan'), 'fake.json')
+
+        # The fastest port wins and we don't wait for the others
+        start = time.monotonic()
+        info = ez.scan.probeSerialPorts('fake', candidates)
+        duration = time.monotonic() - start
+        assert info.device == '/dev/ttyFAST'
+        assert duration < delays['/dev/ttySLOW'], f"Waited for losers: {duration:.2f}s"
+        assert sorted(opened) == sorted(c.device for c in candidates)
+        settle()
+        assert hangups == [ '/dev/ttyFAST' ], "The slow port answered, but lost"
+        cache = ez.util.loadJson(cacheFile, {})
+        assert cache['best'] == 'FAST'
+        assert [ e['port'] for e in cache['ranking'] ] == [ '/dev/ttyFAST' ]
+
+        # The last winner is tried alone first
+        hangups.clear()
+        assert ez.scan.probeSerialPorts('fake', candidates).device == '/dev/ttyFAST'
+        assert opened == [ '/dev/ttyFAST' ], "Other ports shouldn't be touched"
+        settle()
+
+        # If it doesn't answer anymore, the others are probed
+        hangups.clear()
+        delays['/dev/ttyFAST'] = None
+        assert ez.scan.probeSerialPorts('fake', candidates).device == '/dev/ttySLOW'
+        assert opened[0] == '/dev/ttyFAST', "Expected last winner alone first"
+        assert sorted(opened[1:]) == [ '/dev/ttySLOW', '/dev/ttySTUCK' ]
+        settle()
+        assert hangups == [ '/dev/ttySLOW' ]
+        cache = ez.util.loadJson(cacheFile, {})
+        assert cache['best'] == 'SLOW'
+        assert [ e['port'] for e in cache['ranking'] ] == [ '/dev/ttyFAST', '/dev/ttySLOW' ], \
+               "Ranking is ordered by latency"
+
+        # Nobody answers: no winner, the cache stays and the scan falls back
+        # to the first candidate
+        hangups.clear()
+        delays['/dev/ttySLOW'] = None
+        assert ez.scan.probeSerialPorts('fake', candidates) is None
+        settle()
+        assert hangups == []
+        assert ez.util.loadJson(cacheFile, {}) == cache
+        with ez.util.test.capture_tool_output():
+            assert ez.scan.selectSerialPort('fake', candidates) == candidates[0]
+        settle()
+finally:
+    ez.scan.probeTimeout = probeTimeout
+    if cacheHome is None:
+        os.environ.pop('XDG_CACHE_HOME', None)
+    else:
+        os.environ['XDG_CACHE_HOME'] = cacheHome
+    ez.repl.register(components)
@@ -0,0 +1,36 @@
+# Test stand-in device response for calls to the commit, execute and
+# memory.read.cstr endpoints
+# ez-test: shared-session
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+import standin.loopback
+session = ez.util.test.shared_session(standin.loopback, lambda: standin.loopback.accept('standin'))
+firmware = session.info
+
+# Commit a c-string and read it back
+addr = firmware.codeBufferAddr + 0x100
+cstr = b"endcoal\x00"
+response = standin.loopback.call('commit', {
+    addr: {'data': cstr, 'size': len(cstr)},
+})
+assert response == {}, "Unexpected response from commit endpoint"
+assert firmware.read(addr, len(cstr)) == cstr, "Commit didn't write memory"
+
+response = standin.loopback.call('memory.read.cstr', { 'addr': addr + 3 })
+assert response['str'] == 'coal', "Failed to read back tail of string"
+
+# Execute a function that prints and overwrites the string
+def function(device):
+    device.stdout("hello")
+    device.write(addr, b"endcars\x00")
+
+firmware.functions[0x20001001] = function
+with ez.util.test.capture_stdout() as output:
+    response = standin.loopback.call('execute', {'addr': 0x20001001})
+    assert response == {}, "Unexpected response from execute endpoint"
+    assert "hello" in output()
+
+response = standin.loopback.call('memory.read.cstr', { 'addr': addr })
+assert response['str'] == 'endcars', "Execute didn't modify memory"
@@ -0,0 +1,57 @@
+# Test codecs compiled from message layouts: round-trip a commit request through
+# both byte orders and check the stand-in's answer to a lookup
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+import ez.repl.endpoints
+import ez.repl.opcode
+import ez.repl.serialize
+import ez.repl.standin
+
+for endian in [ 'little', 'big' ]:
+    firmware = ez.repl.standin.Firmware(endian=endian)
+    transport = ez.repl.standin.Transport()
+    transport.reset(firmware)
+    transport.handshake()
+    stream = ez.repl.serialize.Stream32()
+    stream.endian = endian
+    stream.open(transport)
+
+    setup = ez.repl.endpoints.SetupMessageDecoder(stream.receive())
+    assert setup.codeBufferAddr == firmware.codeBufferAddr, f"Setup ({endian})"
+    assert setup.codeBufferSize == len(firmware.memory), f"Setup ({endian})"
+    assert setup.endpoints == { '__ez_clang_rpc_lookup': firmware.symbols['__ez_clang_rpc_lookup'] }
+
+    # Encode a commit request and parse it like the device would
+    commit = ez.repl.endpoints.Commit('__ez_clang_rpc_commit')
+    segments = { 0x20000010: { 'data': b'\x01\x02', 'size': 2 },
+                 0x20000020: { 'data': b'', 'size': 0 } }
+    msg = stream.message(ez.repl.opcode.Call, 0)
+    commit.encode(msg, segments)
+    body = msg.buffer.getvalue()[ez.repl.standin.Firmware.HEADER_SIZE:]
+    reader = ez.repl.standin.Reader(body, endian)
+    assert reader.uint() == 2, f"Segment count ({endian})"
+    for addr in segments:
+        assert reader.uint() == addr, f"Segment address ({endian})"
+        assert reader.uint() == segments[addr]['size'], f"Segment size ({endian})"
+        assert reader.blob() == segments[addr]['data'], f"Segment data ({endian})"
+    assert reader.pos == len(body), f"Trailing bytes in commit request ({endian})"
+
+    # Lookup maps returned addresses to requested symbols in order
+    lookup = ez.repl.endpoints.Lookup('__ez_clang_rpc_lookup')
+    lookup.addr = firmware.symbols['__ez_clang_rpc_lookup']
+    symbols = { '__ez_clang_rpc_execute': None, '__ez_clang_rpc_commit': None }
+    msg = stream.message(ez.repl.opcode.Call, lookup.addr)
+    decode = lookup.encode(msg, symbols)
+    msg.send()
+    response = decode(stream.receive())
+    assert response == { symbol: firmware.symbols[symbol] for symbol in symbols }, \
+           f"Lookup response ({endian})"
+
+    # Missing attributes are reported as host API errors
+    try:
+        ez.repl.endpoints.Execute('').encode(stream.message(ez.repl.opcode.Call, 0), {})
+        assert False, "Expected HostAPIException"
+    except ez.repl.HostAPIException as ex:
+        assert 'addr' in str(ex)
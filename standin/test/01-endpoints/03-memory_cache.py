@@ -0,0 +1,102 @@
+# Test that c-string results are answered from the host-side memory cache and
+# that commit and execute keep it coherent
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+import standin.loopback
+firmware = standin.loopback.accept('standin')
+
+import ez_clang_api
+class TestHost(ez_clang_api.Host):
+    @staticmethod
+    def verbose():
+        return []
+    def getResultDeclTypeAsString(self):
+        return "const char *"
+    def formatResult(self, mem: bytes):
+        return f"(const char *) 0x{int.from_bytes(mem, 'little'):08x}"
+
+host = TestHost()
+stream = standin.loopback.connect(firmware, host, ez_clang_api.Device())
+standin.loopback.setup(stream, host, ez_clang_api.Device())
+
+# Count requests that reach the device for reading c-strings
+reads = []
+symbol = '__ez_clang_rpc_mem_read_cstring_chunk'
+handler = firmware.handlers[firmware.symbols[symbol]]
+firmware.handlers[firmware.symbols[symbol]] = lambda msg: reads.append(1) or handler(msg)
+
+def report(addr: int):
+    def function(device):
+        device.result(addr.to_bytes(4, 'little'))
+    return function
+
+def execute(addr: int) -> str:
+    with ez.util.test.capture_stdout() as output:
+        standin.loopback.call('execute', {'addr': addr})
+        return output()
+
+# Constant data segment stays valid across execute
+rodata = firmware.codeBufferAddr + 0x100
+firmware.functions[0x20001001] = report(rodata)
+standin.loopback.call('commit', {
+    rodata: {'data': b"abcd\x00", 'size': 5, 'const': True},
+})
+assert "0x20000100 abcd" in execute(0x20001001)
+assert len(reads) == 0, "Constant committed string should not be read from device"
+
+# Volatile data is dropped on execute and read back from the device once
+data = firmware.codeBufferAddr + 0x200
+firmware.functions[0x20001011] = report(data)
+standin.loopback.call('commit', {
+    data: {'data': b"efgh\x00", 'size': 5},
+})
+assert "0x20000200 efgh" in execute(0x20001011)
+assert len(reads) == 1, "Volatile string must be read after execute"
+
+# Device code modifies the string: the next result must reflect that
+def modify(device):
+    device.write(data, b"ijkl\x00")
+    report(data)(device)
+firmware.functions[0x20001021] = modify
+assert "0x20000200 ijkl" in execute(0x20001021)
+assert len(reads) == 2, "Execute must invalidate read-back strings"
+
+# Re-commit invalidates the cached bytes and stores the new ones
+standin.loopback.call('commit', {
+    rodata: {'data': b"wxyz\x00", 'size': 5, 'const': True},
+})
+assert "0x20000100 wxyz" in execute(0x20001001)
+assert len(reads) == 2, "Cache should hold re-committed bytes"
+
+# Device scripts can mark regions as constant via the policy hook
+session = standin.loopback._session
+session.memory.markConstant(data, 0x100)
+assert "0x20000200 ijkl" in execute(0x20001011)
+assert "0x20000200 ijkl" in execute(0x20001011)
+assert len(reads) == 3, "Read-back of a constant region should be cached"
+assert session.memory.hits >= 3
+
+# Cached strings decode like the ones read from the device
+text = firmware.codeBufferAddr + 0x300
+firmware.functions[0x20001031] = report(text)
+standin.loopback.call('commit', {
+    text: {'data': "grüß ".encode('utf-8') + b"\xff\x00", 'size': 9, 'const': True},
+})
+assert "0x20000300 grüß \ufffd" in execute(0x20001031)
+assert len(reads) == 3, "Non-ASCII string should come from the cache"
+
+# Device code overwrites a committed buffer: the result shows the new contents
+buffer = firmware.codeBufferAddr + 0x400
+standin.loopback.call('commit', {
+    buffer: {'data': b"hello\x00", 'size': 6},
+})
+def overwrite(device):
+    device.write(buffer, b"world\x00")
+    report(buffer)(device)
+firmware.functions[0x20001041] = overwrite
+assert "0x20000400 world" in execute(0x20001041)
+assert len(reads) == 4, "Committed buffer must be read after execute"
+
+standin.loopback.disconnect()
@@ -0,0 +1,81 @@
+# Test bulk memory reads: chunking, byte order of NumPy views and errors for
+# invalid ranges
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+import standin.loopback
+firmware = standin.loopback.accept('standin')
+
+import ez_clang_api
+class QuietHost(ez_clang_api.Host):
+    @staticmethod
+    def verbose():
+        return []
+
+host = QuietHost()
+stream = standin.loopback.connect(firmware, host, ez_clang_api.Device())
+standin.loopback.setup(stream, host, ez_clang_api.Device())
+session = standin.loopback._session
+
+# Count requests that reach the memory.read endpoint on the device
+reads = []
+symbol = '__ez_clang_rpc_mem_read'
+firmware.handlers[firmware.symbols[symbol]] = \
+    lambda msg, handler=firmware.handlers[firmware.symbols[symbol]]: reads.append(1) or handler(msg)
+
+# Range that spans multiple chunks and ends in a partial one
+addr = firmware.codeBufferAddr + 0x40
+size = 3 * session.transport.maxPayload + 100
+sample = bytes(i % 251 for i in range(size))
+firmware.write(addr, sample)
+
+data = session.readMemory(addr, size)
+assert isinstance(data, memoryview), "Expected memoryview result"
+assert data == sample, "Read data doesn't match device memory"
+assert len(reads) == 4, f"Expected 4 chunks, got {len(reads)}"
+
+# The raw endpoint is available as well
+response = standin.loopback.call('memory.read', { 'addr': addr, 'size': 16 })
+assert response['data'] == sample[:16]
+
+# Reading from outside the memory is reported by the device
+try:
+    session.readMemory(0x10000000, 16)
+    assert False, "Expected DeviceErrorReportException"
+except ez.repl.DeviceErrorReportException as ex:
+    assert "Access violation" in str(ex)
+
+# NumPy views interpret data in device byte order
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+if numpy:
+    values = numpy.arange(64, dtype='<u4')
+    firmware.write(addr, values.tobytes())
+    array = session.readMemory(addr, values.nbytes, 'uint32')
+    assert array.dtype == numpy.dtype('<u4'), "Expected little endian dtype"
+    assert (array == values).all(), "NumPy view doesn't match device memory"
+
+    # Sizes that don't fit the dtype are rejected before talking to the device
+    try:
+        session.readMemory(addr, 10, 'uint32')
+        assert False, "Expected HostAPIException"
+    except ez.repl.HostAPIException as ex:
+        assert "10 bytes" in str(ex) and f"0x{addr:08x}" in str(ex) and "uint32" in str(ex), str(ex)
+
+    # Same for a big endian device
+    standin.loopback.disconnect()
+    ez.repl.register({}) # Fresh session
+    firmware = ez.repl.standin.Firmware(endian='big')
+    stream = standin.loopback.connect(firmware, host, ez_clang_api.Device())
+    standin.loopback.setup(stream, host, ez_clang_api.Device())
+    session = standin.loopback._session
+    firmware.write(addr, values.astype('>u4').tobytes())
+    array = session.readMemory(addr, values.nbytes, 'uint32')
+    assert array.dtype == numpy.dtype('>u4'), "Expected big endian dtype"
+    assert (array == values).all(), "NumPy view doesn't match device memory"
+
+standin.loopback.disconnect()
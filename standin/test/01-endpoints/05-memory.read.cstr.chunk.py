@@ -0,0 +1,65 @@
+# Test chunked c-string reads: continuation across chunks, length limit for
+# unterminated memory, progressive output and fallback for older firmware
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+import standin.loopback
+firmware = standin.loopback.accept('standin')
+
+import ez_clang_api
+class TestHost(ez_clang_api.Host):
+    @staticmethod
+    def verbose():
+        return []
+    def getResultDeclTypeAsString(self):
+        return "char *"
+    def formatResult(self, mem: bytes):
+        return f"(char *) 0x{int.from_bytes(mem, 'little'):08x}"
+
+host = TestHost()
+stream = standin.loopback.connect(firmware, host, ez_clang_api.Device())
+standin.loopback.setup(stream, host, ez_clang_api.Device())
+session = standin.loopback._session
+chunk = session.transport.maxPayload
+
+# Multi-line log that spans several chunks. Multi-byte characters may be split
+# at chunk boundaries.
+addr = firmware.codeBufferAddr + 0x100
+log = "".join(f"line {i}: {'ä' * 40}\n" for i in range(100))
+data = log.encode('utf-8')
+assert len(data) > 4 * chunk, "Test string too short"
+firmware.write(addr, data + b'\x00')
+assert session.readCString(addr) == log, "Chunked read doesn't match"
+
+# Results print line by line
+def report(device):
+    device.result(addr.to_bytes(4, 'little'))
+firmware.functions[0x20000001] = report
+with ez.util.test.capture_stdout() as output:
+    standin.loopback.call('execute', {'addr': 0x20000001})
+    lines = output().splitlines()
+    assert lines[0] == f"(char *) 0x{addr:08x} line 0: {'ä' * 40}", "First line"
+    assert lines[100] == "", "Trailing newline"
+    assert lines[99].startswith("line 99: "), "Last line"
+
+# Unterminated memory is cut off
+firmware.write(firmware.codeBufferAddr, b'x' * len(firmware.memory))
+session.maxCStringLength = 3 * chunk + 10
+str = session.readCString(firmware.codeBufferAddr)
+assert str.startswith('x' * session.maxCStringLength), "Missing data in cut off string"
+assert str.endswith(f"... (cut off after {session.maxCStringLength} bytes)"), str[-40:]
+
+standin.loopback.disconnect()
+
+# Firmware without chunked reads gets a single request
+ez.repl.register({}) # Fresh session
+firmware = standin.loopback.accept('standin')
+del firmware.symbols['__ez_clang_rpc_mem_read_cstring_chunk']
+stream = standin.loopback.connect(firmware, host, ez_clang_api.Device())
+standin.loopback.setup(stream, host, ez_clang_api.Device())
+firmware.write(addr, b"legacy\x00")
+assert standin.loopback._session.readCString(addr) == "legacy"
+firmware.write(addr + 0x10, b"again\x00")
+assert standin.loopback._session.readCString(addr + 0x10) == "again"
+standin.loopback.disconnect()
@@ -0,0 +1,76 @@
+# Test binary telemetry streams: samples from the device end up in ring buffers
+# with the registered dtype
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+try:
+    import numpy
+except ImportError:
+    print("Telemetry requires NumPy")
+    exit(0)
+
+import standin.loopback
+firmware = standin.loopback.accept('standin')
+
+import ez_clang_api
+class QuietHost(ez_clang_api.Host):
+    @staticmethod
+    def verbose():
+        return []
+
+host = QuietHost()
+stream = standin.loopback.connect(firmware, host, ez_clang_api.Device())
+standin.loopback.setup(stream, host, ez_clang_api.Device())
+session = standin.loopback._session
+
+adc = session.telemetry.register(1, 'uint16', capacity=100)
+imu = session.telemetry.register(2, 'float32', capacity=16)
+
+# Device emits frames on both streams and on one that nobody listens to
+ramp = numpy.arange(60, dtype='<u2')
+accel = numpy.linspace(-1, 1, 12, dtype='<f4')
+def sample(device):
+    device.stdout("sampling\n")
+    device.telemetry(1, ramp[:40].tobytes())
+    device.telemetry(2, accel.tobytes())
+    device.telemetry(3, b'\x00' * 16)
+    device.telemetry(1, ramp[40:].tobytes())
+firmware.functions[0x20000001] = sample
+
+with ez.util.test.capture_stdout() as output:
+    standin.loopback.call('execute', {'addr': 0x20000001})
+    assert "sampling" in output()
+assert adc.available() == 60 and imu.available() == 12
+assert session.telemetry.dropped == 1, "Frames for unknown streams are dropped"
+
+values = adc.read(25)
+assert values.dtype == numpy.dtype('<u2') and (values == ramp[:25]).all()
+assert (adc.read() == ramp[25:]).all()
+assert (imu.read() == accel).all()
+
+# Frames wrap around the end of the ring buffer. If the consumer falls behind,
+# oldest samples get dropped.
+stream.verbose = True # Exercise message dumps for zero-copy reads
+with ez.util.test.capture_stdout():
+    standin.loopback.call('execute', {'addr': 0x20000001})
+    standin.loopback.call('execute', {'addr': 0x20000001})
+stream.verbose = False
+assert adc.available() == 100 and adc.overruns == 20
+assert (adc.read() == numpy.concatenate((ramp[20:], ramp))).all()
+assert imu.available() == 16 and imu.overruns == 8
+assert (imu.read() == numpy.concatenate((accel[8:], accel))).all()
+
+# Frames that don't match the sample size are counted and skipped, the call
+# and the link go on
+def malformed(device):
+    device.telemetry(1, b'\x01\x02\x03')
+    device.telemetry(1, ramp[:4].tobytes())
+firmware.functions[0x20000011] = malformed
+standin.loopback.call('execute', {'addr': 0x20000011})
+assert session.telemetry.malformed == 1
+assert (adc.read() == ramp[:4]).all(), "Frames after a malformed one arrive"
+standin.loopback.call('execute', {'addr': 0x20000001})
+assert adc.available() == 60
+
+standin.loopback.disconnect()
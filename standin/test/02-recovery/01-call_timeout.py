@@ -0,0 +1,99 @@
+# Test call deadlines: runaway code gets interrupted, and if the device doesn't
+# respond to that, it gets soft reset
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+import standin.loopback
+firmware = standin.loopback.accept('standin')
+
+import ez_clang_api
+class QuietHost(ez_clang_api.Host):
+    @staticmethod
+    def verbose():
+        return []
+
+host = QuietHost()
+stream = standin.loopback.connect(firmware, host, ez_clang_api.Device())
+standin.loopback.setup(stream, host, ez_clang_api.Device())
+session = standin.loopback._session
+session.interruptTimeout = 0.1
+
+import ez.repl.standin
+def runaway(device):
+    device.stdout("spinning")
+    raise ez.repl.standin.Hang()
+firmware.functions[0x20000001] = runaway
+firmware.functions[0x20000011] = lambda device: device.stdout("done")
+
+# Device aborts the call on interrupt request
+with ez.util.test.capture_stdout() as output:
+    try:
+        standin.loopback.call('execute', {'addr': 0x20000001}, timeout=0.2)
+        assert False, "Expected CallTimeoutException"
+    except ez.repl.CallTimeoutException as ex:
+        assert ex.recovered, "Interrupt should recover the call"
+        assert list(ex.timings) == [ 'interrupt' ], ex.timings
+        assert "exceeded deadline of 0.2s" in str(ex)
+    assert "spinning" in output(), "Output must be flushed before the exception"
+
+# Link is in sync afterwards
+with ez.util.test.capture_stdout() as output:
+    standin.loopback.call('execute', {'addr': 0x20000011}, timeout=0.2)
+    assert "done" in output()
+
+# An explicit zero deadline interrupts right away
+with ez.util.test.capture_stdout():
+    try:
+        standin.loopback.call('execute', {'addr': 0x20000001}, timeout=0)
+        assert False, "Expected CallTimeoutException"
+    except ez.repl.CallTimeoutException as ex:
+        assert list(ex.timings) == [ 'interrupt' ], ex.timings
+
+# Soft resets wipe memory like a real reboot
+base = firmware.codeBufferAddr
+standin.loopback.call('commit', { base: { 'data': b'code', 'size': 4 } })
+reset = firmware.reset
+def wipe():
+    firmware.memory[:] = bytes(len(firmware.memory))
+    reset()
+firmware.reset = wipe
+
+# Device ignores the interrupt: escalate to soft reset and restore the session.
+# Session default deadline applies if the call doesn't specify one.
+firmware.interruptible = False
+session.callTimeout = 0.2
+try:
+    with ez.util.test.capture_stdout():
+        standin.loopback.call('execute', {'addr': 0x20000001})
+    assert False, "Expected CallTimeoutException"
+except ez.repl.CallTimeoutException as ex:
+    assert ex.recovered, "Soft reset should recover the connection"
+    assert list(ex.timings) == [ 'interrupt', 'soft reset', 'handshake', 'restore' ], ex.timings
+    assert ex.timings['interrupt'] >= session.interruptTimeout
+    assert session.lastEscalation == ex.timings
+assert firmware.read(base, 4) == b'code', "Memory wasn't restored"
+assert session.setupInfo.codeBufferAddr == base
+
+# Device is usable after the reboot
+response = standin.loopback.call('lookup', { '__ez_clang_report_value': 0 })
+assert response['__ez_clang_report_value'] != 0
+with ez.util.test.capture_stdout() as output:
+    standin.loopback.call('execute', {'addr': 0x20000011})
+    assert "done" in output()
+
+# Device doesn't reboot on soft reset and never sends a handshake
+firmware.reset = lambda: None
+try:
+    with ez.util.test.capture_stdout():
+        standin.loopback.call('execute', {'addr': 0x20000001})
+    assert False, "Expected CallTimeoutException"
+except ez.repl.CallTimeoutException as ex:
+    assert not ex.recovered, "Missing handshake can't recover the connection"
+    assert list(ex.timings) == [ 'interrupt', 'soft reset' ], ex.timings
+
+# Reconnecting brings it back
+firmware.reset = reset
+stream = standin.loopback.connect(firmware, host, ez_clang_api.Device())
+standin.loopback.setup(stream, host, ez_clang_api.Device())
+standin.loopback.disconnect()
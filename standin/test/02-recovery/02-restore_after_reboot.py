@@ -0,0 +1,67 @@
+# Test session restore after the device rebooted unexpectedly: committed
+# segments come back and calls that are safe to repeat succeed transparently
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+import standin.loopback
+firmware = standin.loopback.accept('standin')
+
+import ez_clang_api
+class QuietHost(ez_clang_api.Host):
+    @staticmethod
+    def verbose():
+        return []
+
+host = QuietHost()
+stream = standin.loopback.connect(firmware, host, ez_clang_api.Device())
+standin.loopback.setup(stream, host, ez_clang_api.Device())
+session = standin.loopback._session
+session.restoreBatchSize = 64
+
+# Commit code and data, overwrite some of it and resolve a symbol
+base = firmware.codeBufferAddr
+segments = { base + 0x100 * i: { 'data': bytes([i]) * 40, 'size': 40 } for i in range(1, 6) }
+standin.loopback.call('commit', segments)
+standin.loopback.call('commit', { base + 0x100: { 'data': b'\xaa' * 40, 'size': 40 } })
+standin.loopback.call('commit', { base + 0x210: { 'data': b'\xbb' * 8, 'size': 8 } })
+symbol = '__ez_clang_report_value'
+standin.loopback.call('lookup', { symbol: 0 })
+assert len(session.journal.segments) == 6, "Overwritten segment should be dropped"
+assert session.journal.symbols[symbol] == firmware.symbols[symbol]
+expected = bytes(firmware.memory)
+
+# Device crashes while executing
+from ez.repl.standin import Firmware
+firmware.functions[0x20000001] = Firmware.reboot
+with ez.util.test.capture_stdout() as output:
+    try:
+        standin.loopback.call('execute', {'addr': 0x20000001})
+        assert False, "Expected CallAbortedByRebootException"
+    except ez.repl.CallAbortedByRebootException:
+        pass
+    assert "Restored session after device reboot: 208 bytes in 5 commit requests" in output()
+assert bytes(firmware.memory) == expected, "Memory wasn't restored"
+
+# Device reboots while it handles a commit request: it's repeated after restore
+handler = firmware.handlers[firmware.symbols['__ez_clang_rpc_commit']]
+def crash(msg):
+    firmware.handlers[firmware.symbols['__ez_clang_rpc_commit']] = handler
+    firmware.reboot()
+firmware.handlers[firmware.symbols['__ez_clang_rpc_commit']] = crash
+with ez.util.test.capture_stdout():
+    standin.loopback.call('commit', { base + 0x600: { 'data': b'new', 'size': 3 } })
+assert firmware.read(base + 0x600, 3) == b'new', "Commit wasn't repeated"
+assert firmware.read(base + 0x500, 40) == bytes([5]) * 40, "Memory wasn't restored"
+
+# Restore fails if symbols moved, e.g. with a different firmware
+firmware.symbols[symbol] += 0x10
+firmware.functions[0x20000001] = Firmware.reboot
+try:
+    with ez.util.test.capture_stdout():
+        standin.loopback.call('execute', {'addr': 0x20000001})
+    assert False, "Expected SessionRestoreFailedException"
+except ez.repl.SessionRestoreFailedException as ex:
+    assert symbol in str(ex)
+
+standin.loopback.disconnect()
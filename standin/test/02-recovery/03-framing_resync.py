@@ -0,0 +1,59 @@
+# Test framed links: corrupt frames and garbage bytes get skipped, the session
+# continues and counts them in its metrics
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+import ez.repl.standin
+import standin.loopback
+firmware = ez.repl.standin.Firmware(framing=True)
+
+import ez_clang_api
+class QuietHost(ez_clang_api.Host):
+    @staticmethod
+    def verbose():
+        return []
+
+host = QuietHost()
+stream = standin.loopback.connect(firmware, host, ez_clang_api.Device())
+standin.loopback.setup(stream, host, ez_clang_api.Device())
+session = standin.loopback._session
+
+def flaky(device):
+    device.stdout("one\n")
+    device.stdout("two\n")
+    device.outbound[-5] ^= 0x40           # Bit error in the last payload byte
+    device.outbound += b'\x01\x23\x57\xe7' # Line noise with a partial sync marker
+    device.stdout("three\n")
+firmware.functions[0x20000001] = flaky
+
+with ez.util.test.capture_stdout() as output:
+    standin.loopback.call('execute', {'addr': 0x20000001})
+    assert output() == "one\nthree\n", output()
+
+metrics = session.metrics()
+assert metrics['frames.corrupt'] == 1, metrics
+assert metrics['frames.skippedBytes'] > 4, metrics
+
+# Link is in sync
+response = standin.loopback.call('lookup', { '__ez_clang_report_value': 0 })
+assert response['__ez_clang_report_value'] == firmware.symbols['__ez_clang_report_value']
+
+# Frames with corrupt sizes get dropped before we wait for their payload: the
+# header CRC doesn't match or the size exceeds what the transport can carry
+import zlib
+import ez.repl.framing
+def header(size: bytes, crc: int) -> bytes:
+    return ez.repl.framing.SYNC + size + crc.to_bytes(4, 'little')
+def noise(device):
+    device.outbound += header(b'\x00\x08\x00\x00', 0)
+    oversized = (session.transport.maxPayload + 65).to_bytes(4, 'little')
+    device.outbound += header(oversized, zlib.crc32(oversized))
+    device.stdout("four\n")
+firmware.functions[0x20000011] = noise
+with ez.util.test.capture_stdout() as output:
+    standin.loopback.call('execute', {'addr': 0x20000011})
+    assert output() == "four\n", output()
+assert session.metrics()['frames.corrupt'] == 3
+
+standin.loopback.disconnect()
@@ -0,0 +1,90 @@
+# Test that the firmware manager only uploads images that changed or if the
+# device stopped answering the handshake
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+import inject
+import os
+import tempfile
+
+import ez.repl
+import ez.util.firmware
+import standin.loopback
+
+uploads = []
+class UploadRecorder(standin.loopback.StandinRecovery):
+    @inject.params(transport=ez.repl.Transport)
+    def replaceDeviceFirmware(self, image: str, transport: ez.repl.Transport):
+        uploads.append(image)
+        return transport.reset(transport.info)
+
+ez.repl.register({
+    ez.repl.Recovery: lambda: UploadRecorder(),
+})
+
+firmware = standin.loopback.accept('standin')
+firmware.serial_number = 'STANDIN0001'
+inject.instance(ez.repl.Transport).reset(firmware)
+
+# Record the messages the device receives
+received = []
+dispatch = firmware.dispatch
+def record(opcode, tag, msg):
+    received.append(opcode)
+    dispatch(opcode, tag, msg)
+firmware.dispatch = record
+
+with tempfile.TemporaryDirectory() as dir:
+    image = os.path.join(dir, 'firmware.bin')
+    with open(image, 'wb') as f:
+        f.write(b'\x01' * 1024)
+
+    manager = ez.util.firmware.FirmwareManager(os.path.join(dir, 'flashed.json'))
+    with ez.util.test.capture_stdout():
+        assert manager.ensure(image) is firmware
+        assert manager.ensure(image) is firmware
+    assert len(uploads) == 1, "Unchanged image shouldn't be uploaded again"
+    assert manager.skipped == 1
+
+    # The probe hangs up and leaves nothing pending on the link
+    assert received == [ ez.repl.opcode.Disconnect ], received
+    assert len(firmware.outbound) == 0, "Setup and hangup must be consumed"
+
+    # A real session works after the skipped upload
+    import ez_clang_api
+    class QuietHost(ez_clang_api.Host):
+        @staticmethod
+        def verbose():
+            return []
+    host = QuietHost()
+    stream = standin.loopback.connect(firmware, host, ez_clang_api.Device())
+    standin.loopback.setup(stream, host, ez_clang_api.Device())
+    response = standin.loopback.call('lookup', { '__ez_clang_report_value': 0 })
+    assert response['__ez_clang_report_value'] == firmware.symbols['__ez_clang_report_value']
+    assert standin.loopback.disconnect()
+
+    # Records persist across driver runs
+    other = ez.util.firmware.FirmwareManager(manager.file)
+    assert other.isFlashed('STANDIN0001', image)
+    assert not other.isFlashed('STANDIN0002', image)
+
+    # Changed image
+    with open(image, 'wb') as f:
+        f.write(b'\x02' * 1024)
+    with ez.util.test.capture_stdout():
+        manager.ensure(image)
+    assert len(uploads) == 2, "Changed image must be uploaded"
+
+    # Device doesn't handshake anymore
+    firmware.boot = lambda: None
+    with ez.util.test.capture_stdout():
+        manager.ensure(image)
+    assert len(uploads) == 3, "Unresponsive device must be reflashed"
+
+    # Explicit request
+    del firmware.boot
+    with ez.util.test.capture_stdout():
+        manager.ensure(image, force=True)
+    assert len(uploads) == 4
+    assert manager.uploads == 4 and manager.skipped == 1
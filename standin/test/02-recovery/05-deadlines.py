@@ -0,0 +1,83 @@
+# Test that deadlines nest, work with sub-second resolution in any thread and
+# bound blocking reads and writes of the serial transport
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+import os
+import threading
+import time
+from overrides import override
+from serial.tools.list_ports_linux import SysFS
+
+import ez.repl.serial
+import ez.util
+
+# Inner scopes can't extend outer ones, e.g. the driver's test timeout
+driver = ez.util.activeDeadline()
+with ez.util.deadline(0.5, "Outer"):
+    with ez.util.deadline(60, "Inner"):
+        assert ez.util.activeDeadline().caption == "Outer"
+    with ez.util.deadline(0.1, "Inner"):
+        assert ez.util.activeDeadline().caption == "Inner"
+    assert ez.util.activeDeadline().caption == "Outer"
+assert ez.util.activeDeadline() is driver
+
+# The timer interrupts code without I/O and re-arms for the outer scope
+start = time.monotonic()
+try:
+    with ez.util.timeout(5, "Outer"):
+        try:
+            with ez.util.timeout(0.1, "Inner"):
+                time.sleep(1)
+            assert False, "Expected TimeoutError"
+        except TimeoutError as ex:
+            assert "Inner" in str(ex)
+        time.sleep(0.2)
+    with ez.util.timeout(0.2, "Outer"):
+        with ez.util.timeout(5, "Inner"):
+            time.sleep(1)
+    assert False, "Expected TimeoutError"
+except TimeoutError as ex:
+    assert "Outer" in str(ex)
+assert time.monotonic() - start < 1.0, "Expected sub-second timeouts"
+
+class PtyTransport(ez.repl.serial.Transport):
+    @override(check_signature=False)
+    def handshake(self):
+        pass
+
+# Nobody answers on the other side of the pty
+master, slave = os.openpty()
+transport = PtyTransport()
+transport.reset(SysFS(os.ttyname(slave)))
+stream = transport.finalize()
+
+errors = []
+def worker():
+    assert ez.util.activeDeadline() is None, "Deadlines are per thread"
+    start = time.monotonic()
+    try:
+        with ez.util.deadline(0.2, "Read"):
+            stream.read(8)
+    except TimeoutError as ex:
+        errors.append((str(ex), time.monotonic() - start))
+
+with ez.util.deadline(60, "Main thread"):
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join(5)
+assert len(errors) == 1, "Expected read to time out in worker thread"
+message, duration = errors[0]
+assert "Read" in message and 0.15 < duration < 1.0, f"{message} after {duration:.2f}s"
+
+# Reads and writes go through as usual while within the deadline
+with ez.util.deadline(1, "Transfer"):
+    os.write(master, b'\x01\x02\x03')
+    assert stream.read(3) == b'\x01\x02\x03'
+    assert stream.write(b'\x04\x05') == 2
+assert os.read(master, 2) == b'\x04\x05'
+
+stream.close()
+os.close(master)
+os.close(slave)
@@ -0,0 +1,94 @@
+# Test parallel firmware uploads: a failure on one board doesn't affect the
+# others and the results table reports each of them
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+import os
+import tempfile
+from types import SimpleNamespace
+
+import ez.util.flash
+
+# Device script for boards that fail uploads depending on their serial number
+script = """
+import inject
+from overrides import override
+from types import SimpleNamespace
+import ez.repl
+
+class Transport(ez.repl.Transport):
+    @override(check_signature=False)
+    def reset(self, info):
+        self.info = info
+        return info
+    @override
+    def handshake(self):
+        pass
+    @override
+    def finalize(self):
+        return self
+
+class Recovery(ez.repl.Recovery):
+    @override
+    def bundledFirmware(self) -> str:
+        return __file__
+    @override
+    def attemptAutoRecovery(self) -> bool:
+        return False
+    @override
+    def negotiateRecovery(self) -> bool:
+        return False
+    @inject.params(transport=ez.repl.Transport)
+    def replaceDeviceFirmware(self, image: str, transport: ez.repl.Transport):
+        if transport.info.serial_number.startswith('BROKEN'):
+            raise RuntimeError("Upload failed\\nDetails from the loader")
+        return SimpleNamespace(device='/dev/ttyNEW', serial_number=transport.info.serial_number)
+
+ez.repl.register({
+    ez.repl.Transport: lambda: Transport(),
+    ez.repl.Recovery: lambda: Recovery(),
+})
+"""
+
+with tempfile.TemporaryDirectory() as dir:
+    os.mkdir(os.path.join(dir, 'flashstub'))
+    with open(os.path.join(dir, 'flashstub', 'serial.py'), 'w') as f:
+        f.write(script)
+    image = os.path.join(dir, 'firmware.bin')
+    with open(image, 'wb') as f:
+        f.write(b'\x01' * 64)
+
+    def board(serialNumber: str, image: str) -> ez.util.flash.Board:
+        info = SimpleNamespace(device=f'/dev/tty{serialNumber}', serial_number=serialNumber)
+        return ez.util.flash.Board('flashstub', info, image)
+    boards = [ board('A', image), board('BROKEN', image),
+               board('C', os.path.join(dir, 'missing.bin')), board('D', None) ]
+
+    events = []
+    results = ez.util.flash.flash(boards, workers=2, resdir=dir,
+                                  progress=lambda b, text: events.append((str(b), text)))
+
+assert [ r.board.info.serial_number for r in results ] == [ 'A', 'BROKEN', 'C', 'D' ]
+assert [ r.ok() for r in results ] == [ True, False, False, True ], \
+       [ r.error for r in results ]
+assert results[0].port == '/dev/ttyNEW', "Port after upload is reported"
+assert results[1].port == '/dev/ttyBROKEN'
+assert "doesn't exist" in results[2].error
+assert results[3].image.endswith('serial.py'), "Missing image means bundled firmware"
+assert ('flashstub BROKEN', "Failed: Upload failed") in events, events
+assert ('flashstub A', "Done") in events, events
+
+with ez.util.test.capture_stdout() as output:
+    ez.util.flash.reportResults(results)
+    lines = output().strip().splitlines()
+assert lines[0].split() == [ 'Device', 'Serial', 'number', 'Port', 'Time', 'Result' ]
+assert lines[2].split()[:3] == [ 'flashstub', 'BROKEN', '/dev/ttyBROKEN' ]
+assert lines[2].endswith("FAILED: Upload failed"), "Only the first line of errors"
+assert lines[-1] == "Flashed 2 out of 4 boards"
+
+# Command line jobs
+assert ez.util.flash.parseJob('due') == ('due', None)
+assert ez.util.flash.parseJob('teensylc=/tmp/a.hex') == ('teensylc', '/tmp/a.hex')
+args = ez.util.flash.parseCommandLineArgs([ 'due', 'teensylc=/tmp/a.hex', '--workers', '2' ])
+assert args.jobs == [ ('due', None), ('teensylc', '/tmp/a.hex') ] and args.workers == 2
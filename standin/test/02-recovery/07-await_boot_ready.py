@@ -0,0 +1,91 @@
+# Test waiting for a serial device to boot after a firmware upload: garbage
+# from the bootloader doesn't count as ready, port lookup errors don't escape
+# and a handshake that only succeeds late still wins
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+import os
+import threading
+import time
+from overrides import override
+from serial.tools.list_ports_linux import SysFS
+
+import ez.repl.serial
+
+token = b'\x01\x23\x57\xbd'
+
+# The device sends garbage while it boots and its handshake token afterwards,
+# repeatedly, like boards that don't wait for the host
+def device(master: int, bootTime: float, stop: threading.Event):
+    start = time.monotonic()
+    while not stop.wait(0.1):
+        booted = time.monotonic() - start > bootTime
+        os.write(master, token if booted else b'\xff\x00 bootloader \x00\xff')
+
+class PtyTransport(ez.repl.serial.Transport):
+    lookups = 0
+    def __init__(self):
+        super().__init__()
+        self.timeout = 0.3
+    @override(check_signature=False)
+    def handshake(self):
+        self.awaitToken(token)
+    @override(check_signature=False)
+    def awaitPort(self, serialNumber: str, deadline, monitor = None) -> SysFS:
+        PtyTransport.lookups += 1
+        if PtyTransport.lookups == 1:
+            raise OSError("udev went away")
+        return self.info
+
+def noUdev():
+    raise OSError("netlink unavailable") # Falls back to polling
+
+class PtyRecovery(ez.repl.serial.Recovery):
+    hangups = 0
+    @override(check_signature=False)
+    def bundledFirmware(self) -> str:
+        return None
+    @override(check_signature=False)
+    def replaceDeviceFirmware(self, image: str):
+        return None
+    @override(check_signature=False)
+    def hangup(self, transport: ez.repl.serial.Transport, endian: str):
+        PtyRecovery.hangups += 1
+
+def awaitBootReady(bootTime: float, timeout: float):
+    master, slave = os.openpty()
+    stop = threading.Event()
+    thread = threading.Thread(target=device, args=(master, bootTime, stop))
+    thread.start()
+    try:
+        transport = PtyTransport()
+        transport.udevMonitor = noUdev
+        info = SysFS(os.ttyname(slave))
+        transport.reset(info)
+        start = time.monotonic()
+        with ez.util.test.capture_stdout() as output:
+            result = PtyRecovery().awaitBootReady(timeout, transport=transport)
+            duration = time.monotonic() - start
+            return result is info, duration, output()
+    finally:
+        stop.set()
+        thread.join()
+        transport.stream.close()
+        os.close(master)
+        os.close(slave)
+
+# Late handshake after garbage and a failed port lookup
+same, duration, output = awaitBootReady(bootTime=0.5, timeout=5)
+assert same, "Expected the port of the device"
+assert PtyTransport.lookups > 1 and PtyRecovery.hangups == 1
+assert duration > 0.5, f"Garbage before boot shouldn't count as ready: {duration:.2f}s"
+assert "Device ready after" in output, output
+
+# Device never boots: best guess after the timeout
+PtyRecovery.hangups = 0
+same, duration, output = awaitBootReady(bootTime=60, timeout=0.8)
+assert same, "Expected the last known port as best guess"
+assert PtyRecovery.hangups == 0
+assert 0.8 <= duration < 2, duration
+assert "Device not ready after 0.80s" in output, output
@@ -0,0 +1,111 @@
+# Test fan-out commit and execute on several stand-in devices from one host
+# process: each has its own component stack and sequence counter
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+import threading
+
+import ez.repl
+import ez.repl.manager
+import ez.repl.standin
+import standin.loopback
+from ez.repl.standin import Firmware
+
+import ez_clang_api
+class IntHost(ez_clang_api.Host):
+    def getResultDeclTypeAsString(self):
+        return "int"
+    def formatResult(self, mem: bytes):
+        return f"(int) {int.from_bytes(mem, 'little')}"
+
+stack = ez.repl.components()
+firmwares = {
+    'a': Firmware(0x20000000, 0x1000, 'little'),
+    'b': Firmware(0x10000000, 0x1000, 'big'),
+    'c': Firmware(0x20000000, 0x1000, 'little', framing=True),
+}
+
+manager = ez.repl.manager.SessionManager()
+for name, firmware in firmwares.items():
+    manager.add(name, firmware, stack, firmware.endian, firmware.framing,
+                IntHost() if name != 'c' else None)
+sessions = manager.sessions
+assert len(set(id(s.transport) for s in sessions.values())) == 3, "Expected separate transports"
+
+# Same data, device-specific addresses
+data = b'\xc0\xde' * 32
+manager.commit(lambda name, session: {
+    session.setupInfo.codeBufferAddr: { 'data': data, 'size': len(data) }
+})
+for firmware in firmwares.values():
+    assert firmware.memory[:len(data)] == data, "Commit should reach all devices"
+
+# All devices must be inside execute at the same time to pass the barrier
+barrier = threading.Barrier(len(firmwares), timeout=5)
+calls = []
+def entry(firmware: Firmware):
+    barrier.wait()
+    calls.append(firmware.endian)
+for firmware in firmwares.values():
+    firmware.functions[firmware.codeBufferAddr + 1] = entry
+manager.execute(lambda name, session: session.setupInfo.codeBufferAddr + 1)
+assert sorted(calls) == [ 'big', 'little', 'little' ], "Expected one call per device"
+
+# Results are formatted by each session's host, raw without one
+for firmware in firmwares.values():
+    firmware.functions[firmware.codeBufferAddr + 2] = \
+        lambda device: device.result((42).to_bytes(4, 'little'))
+with ez.util.test.capture_stdout() as output:
+    manager.execute(lambda name, session: session.setupInfo.codeBufferAddr + 2)
+    lines = sorted(output().splitlines())
+assert lines == [ "(int) 42", "(int) 42", "(unknown type) 0x0000002a" ], lines
+
+# Timeout on one device: escalation resets its own transport and the other
+# devices don't notice. Earlier tests may have loaded their own copy of the
+# device script, so patch the class that the sessions actually use.
+Transport = type(sessions['a'].transport)
+resets = []
+reset = Transport.reset
+def record(transport, info):
+    resets.append(transport)
+    return reset(transport, info)
+Transport.reset = record
+def runaway(device):
+    raise ez.repl.standin.Hang()
+firmwares['a'].functions[0x20000003] = runaway
+firmwares['a'].interruptible = False
+sessions['a'].interruptTimeout = 0.1
+for name in [ 'b', 'c' ]:
+    firmwares[name].functions[firmwares[name].codeBufferAddr + 3] = lambda device: None
+try:
+    manager.execute(lambda name, session: session.setupInfo.codeBufferAddr + 3, timeout=0.2)
+    assert False, "Expected BroadcastException"
+except ez.repl.manager.BroadcastException as ex:
+    assert list(ex.errors.keys()) == [ 'a' ]
+    assert isinstance(ex.errors['a'], ez.repl.CallTimeoutException)
+    assert ex.errors['a'].recovered, ex.errors['a'].timings
+    assert sorted(ex.results.keys()) == [ 'b', 'c' ]
+Transport.reset = reset
+assert resets == [ sessions['a'].transport ], "Only the transport of a gets reset"
+for firmware in firmwares.values():
+    assert firmware.memory[:len(data)] == data, "Other devices keep their state"
+
+# Failures are isolated per device
+try:
+    manager.commit({ 0x20000800: { 'data': data, 'size': len(data) } })
+    assert False, "Expected BroadcastException"
+except ez.repl.manager.BroadcastException as ex:
+    assert list(ex.errors.keys()) == [ 'b' ], "Only b has no memory at that address"
+    assert sorted(ex.results.keys()) == [ 'a', 'c' ]
+
+# Sequence IDs count per device
+before = { name: session.stream.seqId for name, session in sessions.items() }
+for name in firmwares:
+    manager.call(name, 'lookup', { '__ez_clang_report_value': 0 })
+manager.call('a', 'lookup', { '__ez_clang_report_value': 0 })
+assert sessions['a'].stream.seqId - before['a'] == 2
+assert sessions['b'].stream.seqId - before['b'] == 1
+
+assert manager.disconnectAll()
+assert len(manager.sessions) == 0
@@ -0,0 +1,114 @@
+# Test sharding device tests across a farm of two fake boards: tests are
+# dispatched to both, a test from a board that drops out mid-run goes back to
+# the queue and the driver exits with failure if a test failed
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+import os
+import subprocess
+import sys
+import tempfile
+
+# Device script for fake boards A and B. B drops out while it runs its first
+# test: the worker dies and the board vanishes from the port list.
+script = """
+import os
+import time
+from types import SimpleNamespace
+from overrides import override
+import ez.repl
+
+marker = os.path.join(os.environ['FARMSTUB_DIR'], 'unplugged')
+
+def comports():
+    boards = [ 'A' ] if os.path.exists(marker) else [ 'A', 'B' ]
+    return [ SimpleNamespace(device=f'/dev/tty{b}', serial_number=b) for b in boards ]
+
+def accept(info):
+    return info
+
+def unplugOrWait():
+    import ez.util.test
+    if ez.util.test._testDeviceInfo.serial_number == 'B':
+        open(marker, 'w').close()
+        os._exit(1)
+    # A doesn't finish all tests before B got one
+    deadline = time.monotonic() + 10
+    while not os.path.exists(marker) and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+class Transport(ez.repl.Transport):
+    @override(check_signature=False)
+    def reset(self, info):
+        self.info = info
+        return info
+    @override(check_signature=False)
+    def handshake(self):
+        pass
+    @override(check_signature=False)
+    def finalize(self):
+        return self
+
+class Recovery(ez.repl.Recovery):
+    @override(check_signature=False)
+    def bundledFirmware(self) -> str:
+        return None
+    @override(check_signature=False)
+    def attemptAutoRecovery(self) -> bool:
+        return False
+    @override(check_signature=False)
+    def negotiateRecovery(self) -> bool:
+        return False
+
+ez.repl.register({
+    ez.repl.Transport: lambda: Transport(),
+    ez.repl.Recovery: lambda: Recovery(),
+})
+"""
+
+driver = """
+import ez.util.test
+import ez.util.farm
+import farmstub.serial
+ez.util.farm.comports = farmstub.serial.comports # Workers run this too
+
+if __name__ == '__main__':
+    exit(0 if ez.util.test.runDeviceTests(__file__, farmstub.serial) else 1)
+"""
+
+test = "import farmstub.serial\nfarmstub.serial.unplugOrWait()\n"
+tests = {
+    '01-first.py': test,
+    '02-second.py': test,
+    '03-third.py': test,
+    '04-failing.py': test + "assert False, 'Expected failure'\n",
+}
+
+with tempfile.TemporaryDirectory() as dir:
+    os.makedirs(os.path.join(dir, 'farmstub', 'test', '01-tests'))
+    with open(os.path.join(dir, 'farmstub', 'serial.py'), 'w') as f:
+        f.write(script)
+    with open(os.path.join(dir, 'farmstub', 'test', 'run_all.py'), 'w') as f:
+        f.write(driver)
+    for name, code in tests.items():
+        with open(os.path.join(dir, 'farmstub', 'test', '01-tests', name), 'w') as f:
+            f.write(code)
+
+    env = dict(os.environ, FARMSTUB_DIR=dir, XDG_CACHE_HOME=dir,
+               PYTHONPATH=os.pathsep.join([ dir ] + sys.path))
+    cmd = [ sys.executable, os.path.join(dir, 'farmstub', 'test', 'run_all.py'),
+            '--farm', '--no-firmware', '--force', '--order', 'path' ]
+    result = subprocess.run(cmd, env=env, capture_output=True, text=True, timeout=60)
+    output = result.stdout + result.stderr
+
+assert "Running on 2 boards: A (/dev/ttyA), B (/dev/ttyB)" in output, output
+assert "Board B dropped out" in output, output
+lines = output.splitlines()
+reported = [ line for line in lines if line.startswith('  [tests]') ]
+assert len(reported) == len(tests), "Each test reports once, also the requeued one"
+assert all(line.endswith('[A]') for line in reported if not 'FAIL' in line), reported
+assert "FAIL:" in output and "Expected failure" in output
+assert any(line.split() == [ 'Failed', ':', '1' ] for line in lines), output
+assert any(line.split() == [ 'Passed', ':', '3' ] for line in lines), output
+assert result.returncode == 1, f"Expected failure exit status: {result.returncode}"
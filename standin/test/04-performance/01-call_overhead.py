@@ -0,0 +1,43 @@
+# Benchmark host-side overhead per RPC. The stand-in device answers without
+# latency, so the measured time is spent entirely in the host layer.
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+import standin.loopback
+firmware = standin.loopback.accept('standin')
+
+# Message dumps would dominate the measurement
+import ez_clang_api
+class QuietHost(ez_clang_api.Host):
+    @staticmethod
+    def verbose():
+        return []
+
+host = QuietHost()
+stream = standin.loopback.connect(firmware, host, ez_clang_api.Device())
+standin.loopback.setup(stream, host, ez_clang_api.Device())
+
+# Reference: dispatch through the injector like device scripts did before
+import ez.repl
+import inject
+@inject.params(session=ez.repl.Session)
+def injected_call(endpoint: str, data: dict, session: ez.repl.Session) -> dict:
+    _ = inject.instance(ez.repl.IOSerializer) # Former Session.call()
+    return session.call(endpoint, data)
+
+import time
+def measure(call, iterations: int = 2000) -> float:
+    symbols = { '__ez_clang_report_value': 0 }
+    start = time.perf_counter()
+    for _ in range(iterations):
+        call('lookup', symbols)
+    return (time.perf_counter() - start) / iterations
+
+measure(standin.loopback.call, 100) # Warm up
+direct = measure(standin.loopback.call)
+injected = measure(injected_call)
+print(f"Per-call time: {direct * 1e6:.1f}us direct, " +
+      f"{injected * 1e6:.1f}us with injector lookups")
+
+standin.loopback.disconnect()
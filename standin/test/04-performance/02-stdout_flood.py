@@ -0,0 +1,102 @@
+# Benchmark StdOut forwarding while the device floods the link with output.
+# Each line arrives in multiple messages, like from printf() with unbuffered
+# stdout on the device.
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+import standin.loopback
+firmware = standin.loopback.accept('standin')
+
+import ez_clang_api
+class QuietHost(ez_clang_api.Host):
+    @staticmethod
+    def verbose():
+        return []
+
+host = QuietHost()
+stream = standin.loopback.connect(firmware, host, ez_clang_api.Device())
+standin.loopback.setup(stream, host, ez_clang_api.Device())
+session = standin.loopback._session
+
+lines = 5000
+def flood(device):
+    for i in range(lines):
+        device.stdout("tick ")
+        device.stdout(str(i))
+        device.stdout(" ✓\n" if i % 2 else "\n")
+firmware.functions[0x20000001] = flood
+firmware.stdout = lambda text: firmware.send(ez.repl.opcode.StdOut, text.encode('utf-8'))
+
+# Reference: decode and print each message on its own like Session.call() did
+import ez.io
+class Unbuffered:
+    def feed(self, data: bytes):
+        ez.io.output(data.decode('ascii', errors='replace'))
+    def flush(self):
+        pass
+    def due(self):
+        return None
+
+import time
+def measure() -> float:
+    with ez.util.test.capture_stdout() as output:
+        start = time.perf_counter()
+        standin.loopback.call('execute', {'addr': 0x20000001})
+        duration = time.perf_counter() - start
+        text = output()
+    return 3 * lines / duration, text
+
+buffered, text = measure()
+expected = "".join(f"tick {i}{' ✓' if i % 2 else ''}\n" for i in range(lines))
+assert text == expected, "Coalesced output doesn't match what the device printed"
+
+session.stdout, default = Unbuffered(), session.stdout
+unbuffered, _ = measure()
+session.stdout = default
+
+print(f"StdOut throughput: {buffered:.0f} msgs/s buffered, " +
+      f"{unbuffered:.0f} msgs/s unbuffered")
+
+# Multi-byte characters may be split across messages
+import ez.io.buffer
+out = []
+buffer = ez.io.buffer.OutputBuffer(write=out.append)
+buffer.feed("✓".encode('utf-8')[:2])
+buffer.feed("✓".encode('utf-8')[2:] + b" ok")
+buffer.flush()
+assert out == [ "✓ ok" ], out
+buffer = ez.io.buffer.OutputBuffer('ascii', write=out.append)
+buffer.feed(b"a\xffb\nc")
+assert out[-1] == "a\ufffdb", out
+
+# The remainder of a line ages from when it was kept, not from the first feed
+buffer = ez.io.buffer.OutputBuffer(maxDelay=60, write=out.append)
+buffer.feed(b"first")
+buffer.pendingSince -= 59.9
+buffer.feed(b" line\nsecond")
+assert buffer.due() > 59, "Remainder must not inherit the age of the flushed line"
+
+# Output that stops mid-line goes out while the call is still running
+import ez.repl.standin
+def stuck(device):
+    device.stdout("waiting for input")
+    raise ez.repl.standin.Hang()
+firmware.functions[0x20000101] = stuck
+session.interruptTimeout = 0.1
+session.stdout, default = ez.io.buffer.OutputBuffer(write=out.append), session.stdout
+start = time.monotonic()
+emitted = None
+def record(text: str):
+    global emitted
+    emitted = emitted or time.monotonic() - start
+session.stdout.write = record
+try:
+    standin.loopback.call('execute', {'addr': 0x20000101}, timeout=1.0)
+    assert False, "Expected CallTimeoutException"
+except ez.repl.CallTimeoutException:
+    pass
+session.stdout = default
+assert emitted is not None and emitted < 0.5, f"Partial line emitted after {emitted}s"
+
+standin.loopback.disconnect()
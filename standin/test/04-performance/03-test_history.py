@@ -0,0 +1,55 @@
+# Test that the history of earlier runs orders tests, flags regressions and
+# detects unchanged passes
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+import os
+import tempfile
+from pathlib import Path
+
+with tempfile.TemporaryDirectory() as dir:
+    root = Path(dir) / 'standin' / 'test' / '01-category'
+    fast, slow, broken = (root / f"0{i}-{name}.py" for i, name in
+                          enumerate([ 'fast', 'slow', 'broken' ], start=1))
+
+    history = ez.util.test.History('standin')
+    history.file = os.path.join(dir, 'history.json')
+    for _ in range(3):
+        assert history.record(fast, 0.2) is None
+        assert history.record(slow, 2.0) is None
+    history.record(broken, 0.1, False)
+    assert history.duration(broken) is None, "Failures don't record durations"
+    history.store()
+
+    # Order survives storing and loading
+    tests = [ fast, slow, broken ]
+    history = ez.util.test.History('standin')
+    history.file = os.path.join(dir, 'history.json')
+    history.entries = ez.util.loadJson(history.file, {})
+    assert history.order(tests, 'failures-first') == [ broken, fast, slow ]
+    assert history.order(tests, 'longest-first') == [ slow, fast, broken ]
+    assert history.order(tests, 'path') == tests
+
+    # Regressions compare against the median of earlier passes
+    assert history.record(slow, 2.1) is None, "Within tolerance"
+    assert history.record(fast, 0.5) == 0.2, "Expected regression"
+    assert [ t for t, _, _ in history.regressions ] == [ fast ]
+
+    # Passing again moves the test back in line
+    history.record(broken, 0.1)
+    assert history.order(tests, 'failures-first') == tests
+
+    # Passes with the same inputs can be skipped
+    root.mkdir(parents=True)
+    fast.write_text("import ez.repl.framing\n")
+    slow.write_text("import os\n")
+    fingerprints = ez.util.test.Fingerprints([__file__])
+    history.record(fast, 0.2, True, fingerprints.get(fast))
+    history.record(slow, 2.0, True, fingerprints.get(slow))
+    history.record(broken, 0.1, False)
+    assert history.unchanged(tests, fingerprints) == [ fast, slow ]
+
+    fast.write_text("import ez.repl.framing # Changed\n")
+    fingerprints = ez.util.test.Fingerprints([__file__])
+    assert history.unchanged(tests, fingerprints) == [ slow ]
@@ -0,0 +1,67 @@
+# Test that compiler header search paths come from the on-disk cache after the
+# first query and that lookups for several flag sets run concurrently
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+import os
+import tempfile
+import time
+
+import ez.util.package
+
+# Fake compiler that takes a while and logs each invocation
+compiler = """#!/bin/sh
+echo "$@" >> "$0.log"
+sleep 0.3
+echo '#include "..." search starts here:'
+echo " /quoted"
+echo '#include <...> search starts here:'
+for arg in "$@"; do echo " /include/$arg" | tr -d '=-'; done
+echo 'End of search list.'
+"""
+
+with tempfile.TemporaryDirectory() as dir:
+    bin = os.path.join(dir, 'arm-none-eabi-g++')
+    with open(bin, 'w') as f:
+        f.write(compiler)
+    os.chmod(bin, 0o755)
+    log = bin + '.log'
+    def queries() -> int:
+        if not os.path.exists(log):
+            return 0
+        with open(log) as f:
+            return len(f.readlines())
+
+    cacheFile = os.path.join(dir, 'header-search-paths.json')
+    ez.util.package._headerSearchPathsCache = ez.util.package.CompilerQueryCache(cacheFile)
+    gcc = ez.util.package.findCompiler(bin)
+
+    # Cache misses are queried concurrently
+    flagSets = [ ["-mcpu=cortex-m0"], ["-mcpu=cortex-m3"], ["-march=armv6+fp"] ]
+    start = time.monotonic()
+    paths = gcc.parseHeaderSearchPathsForEach(flagSets)
+    duration = time.monotonic() - start
+    assert queries() == 3
+    assert duration < 0.6, f"Expected concurrent queries, took {duration:.2f}s"
+    assert paths[0][0] == '/quoted' and paths[0][-1] == '/include/mcpucortexm0', paths[0]
+    assert paths[2][-1] == '/include/marcharmv6+fp'
+
+    # Hits don't run the compiler, also in a fresh process (simulated by a new
+    # cache instance) and for single lookups
+    ez.util.package._headerSearchPathsCache = ez.util.package.CompilerQueryCache(cacheFile)
+    assert gcc.parseHeaderSearchPathsForEach(flagSets) == paths
+    assert gcc.parseHeaderSearchPaths(["-mcpu=cortex-m3"]) == paths[1]
+    assert queries() == 3, "Expected cache hits"
+
+    # Mixed hits and misses only query the misses
+    assert gcc.parseHeaderSearchPathsForEach([ ["-mcpu=cortex-m0"], ["-mthumb"] ])[0] == paths[0]
+    assert queries() == 4
+
+    # Changing the compiler binary drops its entries
+    with open(bin, 'a') as f:
+        f.write("# Updated\n")
+    assert gcc.parseHeaderSearchPaths(["-mcpu=cortex-m0"]) == paths[0]
+    assert queries() == 5, "Expected a query after the compiler changed"
+
+    ez.util.package._headerSearchPathsCache = None
@@ -0,0 +1,55 @@
+#!/usr/bin/python3
+
+import os
+import time
+from pathlib import Path
+
+import ez.util.test
+ez.util.test.add_module_roots(__file__)
+
+import standin.loopback
+
+if __name__ == '__main__':
+    start = time.time()
+    args = ez.util.test.parseCommandLineArgs()
+    if args.firmware:
+        print("Cannot load firmware image into stand-in device: standin")
+        exit(1)
+
+    # Discover and select test cases
+    root = Path(os.path.dirname(__file__))
+    print("Running tests from", root.resolve())
+    categories = ez.util.test.categories(root)
+    enabled, disabled = ez.util.test.discover(categories)
+    selected = ez.util.test.select(enabled, args.filter, args.filter_out)
+    print(f"Selecting {len(selected)} out of {len(enabled + disabled)} discovered tests")
+
+    # Order by outcomes and durations of earlier runs
+    history = ez.util.test.History(root.resolve().parent.name)
+    selected = history.order(selected, args.order)
+
+    # Skip tests that passed before with the same inputs
+    fingerprints = ez.util.test.Fingerprints([__file__, standin.loopback.__file__])
+    skipped = [] if args.force else history.unchanged(selected, fingerprints)
+    if len(skipped) > 0:
+        print(f"Skipping {len(skipped)} tests that passed before with the same inputs")
+
+    passed = []
+    failed = []
+    try:
+        for path in selected:
+            if path in skipped:
+                continue
+            ez.repl.register({})
+            if ez.util.test.run(path, args.timeout, history, fingerprints):
+                passed.append(path)
+            else:
+                # No need for recovery; each connect() boots a fresh stand-in
+                failed.append(path)
+    finally:
+        ez.util.test.close_shared_session()
+        history.store()
+        duration = time.time() - start
+        ez.util.test.reportResults(len(enabled), len(disabled), len(selected),
+                                   len(passed), len(failed), duration, history,
+                                   len(skipped))
@@ -8,7 +8,6 @@ if ez_clang_api.Host.debugPython(__debug__):
     debugpy.breakpoint()
 
 import inject
-import subprocess
 
 import ez.repl
 import ez.repl.endpoints
@@ -16,6 +15,7 @@ import ez.repl.serial
 import ez.repl.serialize
 import ez.util
 import ez.util.package
+import ez.util.profile
 
 from serial import SerialException
 from serial.tools.list_ports_linux import SysFS
@@ -26,8 +26,8 @@ class TeensyTransport(ez.repl.serial.Transport):
     def handshake(self):
         assert self.stream, "Connect serial stream first"
         magic = "01 23 57 bd bd 57 23 01"
-        with ez.util.timeout(self.timeout, "Connect attempt"):
-            self.stream.write(bytes.fromhex(magic))
+        with ez.util.deadline(self.timeout, "Connect attempt"):
+            self.write(bytes.fromhex(magic))
         try:
             self.awaitToken(bytes.fromhex(magic))
         except ez.repl.HandshakeFailedException as ex:
@@ -74,6 +74,8 @@ class TeensyRecovery(ez.repl.serial.Recovery):
 
         tool = ez.util.package.findTeensyTool('teensy_loader_cli')
         cmd = [tool, '-mmcu=mkl26z64', '-w', '-s', '-v', image]
+
+        import subprocess
         try:
             ez.io.note("Uploading new firmware")
             subprocess.run(cmd, capture_output=True, check=True)
@@ -81,14 +83,9 @@ class TeensyRecovery(ez.repl.serial.Recovery):
             raise ez.repl.ReplaceFirmwareException(ex.returncode, cmd,
                                                    ex.output.decode())
 
-        # FIXME: Make sure the device finished booting before sending more data.
-        #
-        # This looks like a bug. It appeared first time, when the long-blink
-        # was introduced as the reboot inidicator. This blocks the Arduino
-        # setup() function for a bit.
-        #
-        # If the delay here is shorter than the boot time, the handshake
-        # sequence gets duplicated into the new stream somehow:
+        # The device may still be booting when the port reappears. If we send
+        # data too early, the handshake sequence gets duplicated into the new
+        # stream somehow:
         #
         #   ez.repl.OperationFailedException: Disconnect failed.
         #   Message header invalid. All values must be in 32-bit range.
@@ -98,12 +95,10 @@ class TeensyRecovery(ez.repl.serial.Recovery):
         #     SeqID:   20 00 00 00 00 00 00 00
         #     TagAddr: 01 00 00 00 00 00 00 00
         #
-        # Not sure why or how to prevent this. The delay workaround is annoying,
-        # but it works for now. MetroM0 shows the same symptom, Due doesn't.
-        from time import sleep
-        sleep(3)
-
-        return transport.awaitReconnect()
+        # It appeared first time, when the long-blink was introduced as the
+        # reboot indicator, which blocks the Arduino setup() function for a bit.
+        # Instead of a fixed delay, probe until the device completes a session.
+        return self.awaitBootReady()
 
 ez.repl.register({
     ez.repl.IOSerializer: lambda: ez.repl.serialize.Stream32(),
@@ -118,49 +113,57 @@ def accept(info: SysFS) -> SysFS:
             return info
     return None
 
+_session: ez.repl.Session = None
+_profile = None # Future for the device profile, see setup()
+
 @inject.params(session=ez.repl.Session, stream=ez.repl.IOSerializer)
 def connect(info: SysFS, host: ez_clang_api.Host, teensy: ez_clang_api.Device,
             session: ez.repl.Session, stream: ez.repl.serialize.Stream32
             ) -> ez.repl.IOSerializer:
+    global _session
+    _session = session
     session.host = host # FIXME: formatExpressionResult()
     teensy.name = session.deviceId
     teensy.transport = info.device + " -> Teensy LC" # TODO: Rename property to 'description' or so
     stream.endian = 'little'
     stream.verbose = 'rpc_bytes' in host.verbose()
+
+    # TODO: Include debug/release build and built-in features in setup message
+    teensy.debug = True
+    teensy.features = [ "-lc" ]
+
+    # Resolved configuration only changes with features and toolchain. Extract
+    # default paths from the reference compiler while we handshake.
+    # TODO: PlatformIO GCC@1.50401.190816 error: target CPU does not support ARM mode
+    global _profile
+    _profile = ez.util.profile.loadAsync(session.deviceId, teensy,
+        lambda: [ ez.util.package.findCompiler("toolchain-gccarmnoneeabi") ], configure,
+        verbose=len(host.verbose()) > 0)
+
     stream.open(session.connect(info))
     return stream
 
 @inject.params(session=ez.repl.Session)
 def setup(stream: ez.repl.IOSerializer, host: ez_clang_api.Host,
           teensy: ez_clang_api.Device, session: ez.repl.Session):
-    # Read setup message
-    setup = ez.repl.endpoints.SetupMessageDecoder(stream.receive())
+    # Read setup message and relocate bootstrap endpoints
+    setup = session.setup(stream.receive())
 
     # Start configuring device
     teensy.setCodeBuffer(setup.codeBufferAddr, setup.codeBufferSize)
-    for symbol in setup.endpoints:
-        if not session.relocateEndpoint(symbol, setup.endpoints[symbol]):
-            ez.io.warning(f"No endpoint for bootstrap function {symbol} " +
-                          f"(0x{setup.endpoints[symbol]:08x})")
 
-    if session.endpoints['lookup'].addr == 0:
-        raise ez.repl.DeviceProtocolException("Missing bootstrap symbol " +
-                                              session.endpoints['lookup'].symbol)
+    # Configuration was resolved in the background since connect()
+    ez.util.profile.restore(teensy, _profile.result())
 
-    # TODO: Include debug/release build and built-in features in setup message
-    teensy.debug = True
-    teensy.features = [ "-lc" ]
+    return host.addDevice(teensy)
 
+def configure(teensy: ez_clang_api.Device, gcc: ez.util.package.CompilerPackage):
     # Hardware specific infos can be hardcoded
     teensy.triple = "arm-none-eabi"
     teensy.cpu = "cortex-m0plus"
     teensy.page_size = 256
     teensy.default_alignment = 32
 
-    # Extract default paths from the reference compiler
-    # TODO: PlatformIO GCC@1.50401.190816 error: target CPU does not support ARM mode
-    gcc = ez.util.package.findCompiler("toolchain-gccarmnoneeabi")
-
     # If the firmware has libc builtin, we need matching includes
     if "-lc" in teensy.features:
         teensy.header_search_paths += gcc.parseHeaderSearchPaths(["-mcpu=cortex-m0"])
@@ -180,12 +183,10 @@ def setup(stream: ez.repl.IOSerializer, host: ez_clang_api.Host,
         "-DARDUINO_TEENSYLC", "-DARDUINO=10805", "-DTEENSYDUINO=156", "-DCORE_TEENSY",
         "-DF_CPU=48000000L" ]
 
-    return host.addDevice(teensy)
+def call(endpoint: str, data: dict, timeout: float = None) -> dict:
+    return _session.call(endpoint, data, timeout)
 
-@inject.params(session=ez.repl.Session)
-def call(endpoint: str, data: dict, session: ez.repl.Session) -> dict:
-    return session.call(endpoint, data)
-
-@inject.params(session=ez.repl.Session)
-def disconnect(session: ez.repl.Session):
-    return session.disconnect()
+def disconnect():
+    global _session
+    session, _session = _session, None
+    return session.disconnect() if session else True
@@ -1,16 +1,11 @@
 # Test device response for calls to the lookup endpoint
+# ez-test: shared-session
 
 import ez.util.test
 ez.util.test.add_module_roots(__file__)
 
 import teensylc.serial
-info = ez.util.test.lock_device(teensylc.serial.accept)
-
-import ez_clang_api
-device = ez_clang_api.Device()
-host = ez_clang_api.Host()
-stream = teensylc.serial.connect(info, host, device)
-teensylc.serial.setup(stream, host, device)
+ez.util.test.shared_session(teensylc.serial, lambda: ez.util.test.lock_device(teensylc.serial.accept))
 
 for _ in range(3):
     # Lookup the built-in function for returning expression results
@@ -31,5 +26,3 @@ for _ in range(3):
     assert symbol2 in response, "Missing symbol2 in lookup response"
     assert response[symbol1] != 0, "Success should return a symbol address"
     assert response[symbol2] == 0, "Failure should return a NULL address"
-
-teensylc.serial.disconnect()